@@ -0,0 +1,323 @@
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from PlaceList import departments
+
+# Local postcode dataset: one row per (postcode, commune) with the commune coordinates,
+# e.g. La Poste's "base officielle des codes postaux" (data.gouv.fr), saved as CSV
+POSTCODES_PATH = os.environ.get('DOCTOLIB_POSTCODES',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'postcodes_fr.csv'))
+# Where `--download` fetches the dataset from: Etalab's "Communes de France - Base des codes postaux"
+# on data.gouv.fr, La Poste's postcodes with the coordinates of every commune
+POSTCODES_URL = os.environ.get('DOCTOLIB_POSTCODES_URL',
+                               'https://www.data.gouv.fr/fr/datasets/r/dbe8a621-a9c4-4bc3-9cae-be1699c5ff25')
+
+# Address as joined from the profile cards: "12 rue de la Gare 59200 Tourcoing", the first one when there are several
+ADDRESS = (r'^(?P<Street>.*?)[\s,]*\b(?P<Postcode>\d{5})\s+(?P<City>[^\d,]+?)'
+           r'(?:\s+cedex(?:\s+\d+)?)?(?=\s+\d|\s*,|\s*$)')
+# Abbreviations of the postcode datasets, applied to the names on both sides
+NAME_ABBREVIATIONS = {r'\bSAINTE\b': 'STE', r'\bSAINT\b': 'ST'}
+
+# Columns of the known postcode datasets, by normalized header
+POSTCODE_COLUMNS = {
+    'code_postal': 'postcode', 'postcode': 'postcode',
+    'nom_de_la_commune': 'commune', 'nom_commune': 'commune', 'commune': 'commune',
+    'libelle_d_acheminement': 'delivery_name', 'libelle_acheminement': 'delivery_name', 'ligne_5': 'locality',
+    'code_commune_insee': 'insee', 'insee': 'insee', 'code_commune': 'insee',
+    'geopoint': 'geopoint', 'coordonnees_gps': 'geopoint', 'coordonnees_geographiques': 'geopoint',
+    'latitude': 'latitude', 'longitude': 'longitude',
+}
+
+# Precision of a geocoded address, best first
+COMMUNE = 'commune'
+POSTCODE = 'postcode'
+CITY = 'city'
+
+GEOCODED_COLUMNS = ['Street', 'Postcode', 'City', 'INSEE', 'Commune', 'Department_Code', 'Department', 'Region',
+                    'Latitude', 'Longitude', 'Geocoded']
+
+
+def geocoded_path(file_path):
+    """
+    Table of the geocoded addresses of a workbook, kept next to it.
+    """
+    return os.path.splitext(file_path)[0] + '.geocoded.csv'
+
+
+def place_keys(names):
+    """
+    Comparable form of a Series of place names: upper case ASCII words, La Poste abbreviations.
+    """
+    keys = (names.fillna('').astype(str).str.normalize('NFKD').str.encode('ascii', errors='ignore')
+            .str.decode('ascii').str.upper().str.replace(r'[^A-Z0-9]+', ' ', regex=True).str.strip())
+    for pattern, abbreviation in NAME_ABBREVIATIONS.items():
+        keys = keys.str.replace(pattern, abbreviation, regex=True)
+    return keys
+
+
+def department_codes(codes):
+    """
+    Department of a Series of postcodes or INSEE codes: two digits, three overseas, 2A/2B in Corsica.
+    """
+    codes = codes.fillna('').astype(str)
+    number = pd.to_numeric(codes.str[:3], errors='coerce')
+    return pd.Series(np.select(
+        [codes.str.len() < 5, codes.str[:2].isin(['97', '98']), codes.str[:2].isin(['2A', '2B']),
+         codes.str[:2] == '20'],
+        [None, codes.str[:3], codes.str[:2], np.where(number < 202, '2A', '2B')],
+        codes.str[:2],
+    ), index=codes.index, dtype=object)
+
+
+def parse_addresses(addresses):
+    """
+    Street, Postcode and City of a Series of address texts, all at once; empty where an address has no postcode.
+    """
+    parsed = addresses.fillna('').astype(str).str.strip().str.extract(ADDRESS, flags=re.IGNORECASE)
+    parsed['Street'] = parsed['Street'].str.strip(' ,').replace('', None)
+    return parsed
+
+
+class Gazetteer:
+    """
+    Indexed lookup of a local postcode dataset.
+
+    The dataset is read once into three tables indexed by what an address gives: the
+    commune by (postcode, name), the communes sharing a postcode by postcode (their
+    centroid when there are several, e.g. for the arrondissements of Paris written as
+    "75011 Paris"), and the communes whose name is unique in France by name. The
+    commune name, La Poste's delivery name and its locality line are all accepted.
+
+    Parameters:
+        path (str): CSV of the dataset, comma or semicolon separated, with the postcode,
+            commune name and coordinates columns (a "lat,lon" column or latitude/longitude).
+    """
+
+    def __init__(self, path=POSTCODES_PATH):
+        self.path = path
+        entries = self.read(path)
+        names = [column for column in ('commune', 'delivery_name', 'locality') if column in entries]
+        entries = entries.melt(id_vars=['postcode', 'insee', 'commune_name', 'latitude', 'longitude'],
+                               value_vars=names, value_name='name')
+        entries['key'] = place_keys(entries['name'])
+        entries = entries[entries['key'] != ''].drop_duplicates(['postcode', 'insee', 'key'])
+
+        aggregations = {'insee': 'first', 'commune_name': 'first', 'latitude': 'mean', 'longitude': 'mean'}
+        self.by_commune = entries.groupby(['postcode', 'key']).agg(aggregations)
+        communes = entries.drop_duplicates(['postcode', 'insee'])
+        self.by_postcode = communes.groupby('postcode').agg(aggregations).astype({'insee': object})
+        # A postcode shared by several communes only gives their centroid
+        shared = communes.groupby('postcode')['insee'].nunique() > 1
+        self.by_postcode.loc[shared, ['insee', 'commune_name']] = None
+        by_name = entries.drop_duplicates(['key', 'insee'])
+        self.by_name = by_name[~by_name.duplicated('key', keep=False)].set_index('key')[list(aggregations)]
+
+    @staticmethod
+    def read(path):
+        with open(path, 'rb') as f:
+            header = f.readline().decode('utf-8', errors='replace')
+        try:
+            frame = pd.read_csv(path, sep=';' if ';' in header else ',', dtype=str, encoding='utf-8')
+        except UnicodeDecodeError:
+            frame = pd.read_csv(path, sep=';' if ';' in header else ',', dtype=str, encoding='latin-1')
+        frame.columns = place_keys(pd.Series(frame.columns).str.lstrip('#')).str.lower().str.replace(' ', '_')
+        # The first column of each kind is read, e.g. code_commune_insee rather than code_commune
+        renames = {}
+        for column in frame.columns:
+            kind = POSTCODE_COLUMNS.get(column)
+            if kind is not None and kind not in renames.values() and (kind == column or kind not in frame.columns):
+                renames[column] = kind
+        frame = frame[list(renames)].rename(columns=renames)
+        if 'geopoint' in frame:
+            frame[['latitude', 'longitude']] = frame['geopoint'].str.split(',', n=1, expand=True)
+        missing = {'postcode', 'commune', 'latitude', 'longitude'} - set(frame.columns)
+        if missing:
+            raise ValueError(f"{path} has no {', '.join(sorted(missing))} column(s)")
+        if 'insee' not in frame:
+            frame['insee'] = frame['commune']
+        frame['postcode'] = frame['postcode'].str.strip().str.zfill(5)
+        frame['commune_name'] = frame['commune']
+        for column in ('latitude', 'longitude'):
+            frame[column] = pd.to_numeric(frame[column].str.strip(), errors='coerce')
+        return frame.dropna(subset=['latitude', 'longitude'])
+
+    def resolve(self, postcodes, keys):
+        """
+        INSEE, Commune, Latitude, Longitude and Geocoded precision of aligned Series of postcodes and name keys.
+        """
+        lookups = (
+            (COMMUNE, self.by_commune, pd.MultiIndex.from_arrays([postcodes, keys])),
+            (POSTCODE, self.by_postcode, pd.Index(postcodes)),
+            (CITY, self.by_name, pd.Index(keys)),
+        )
+        resolved = pd.DataFrame(index=postcodes.index, columns=['insee', 'commune_name', 'latitude', 'longitude',
+                                                                'Geocoded'], dtype=object)
+        for precision, table, index in lookups:
+            pending = resolved['Geocoded'].isna().to_numpy()
+            if not pending.any():
+                break
+            found = table.reindex(index[pending])
+            found.index = resolved.index[pending]
+            found = found[found['latitude'].notna()]
+            resolved.loc[found.index, ['insee', 'commune_name', 'latitude', 'longitude']] = found[
+                ['insee', 'commune_name', 'latitude', 'longitude']].to_numpy()
+            resolved.loc[found.index, 'Geocoded'] = precision
+        resolved.columns = ['INSEE', 'Commune', 'Latitude', 'Longitude', 'Geocoded']
+        return resolved
+
+
+def default_gazetteer(path=POSTCODES_PATH):
+    """
+    Gazetteer of the local postcode dataset, or None when there is none: addresses are then parsed only.
+    """
+    if not path or not os.path.exists(path):
+        print(f"Warning: no postcode dataset at {path}, addresses are parsed without coordinates. "
+              f"Run `python AddressGeocoder.py --download` to fetch it, or set DOCTOLIB_POSTCODES "
+              f"to a CSV of postcodes, communes and coordinates.")
+        return None
+    return Gazetteer(path)
+
+
+def download_postcodes(path=POSTCODES_PATH, url=POSTCODES_URL):
+    """
+    Download the postcode dataset to `path`. The file is checked with Gazetteer.read before
+    it replaces the previous one.
+    """
+    import requests
+
+    print(f"Downloading the postcode dataset from {url}...")
+    partial = path + '.part'
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(partial, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+    try:
+        rows = len(Gazetteer.read(partial))
+    except Exception:
+        os.remove(partial)
+        raise
+    os.replace(partial, path)
+    print(f"Saved {rows} postcodes with coordinates to {path}")
+    return path
+
+
+class Geocoder:
+    """
+    Offline geocoding of the addresses read from the profiles.
+
+    Addresses are parsed into street, postcode and city, then resolved against the
+    gazetteer: by postcode and commune name, else by postcode alone, else by city name.
+    The department and region come from the postcode and the bundled place list.
+    Batches are processed as whole columns, each distinct address once; single
+    addresses looked up with `locate` are memoized.
+
+    Parameters:
+        gazetteer (Gazetteer): Postcode dataset. None parses the addresses without coordinates.
+    """
+
+    def __init__(self, gazetteer=None):
+        self.gazetteer = gazetteer
+        self.departments = departments()
+        self._located = {}
+
+    def geocode(self, addresses):
+        """
+        Frame of the GEOCODED_COLUMNS of a Series of address texts, on the same index.
+        """
+        # Addresses repeat across profiles sharing a practice, each distinct text is geocoded once
+        codes, texts = pd.factorize(addresses.fillna('').astype(str))
+        texts = pd.Series(texts, dtype=object)
+        parsed = parse_addresses(texts)
+        parsed['City'] = parsed['City'].str.strip()
+
+        if self.gazetteer is not None:
+            resolved = self.gazetteer.resolve(parsed['Postcode'], place_keys(parsed['City']))
+        else:
+            resolved = pd.DataFrame(index=parsed.index, columns=['INSEE', 'Commune', 'Latitude', 'Longitude',
+                                                                 'Geocoded'], dtype=object)
+        geocoded = pd.concat([parsed, resolved], axis=1)
+        geocoded['Department_Code'] = department_codes(geocoded['INSEE'].fillna(geocoded['Postcode']))
+        names = geocoded['Department_Code'].map(self.departments)
+        geocoded['Department'] = names.str[0]
+        geocoded['Region'] = names.str[1]
+        for column in ('Latitude', 'Longitude'):
+            geocoded[column] = pd.to_numeric(geocoded[column])
+
+        geocoded = geocoded[GEOCODED_COLUMNS].take(codes)
+        geocoded.index = addresses.index
+        return geocoded
+
+    def locate(self, address):
+        """
+        GEOCODED_COLUMNS of one address text, as a dict, memoized.
+        """
+        if address not in self._located:
+            self._located[address] = self.geocode(pd.Series([address])).iloc[0].to_dict()
+        return self._located[address]
+
+
+def geocode_workbook(file_path, output_path=None, geocoder=None):
+    """
+    Geocode the addresses of a workbook, offline, and write them with the Name and Link of
+    every row to `output_path` (`<workbook>.geocoded.csv` by default, or an .xlsx path).
+
+    Addresses are read from the checkpoint of the workbook, which is created from the
+    workbook itself the first time, see CheckpointStore.open_checkpoint.
+
+    Parameters:
+        file_path (str): Workbook to geocode, e.g. psychologue_france.xlsx.
+        output_path (str): File to write.
+        geocoder (Geocoder): Geocoder to use. Defaults to one on the local postcode dataset.
+
+    Returns the geocoded frame.
+    """
+    from CheckpointStore import open_checkpoint
+
+    output_path = output_path or geocoded_path(file_path)
+    geocoder = geocoder or Geocoder(default_gazetteer())
+    started_at = time.perf_counter()
+    with open_checkpoint(file_path) as store:
+        frame = store.listing_frame()
+        addresses = {link: result['address'] for link, result in store.iter_profile_results()
+                     if result.get('address')}
+    frame['Address'] = frame['Link'].map(addresses)
+    frame = pd.concat([frame, geocoder.geocode(frame['Address'])], axis=1)
+
+    if output_path.endswith('.xlsx'):
+        frame.to_excel(output_path, index=False)
+    else:
+        frame.to_csv(output_path, index=False)
+    counts = frame['Geocoded'].value_counts()
+    located = ', '.join(f"{counts[precision]} by {precision}" for precision in (COMMUNE, POSTCODE, CITY)
+                        if precision in counts)
+    print(f"Geocoded {counts.sum()} of {frame['Address'].notna().sum()} addresses"
+          + (f" ({located})" if located else "")
+          + f" in {time.perf_counter() - started_at:.2f}s, saved to {output_path}")
+    return frame
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Geocode the addresses of a Doctolib workbook offline.')
+    parser.add_argument('file_path', nargs='?', help='workbook to geocode, e.g. psychologue_france.xlsx')
+    parser.add_argument('--postcodes', default=POSTCODES_PATH, help='CSV of postcodes, communes and coordinates')
+    parser.add_argument('--output', help='file to write, .csv or .xlsx (default: <workbook>.geocoded.csv)')
+    parser.add_argument('--download', action='store_true',
+                        help='download the postcode dataset to --postcodes first (from DOCTOLIB_POSTCODES_URL)')
+    args = parser.parse_args(argv)
+    if not args.file_path and not args.download:
+        parser.error('a workbook to geocode, or --download, is required')
+
+    if args.download:
+        download_postcodes(args.postcodes)
+    if args.file_path:
+        geocode_workbook(args.file_path, args.output, Geocoder(default_gazetteer(args.postcodes)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import asyncio
+import threading
+
+from CrawlLedger import EMPTY, FAILED
+from Pipeline import MAX_FAILED_PAGES, fetch_listing_page
+from ProfileExtractor import PROFILE_FIELDS
+
+# Listing pages fetched ahead of the page being processed
+PREFETCH_WINDOW = 3
+
+
+class ListingScheduler:
+    """
+    Fetch the listing pages of one query ahead of time, within a bounded window.
+
+    Pages are requested up to `window` at a time and processed in page order. The
+    crawl ends at the last page announced by the pagination when there is one, or
+    after `max_empty_pages` empty pages in a row; speculative fetches past the end
+    are cancelled and left out of the ledger. Pages already recorded in the ledger are
+    not fetched again, and the last page is kept in it so a resumed crawl stops there.
+
+    Parameters:
+        pool (DriverPool): Pool of backends used for the fetches.
+        store (CheckpointStore): Checkpoint receiving the listing rows and ledger updates.
+        docteur (str): Type of doctor, e.g. psychologue.
+        localisation (str): Location, e.g. france.
+        window (int): Maximum number of listing pages in flight.
+        max_empty_pages (int): Empty pages in a row after which the listing is considered finished.
+        base_url (str): Listing URL without the page number. Defaults to the Doctolib search of the query.
+    """
+
+    def __init__(self, pool, store, docteur, localisation, window=PREFETCH_WINDOW, max_empty_pages=2, base_url=None):
+        self.pool = pool
+        self.store = store
+        self.docteur = docteur
+        self.localisation = localisation
+        self.window = max(1, window)
+        self.max_empty_pages = max_empty_pages
+        self.base_url = base_url or f'https://www.doctolib.fr/{docteur}/{localisation}?page='
+        self.last_page = None
+
+    def fetch(self, page, cancelled):
+        # Runs in a worker thread; pages cancelled while waiting for a backend are never requested
+        def scrape(backend, url):
+            if cancelled.is_set():
+                return None
+            print(f"Opening URL: {url}")
+            return backend.scrape_listing_page(url)
+
+        return fetch_listing_page(self.pool, self.base_url + str(page), scrape)
+
+    def past_end(self, page):
+        return self.last_page is not None and page > self.last_page
+
+    async def run(self, records):
+        """
+        Crawl the listing and put every (name, link) found on the `records` queue.
+        """
+        ledger = self.store.ledger
+        next_page = ledger.first_unfinished_page(self.docteur, self.localisation)
+        self.last_page = ledger.last_page(self.docteur, self.localisation)
+        if self.past_end(next_page):
+            print(f"Every page up to the last one ({self.last_page}) is recorded.")
+        elif next_page > 1:
+            print(f"Resuming from page {next_page}")
+        in_flight = {}
+        empty_page_count = 0
+        failed_page_count = 0
+        finished = False
+
+        while True:
+            while not finished and len(in_flight) < self.window and not self.past_end(next_page):
+                if not ledger.page_done(self.docteur, self.localisation, next_page):
+                    ledger.start_page(self.docteur, self.localisation, next_page)
+                    cancelled = threading.Event()
+                    task = asyncio.ensure_future(asyncio.to_thread(self.fetch, next_page, cancelled))
+                    in_flight[next_page] = (task, cancelled)
+                next_page += 1
+
+            if not in_flight:
+                break
+
+            page = min(in_flight)
+            task, _ = in_flight.pop(page)
+            try:
+                result = await task
+            except Exception as e:
+                ledger.finish_page(self.docteur, self.localisation, page, FAILED)
+                print(f"Error scraping page {page}: {e}")
+                failed_page_count += 1
+                if failed_page_count >= MAX_FAILED_PAGES:
+                    print(f"{MAX_FAILED_PAGES} pages failed in a row. Stopping the listing.")
+                    finished = True
+                    self.cancel(in_flight, keep=lambda p: False, status=FAILED)
+                continue
+            if result is None:
+                continue
+            failed_page_count = 0
+
+            links, names, last_page = result
+            if last_page is not None and (self.last_page is None or last_page > self.last_page):
+                self.last_page = last_page
+                ledger.record_last_page(self.docteur, self.localisation, last_page)
+
+            if not links and not names:
+                ledger.finish_page(self.docteur, self.localisation, page, EMPTY)
+                empty_page_count += 1
+                print(f"No data found on page {page}. Empty page count: {empty_page_count}")
+                if empty_page_count >= self.max_empty_pages:
+                    print(f"Found {self.max_empty_pages} empty pages in a row. Stopping the listing.")
+                    finished = True
+            else:
+                empty_page_count = 0
+                print(f"Found {len(links)} links and {len(names)} names on page {page}.")
+                self.store.record_page(self.docteur, self.localisation, page, names, links)
+                for name, link in zip(names, links):
+                    await records.put((name, link))
+
+            if finished or self.past_end(page + 1):
+                self.cancel(in_flight, keep=lambda p: not finished and not self.past_end(p))
+
+        print('Listing completed.')
+
+    def cancel(self, in_flight, keep, status=None):
+        """
+        Cancel the fetches of `in_flight` not kept by `keep(page)`.
+
+        With a `status` (FAILED when the listing stopped on errors) the pages are left for a
+        later run; without, they are past the end of the listing and dropped from the ledger.
+        """
+        ledger = self.store.ledger
+        for page in [p for p in in_flight if not keep(p)]:
+            task, cancelled = in_flight.pop(page)
+            cancelled.set()
+            task.cancel()
+            if status is None:
+                ledger.drop_page(self.docteur, self.localisation, page)
+            else:
+                ledger.finish_page(self.docteur, self.localisation, page, status)
+            print(f"Cancelled speculative fetch of page {page}.")
+
+
+async def enrich_profiles(records, pool, store, workers, fields=PROFILE_FIELDS):
+    """
+    Scrape the `fields` of every profile put on `records` as soon as it is discovered.
+
+    A `None` on the queue tells one worker to stop. Links are enriched once, even if
+    they are put on the queue several times, and every field is read from one page load.
+    """
+    ledger = store.ledger
+    seen = set()
+
+    def fetch(link, link_fields):
+        return pool.run(lambda backend, link: backend.scrape_profile(link, link_fields), link)
+
+    async def worker():
+        while True:
+            record = await records.get()
+            if record is None:
+                return
+            name, link = record
+            link_fields = store.pending_fields(link, fields) if link not in seen else []
+            if not link_fields:
+                continue
+            seen.add(link)
+            for field in link_fields:
+                ledger.start_profile(link, field)
+            try:
+                data = await asyncio.to_thread(fetch, link, link_fields)
+            except Exception as e:
+                store.fail_profile(link, link_fields, e)
+                print(f"Error processing {link}: {e}")
+                continue
+            store.record_profile_fields(link, link_fields, data)
+            if not data:
+                print(f"No data found for {link}.")
+                continue
+            print(f"Scraped data for {link}: {data}")
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+
+async def crawl(pool, store, docteur, localisation, window=PREFETCH_WINDOW, workers=2, max_empty_pages=2, base_url=None,
+                fields=PROFILE_FIELDS):
+    """
+    Run the listing and the enrichment of the profile `fields` at the same time, sharing `pool`.
+
+    Profiles left pending by an earlier run are enriched first, then every link is
+    handed to the enrichment as soon as its listing page has been read.
+    """
+    records = asyncio.Queue(maxsize=workers * 20)
+    enrichment = asyncio.ensure_future(enrich_profiles(records, pool, store, workers, fields))
+
+    for link in store.pending_profiles(fields):
+        await records.put((None, link))
+
+    try:
+        scheduler = ListingScheduler(pool, store, docteur, localisation, window, max_empty_pages, base_url)
+        await scheduler.run(records)
+    finally:
+        for _ in range(workers):
+            await records.put(None)
+        await enrichment
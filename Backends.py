@@ -0,0 +1,274 @@
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import PageParser
+from DriverHealth import process_tree_rss
+from Pacing import READY_TIMEOUT, PacingMetrics
+from PageCache import LISTING_TTL, PROFILE_TTL, default_cache
+from ProfileExtractor import extract_profile
+from RateLimiter import HostRateLimiter
+from SelectorRegistry import DEFAULT_REGISTRY, LISTING, PROFILE
+
+# Engine used when a scraper is not told otherwise: 'selenium' or 'http'
+DEFAULT_ENGINE = os.environ.get('DOCTOLIB_ENGINE', 'selenium')
+
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'fr-FR,fr;q=0.9,en;q=0.8',
+}
+
+
+class Backend:
+    """
+    Pacing shared by every backend: the host rate limit, the wait/work metrics and the page cache.
+
+    Parameters:
+        rate_limiter (HostRateLimiter): Limiter consulted before every request. Defaults to a
+            private limiter using DEFAULT_MIN_INTERVAL.
+        metrics (PacingMetrics): Where time spent in each stage and the counters of the run are accounted.
+        cache (PageCache): Pages fetched by earlier runs, consulted before every request. None disables it.
+        registry (SelectorRegistry): Known page layouts. Defaults to the process-wide registry.
+    """
+
+    def __init__(self, rate_limiter=None, metrics=None, cache=None, registry=None):
+        self.rate_limiter = rate_limiter or HostRateLimiter()
+        self.metrics = metrics or PacingMetrics()
+        self.cache = cache
+        self.registry = registry or DEFAULT_REGISTRY
+
+    def throttle(self, url):
+        self.metrics.add('throttle', self.rate_limiter.wait(url), url)
+
+    def cached(self, url, ttl):
+        # Pages served from the cache cost neither a request nor a rate limit token
+        if self.cache is None:
+            return None
+        return self.cache.get(url, ttl)
+
+    def remember(self, url, html):
+        if self.cache is not None:
+            self.cache.put(url, html)
+
+
+class SeleniumBackend(Backend):
+    """
+    Extraction backend driving a full Chrome instance.
+
+    Each page is read with a single `page_source` call and parsed locally, instead of
+    one WebDriver round-trip per element. Instead of sleeping a fixed time after each
+    navigation, the backend waits until the elements it reads are present.
+
+    Parameters:
+        driver (WebDriver): The browser used for every request.
+        ready_timeout (float): Seconds a page may take to render its content before it is considered empty.
+    """
+
+    name = 'selenium'
+
+    def __init__(self, driver, ready_timeout=READY_TIMEOUT, **pacing):
+        super().__init__(**pacing)
+        self.driver = driver
+        self.ready_timeout = ready_timeout
+        self._count_commands()
+
+    def _count_commands(self):
+        # Every WebDriver command, including the ones issued through WebElement objects, goes through driver.execute
+        execute = self.driver.execute
+
+        def counting_execute(*args, **kwargs):
+            self.metrics.count('webdriver_calls')
+            return execute(*args, **kwargs)
+
+        self.driver.execute = counting_execute
+
+    def open(self, url, kind):
+        """
+        Navigate to `url` and wait until it matches one of the known layouts of `kind` pages.
+
+        Raises PageTimeout if the page did not finish loading, MissingSelector (or
+        LayoutChanged) if it loaded without any of the known layouts.
+        """
+        self.throttle(url)
+        with self.metrics.measure('navigation', url):
+            self.driver.get(url)
+        with self.metrics.measure('wait', url):
+            layout, loaded = self.registry.wait_for_layout(self.driver, kind, self.ready_timeout, url=url)
+        self.metrics.page_done()
+        if layout is None:
+            raise self.registry.missing(url, kind, None if loaded else self.ready_timeout)
+
+    def load(self, url, kind, ttl):
+        """
+        Rendered page of `url` from the cache or the browser, see `open`.
+        """
+        html = self.cached(url, ttl)
+        if html is None:
+            self.open(url, kind)
+            with self.metrics.measure('extraction', url):
+                html = self.driver.page_source
+            self.metrics.count('bytes_read', len(html.encode()))
+            self.remember(url, html)
+        return html
+
+    def scrape_listing(self, url):
+        return self.scrape_listing_page(url)[:2]
+
+    def scrape_listing_page(self, url):
+        """
+        Returns (links, names, last_page), `last_page` being None when the pagination does not show it.
+        """
+        print("Scraping page...")
+        html = self.load(url, LISTING, LISTING_TTL)
+
+        # Read the rendered page once and run every selector locally
+        with self.metrics.measure('extraction', url):
+            links, names, _, last_page = PageParser.parse_listing_page(html, url, self.registry)
+        self.registry.note_last_page(url, last_page)
+        return links, names, last_page
+
+    def scrape_profile(self, url, fields=None, max_age=PROFILE_TTL):
+        """
+        Load a profile page once and run the extractors of `fields` on it. Returns {field: values}.
+
+        A cached page older than `max_age` seconds is fetched again.
+        """
+        html = self.load(url, PROFILE, max_age)
+
+        with self.metrics.measure('extraction', url):
+            data, _ = extract_profile(html, fields, self.registry)
+        return data
+
+    def rss(self):
+        # Memory of chromedriver and of the browser processes it started
+        return process_tree_rss(self.driver.service.process.pid)
+
+    def quit(self):
+        self.driver.quit()
+
+
+class HttpBackend(Backend):
+    """
+    Extraction backend fetching pages over a pooled HTTP session and parsing them with lxml.
+
+    Pages without any of the expected containers (typically pages rendered by JavaScript)
+    are handed to the fallback backend, created on first use.
+
+    Parameters:
+        fallback_factory (callable): Optional function returning the backend used for such pages.
+        pool_size (int): Number of keep-alive connections kept per host.
+        timeout (float): Seconds before an HTTP request is abandoned.
+    """
+
+    name = 'http'
+
+    def __init__(self, fallback_factory=None, pool_size=10, timeout=15, **pacing):
+        super().__init__(**pacing)
+        self.session = requests.Session()
+        self.session.headers.update(HTTP_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.timeout = timeout
+        self.fallback_factory = fallback_factory
+        self._fallback = None
+
+    def fetch(self, url):
+        self.throttle(url)
+        with self.metrics.measure('navigation', url):
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            if 'charset' not in response.headers.get('Content-Type', ''):
+                response.encoding = 'utf-8'
+            html = response.text
+        self.metrics.count('bytes_read', len(response.content))
+        self.metrics.page_done()
+        return html
+
+    def has_content(self, html):
+        # Only parsed again for pages matching no layout, which are rare
+        return self.registry.has_content(PageParser.parse_html(html))
+
+    def fallback(self):
+        if self.fallback_factory is None:
+            return None
+        if self._fallback is None:
+            print("Falling back to the browser for JavaScript-rendered pages.")
+            self._fallback = self.fallback_factory()
+        return self._fallback
+
+    def scrape_listing(self, url):
+        return self.scrape_listing_page(url)[:2]
+
+    def scrape_listing_page(self, url):
+        print("Scraping page...")
+        html = self.cached(url, LISTING_TTL)
+        fresh = html is None
+        if fresh:
+            html = self.fetch(url)
+        with self.metrics.measure('extraction', url):
+            links, names, found, last_page = PageParser.parse_listing_page(html, url, self.registry)
+        if not found:
+            if self.fallback() is None:
+                self.registry.record(LISTING, None, url, self.has_content(html), last_page)
+                raise self.registry.missing(url, LISTING)
+            return self.fallback().scrape_listing_page(url)
+        self.registry.note_last_page(url, last_page)
+        # Pages that need the browser are recorded and cached by the fallback, once rendered
+        if fresh:
+            self.registry.record(LISTING, found)
+            self.remember(url, html)
+        return links, names, last_page
+
+    def scrape_profile(self, url, fields=None, max_age=PROFILE_TTL):
+        html = self.cached(url, max_age)
+        fresh = html is None
+        if fresh:
+            html = self.fetch(url)
+        with self.metrics.measure('extraction', url):
+            data, found = extract_profile(html, fields, self.registry)
+        if not found:
+            if self.fallback() is None:
+                self.registry.record(PROFILE, None, url, self.has_content(html))
+                raise self.registry.missing(url, PROFILE)
+            return self.fallback().scrape_profile(url, fields, max_age)
+        if fresh:
+            self.registry.record(PROFILE, found)
+            self.remember(url, html)
+        return data
+
+    def rss(self):
+        return self._fallback.rss() if self._fallback is not None else 0
+
+    def quit(self):
+        self.session.close()
+        if self._fallback is not None:
+            self._fallback.quit()
+
+
+def make_backend(engine=None, driver_factory=None, rate_limiter=None, metrics=None, cache=None):
+    """
+    Build the extraction backend selected for this run.
+
+    Parameters:
+        engine (str): 'selenium' or 'http'. Defaults to the DOCTOLIB_ENGINE environment variable.
+        driver_factory (callable): Function returning a new WebDriver. Required for 'selenium',
+            used as the JavaScript fallback for 'http'.
+        rate_limiter (HostRateLimiter): Limiter shared with the other backends of the run.
+        metrics (PacingMetrics): Stage timings and counters shared with the other backends of the run.
+        cache (PageCache): Page cache shared with the other backends. Defaults to the process-wide
+            cache configured by DOCTOLIB_CACHE.
+    """
+    engine = engine or DEFAULT_ENGINE
+    pacing = {'rate_limiter': rate_limiter or HostRateLimiter(), 'metrics': metrics or PacingMetrics(),
+              'cache': cache if cache is not None else default_cache()}
+    if engine == 'selenium':
+        return SeleniumBackend(driver_factory(), **pacing)
+    if engine == 'http':
+        fallback_factory = None
+        if driver_factory is not None:
+            fallback_factory = lambda: SeleniumBackend(driver_factory(), **pacing)
+        return HttpBackend(fallback_factory=fallback_factory, **pacing)
+    raise ValueError(f"Unknown engine: {engine}")
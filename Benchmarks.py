@@ -0,0 +1,591 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+
+from FixtureServer import listing_html, profile_html
+
+
+@contextmanager
+def count_commands(driver):
+    """
+    Count the WebDriver protocol commands sent by `driver` inside the `with` block.
+
+    Every command, including the ones issued through WebElement objects, goes through
+    `driver.execute`, so wrapping it counts the real IPC round-trips.
+    """
+    counter = {'calls': 0}
+    execute = driver.execute
+
+    def counting_execute(*args, **kwargs):
+        counter['calls'] += 1
+        return execute(*args, **kwargs)
+
+    driver.execute = counting_execute
+    try:
+        yield counter
+    finally:
+        driver.execute = execute
+
+
+# Per-element extraction as it was done before the single-pass parser, kept for comparison
+def legacy_scrape_listing(driver):
+    from selenium.webdriver.common.by import By
+    import PageParser
+
+    links = []
+    names = []
+    for element in driver.find_elements(By.CLASS_NAME, 'dl-flex-row.dl-justify-between.dl-align-items-start'):
+        link_element = element.find_element(By.CSS_SELECTOR, PageParser.LISTING_LINK)
+        name_element = element.find_element(By.CSS_SELECTOR, PageParser.LISTING_NAME)
+        links.append(link_element.get_attribute('href'))
+        names.append(name_element.text)
+    return links, names
+
+
+def legacy_scrape_fees(driver):
+    from selenium.webdriver.common.by import By
+
+    types = []
+    fees = []
+    for card in driver.find_elements(By.CLASS_NAME, 'dl-profile-card-content'):
+        for ul in card.find_elements(By.TAG_NAME, 'ul'):
+            for li in ul.find_elements(By.CLASS_NAME, 'list-none'):
+                fee_names = li.find_elements(By.CLASS_NAME, 'dl-profile-fee-name')
+                fee_tags = li.find_elements(By.CLASS_NAME, 'dl-profile-fee-tag')
+                for name, tag in zip(fee_names, fee_tags):
+                    types.append(name.text)
+                    fees.append(tag.text)
+    return types, fees
+
+
+def bench_round_trips(driver_factory=None, cards=20, fees=3):
+    """
+    Compare WebDriver round-trips per page between per-element lookups and single-pass extraction.
+    """
+    import PageParser
+
+    if driver_factory is None:
+        from StandaloneDoctolibScraper import init_driver as driver_factory
+
+    work_dir = Path(tempfile.mkdtemp(prefix='doctolib-bench-'))
+    listing_path = work_dir / 'listing.html'
+    listing_path.write_text(listing_html(cards), encoding='utf-8')
+    profile_path = work_dir / 'profile.html'
+    profile_path.write_text(profile_html(fees=fees), encoding='utf-8')
+
+    driver = driver_factory()
+    try:
+        results = []
+        for page, legacy, parse in (
+            (listing_path, legacy_scrape_listing, lambda html, url: PageParser.parse_listing(html, base_url=url)[:2]),
+            (profile_path, legacy_scrape_fees, lambda html, url: PageParser.parse_fees(html)[:2]),
+        ):
+            url = page.as_uri()
+            driver.get(url)
+
+            start = time.perf_counter()
+            with count_commands(driver) as before:
+                legacy_result = legacy(driver)
+            legacy_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with count_commands(driver) as after:
+                single_pass_result = parse(driver.page_source, url)
+            single_pass_time = time.perf_counter() - start
+
+            results.append((page.name, before['calls'], legacy_time, after['calls'], single_pass_time,
+                            legacy_result == single_pass_result))
+    finally:
+        driver.quit()
+
+    print(f"{'page':<14}{'calls before':>14}{'time before':>14}{'calls after':>14}{'time after':>14}  same result")
+    for name, calls_before, time_before, calls_after, time_after, same in results:
+        print(f"{name:<14}{calls_before:>14}{time_before:>13.3f}s{calls_after:>14}{time_after:>13.3f}s  {same}")
+    return results
+
+
+def bench_checkpoint(rows=5000, per_page=20, profile_rows=500):
+    """
+    Wall time of the persistence layer: rewriting the workbook after every page/profile versus
+    appending to the checkpoint and exporting once.
+    """
+    import pandas as pd
+    from CheckpointStore import CheckpointStore
+
+    work_dir = Path(tempfile.mkdtemp(prefix='doctolib-bench-'))
+    pages = [
+        ([f"Dr Praticien {p}-{i}" for i in range(per_page)],
+         [f"https://www.doctolib.fr/psychologue/france/praticien-{p}-{i}" for i in range(per_page)])
+        for p in range(rows // per_page)
+    ]
+
+    # Listing stage, as main() used to do it: concat and full rewrite after each page
+    rewrite_path = work_dir / 'rewrite.xlsx'
+    start = time.perf_counter()
+    df = pd.DataFrame(columns=['Name', 'Link'])
+    for names, links in pages:
+        df = pd.concat([df, pd.DataFrame({'Name': names, 'Link': links})], ignore_index=True)
+        df.to_excel(rewrite_path, index=False)
+    listing_rewrite = time.perf_counter() - start
+
+    # Listing stage with the checkpoint
+    checkpoint_path = work_dir / 'checkpoint.xlsx'
+    start = time.perf_counter()
+    with CheckpointStore(str(work_dir / 'checkpoint.db')) as store:
+        for page, (names, links) in enumerate(pages, start=1):
+            store.append_listing(page, names, links)
+        store.export_excel(checkpoint_path)
+    listing_checkpoint = time.perf_counter() - start
+
+    # Profile stage, as the profile scrapers used to do it: full rewrite after each row
+    sample = df.head(profile_rows).copy()
+    start = time.perf_counter()
+    for index in sample.index:
+        for i in range(1, 3):
+            column_type, column_fee = f"Consultation_Type_{i}", f"Consultation_Fee_{i}"
+            if column_type not in sample.columns:
+                sample[column_type] = [''] * len(sample)
+                sample[column_fee] = [''] * len(sample)
+            sample.at[index, column_type] = f"Consultation {i}"
+            sample.at[index, column_fee] = f"{40 + 10 * i} €"
+        sample.to_excel(rewrite_path, index=False)
+    profile_rewrite = time.perf_counter() - start
+
+    # Profile stage with the checkpoint
+    start = time.perf_counter()
+    with CheckpointStore(str(work_dir / 'profiles.db')) as store:
+        store.append_listing(1, sample['Name'].tolist(), sample['Link'].tolist())
+        for link in sample['Link']:
+            store.append_profile(link, {'types': ['Consultation 1', 'Consultation 2'], 'fees': ['50 €', '60 €']})
+        store.export_excel(checkpoint_path)
+    profile_checkpoint = time.perf_counter() - start
+
+    print(f"{'stage':<26}{'rewrite':>12}{'checkpoint':>12}{'speedup':>10}")
+    for stage, rewrite, checkpoint in (
+        (f"listing ({rows} rows)", listing_rewrite, listing_checkpoint),
+        (f"profiles ({profile_rows} rows)", profile_rewrite, profile_checkpoint),
+    ):
+        print(f"{stage:<26}{rewrite:>11.2f}s{checkpoint:>11.2f}s{rewrite / checkpoint:>9.1f}x")
+    return listing_rewrite, listing_checkpoint, profile_rewrite, profile_checkpoint
+
+
+def replay_checkpoint(db_path, file_path, streamed):
+    """
+    Replay the finished checkpoint `db_path` through the pipeline and write its workbook,
+    in a fresh process. Returns the wall time and the peak resident memory of the process.
+    """
+    import pandas as pd
+    from CheckpointStore import CheckpointStore, apply_profile_results
+    from DriverPool import DriverPool
+    from Pipeline import profile_stage
+
+    start = time.perf_counter()
+    with CheckpointStore(db_path) as store, open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        if streamed:
+            # Every profile is done, no backend is ever started
+            with DriverPool(1, lambda: None) as pool:
+                for _ in profile_stage(store.iter_listing(), pool, store):
+                    pass
+            store.export_excel(file_path)
+        else:
+            records = store.listing_frame().to_dict('records')
+            df = apply_profile_results(pd.DataFrame(records), store.profile_results())
+            with pd.ExcelWriter(file_path) as writer:
+                df.to_excel(writer, index=False)
+                store.fee_table().to_excel(writer, sheet_name='Fees', index=False)
+    wall = time.perf_counter() - start
+    # High-water mark of this process only: unlike ru_maxrss, it does not inherit the parent's peak (Linux only)
+    with open('/proc/self/status') as status:
+        peak = next(int(line.split()[1]) * 1024 for line in status if line.startswith('VmHWM:'))
+    return wall, peak
+
+
+def bench_memory(rows=100000, fees=3):
+    """
+    Peak memory of replaying a finished checkpoint of `rows` profiles through the pipeline
+    and writing its workbook: whole tables in memory, as before the record stream, versus
+    streamed in chunks. Each mode runs in its own process, at a tenth of `rows` and at
+    `rows`, to show which one grows with the result count.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from CheckpointStore import CheckpointStore
+    from CrawlLedger import DONE
+
+    work_dir = Path(tempfile.mkdtemp(prefix='doctolib-bench-'))
+    results = []
+    for count in (rows // 10, rows):
+        db_path = str(work_dir / f'memory-{count}.db')
+        links = [f"https://www.doctolib.fr/psychologue/france/praticien-{p}" for p in range(count)]
+        with CheckpointStore(db_path) as store, store.conn:
+            store._insert_listing(1, [f"Dr Praticien {p}" for p in range(count)], links)
+            store._insert_profiles(
+                [(link, {'types': [f"Consultation {i}" for i in range(fees)],
+                         'fees': [f"{40 + 10 * i} €" for i in range(fees)]}) for link in links]
+                + [(link, {'address': f"{p} rue de la Gare 59200 Tourcoing"}) for p, link in enumerate(links)]
+            )
+            for field in ('fees', 'address'):
+                store.conn.executemany(
+                    'INSERT INTO ledger_profiles (link, stage, status, updated_at) VALUES (?, ?, ?, 0)',
+                    [(link, field, DONE) for link in links])
+
+        for name, streamed in (('in memory', False), ('streamed', True)):
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                wall, peak = executor.submit(
+                    replay_checkpoint, db_path, str(work_dir / f'memory-{count}.xlsx'), streamed).result()
+            results.append((name, count, wall, peak))
+
+    print(f"{'mode':<12}{'rows':>9}{'wall':>10}{'peak RSS':>11}")
+    for name, count, wall, peak in results:
+        print(f"{name:<12}{count:>9}{wall:>9.2f}s{peak / 1024 / 1024:>8.0f}MiB")
+    return results
+
+
+def bench_fees(profiles=100000, fees=3, seed=0):
+    """
+    Wall time of fee normalization for `profiles` profiles: parsing the fee texts one by one
+    versus the vectorized long table, and building the wide export view from it.
+
+    Amounts and labels are drawn per profile, giving tens of thousands of distinct fee
+    texts as on the site, so parsing each distinct text once does not flatter the
+    vectorized path.
+    """
+    import random
+    import re
+
+    import pandas as pd
+    from FeeTable import AMOUNT_RANGE, THOUSANDS_SEPARATOR, fee_frame, parse_amounts, wide_fee_view
+
+    rng = random.Random(seed)
+    labels = ('Consultation', 'Première consultation', 'Consultation de suivi', 'Séance de couple',
+              'Bilan psychologique', 'Téléconsultation', 'Séance enfant')
+
+    def label():
+        # Labels are written by each practitioner: a kind, a duration, sometimes a rate
+        text = f"{rng.choice(labels)} ({rng.randint(20, 120)} min)"
+        if rng.random() < 0.3:
+            text += f" - tarif {rng.choice(('étudiant', 'réduit', 'famille', 'soirée'))}"
+        return text
+
+    def amount():
+        euros = rng.randint(25, 250) if rng.random() < 0.99 else rng.randint(1000, 2500)
+        text = f"{euros:,}".replace(',', ' ')
+        return text + (f",{rng.randint(0, 99):02d}" if rng.random() < 0.3 else '')
+
+    def fee_text():
+        kind = rng.random()
+        if kind < 0.75:
+            return f"{amount()} €"
+        if kind < 0.9:
+            return f"De {amount()} € à {amount()} €"
+        if kind < 0.95:
+            return f"Entre {amount()} et {amount()} €"
+        return 'Non renseigné'
+
+    results = {
+        f"https://www.doctolib.fr/psychologue/france/praticien-{p}": {
+            'types': [label() for _ in range(fees)],
+            'fees': [fee_text() for _ in range(fees)],
+        }
+        for p in range(profiles)
+    }
+
+    start = time.perf_counter()
+    frame = fee_frame(results)
+    long_time = time.perf_counter() - start
+
+    # One regex per fee text, as a per-row loop would do it
+    start = time.perf_counter()
+    looped = []
+    for fee in frame['Fee']:
+        match = re.search(AMOUNT_RANGE, re.sub(THOUSANDS_SEPARATOR, '', fee), re.IGNORECASE)
+        cents = [round(float(amount.replace(',', '.')) * 100)
+                 for amount in (match.group('low', 'high') if match else ()) if amount]
+        looped.append((min(cents, default=None), max(cents, default=None)))
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parsed = parse_amounts(frame['Fee'])
+    vectorized_time = time.perf_counter() - start
+    vectorized = [(None if low is pd.NA else low, None if high is pd.NA else high)
+                  for low, high in zip(parsed['Min_Cents'], parsed['Max_Cents'])]
+    assert looped == vectorized, 'the per-row loop and the vectorized parse disagree'
+
+    start = time.perf_counter()
+    wide_fee_view(frame)
+    wide_time = time.perf_counter() - start
+
+    print(f"{len(frame)} fees from {profiles} profiles, {frame['Fee'].nunique()} distinct fee texts, "
+          f"{frame['Consultation_Type'].nunique()} distinct labels")
+    print(f"{'long table':<26}{long_time:>11.2f}s")
+    print(f"{'parse, per-row loop':<26}{loop_time:>11.2f}s")
+    print(f"{'parse, vectorized':<26}{vectorized_time:>11.2f}s")
+    print(f"{'wide export view':<26}{wide_time:>11.2f}s")
+    return long_time, loop_time, vectorized_time, wide_time
+
+
+def bench_geocode(rows=100000, communes=35000):
+    """
+    Wall time of geocoding `rows` addresses offline against a synthetic postcode dataset of
+    `communes` communes: loading and indexing the dataset, one memoized lookup per row, and
+    the vectorized batch.
+    """
+    import pandas as pd
+    from AddressGeocoder import Gazetteer, Geocoder
+
+    def name(c):
+        # Commune names are words, e.g. COMMUNE BAC
+        letters = ''
+        while True:
+            c, letter = divmod(c, 26)
+            letters += chr(65 + letter)
+            if not c:
+                return f"COMMUNE {letters}"
+
+    work_dir = Path(tempfile.mkdtemp(prefix='doctolib-bench-'))
+    dataset = work_dir / 'postcodes.csv'
+    with open(dataset, 'w', encoding='utf-8') as f:
+        f.write('#Code_commune_INSEE;Nom_de_la_commune;Code_postal;Libellé_d_acheminement;Ligne_5;_geopoint\n')
+        for c in range(communes):
+            department = 1 + c % 95
+            f.write(f"{department:02d}{c % 1000:03d};{name(c)};{department:02d}{c % 900:03d};{name(c)};;"
+                    f"{42 + c % 9 + c / communes:.4f},{-4 + c % 12 + c / communes:.4f}\n")
+    # A practice is shared by several practitioners; one address in ten misspells its commune
+    practices = [(p * 7919) % (rows // 3) for p in range(rows)]
+    addresses = pd.Series([
+        f"{practice % 97} rue de la Gare {1 + c % 95:02d}{c % 900:03d} {name(c).title()}{'' if practice % 10 else 'x'}"
+        for practice, c in ((practice, practice % communes) for practice in practices)
+    ])
+
+    start = time.perf_counter()
+    geocoder = Geocoder(Gazetteer(str(dataset)))
+    load_time = time.perf_counter() - start
+
+    sample = addresses.head(rows // 1000)
+    start = time.perf_counter()
+    for address in sample:
+        geocoder.locate(address)
+    loop_time = (time.perf_counter() - start) * len(addresses) / len(sample)
+
+    start = time.perf_counter()
+    geocoded = geocoder.geocode(addresses)
+    batch_time = time.perf_counter() - start
+
+    print(f"{rows} addresses, {addresses.nunique()} distinct, against {communes} communes")
+    print(f"{'load and index':<26}{load_time:>11.2f}s")
+    print(f"{'per-row, uncached (est.)':<26}{loop_time:>11.2f}s")
+    print(f"{'vectorized batch':<26}{batch_time:>11.2f}s")
+    print(f"{'geocoded':<26}{geocoded['Geocoded'].value_counts().to_dict()}")
+    return load_time, loop_time, batch_time
+
+
+def bench_startup(runs=20):
+    """
+    Wall time of starting the command line for `--help` and for dry runs, median of `runs`
+    runs, next to a bare interpreter, and the heavy modules each of them imports.
+    """
+    import statistics
+    import subprocess
+
+    script = str(Path(__file__).resolve().parent / 'doctolib-scraper')
+    heavy = ('pandas', 'openpyxl', 'selenium', 'requests', 'lxml')
+    check = ("import runpy, sys; sys.argv = sys.argv[1:]\n"
+             "try:\n    runpy.run_path(sys.argv[0], run_name='__main__')\nexcept SystemExit:\n    pass\n"
+             f"print(','.join(m for m in {heavy!r} if m in sys.modules), file=sys.stderr)")
+    commands = {
+        'python -c pass': [],
+        '--help': [script, '--help'],
+        'list --dry-run': [script, 'list', 'psychologue', 'france', '--split', 'city', '--dry-run'],
+        'export --dry-run': [script, 'export', 'psychologue_france.xlsx', '--dry-run'],
+    }
+    results = []
+    for name, arguments in commands.items():
+        command = [sys.executable, *arguments] if arguments else [sys.executable, '-c', 'pass']
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - start)
+        imported = subprocess.run([sys.executable, '-c', check, *arguments], stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.PIPE, text=True).stderr.strip() if arguments else ''
+        results.append((name, statistics.median(times), imported))
+
+    print(f"{'command':<20}{'median':>10}  heavy imports")
+    for name, wall, imported in results:
+        print(f"{name:<20}{wall * 1000:>8.0f}ms  {imported or '-'}")
+    return results
+
+
+def bench_driver(pages=5, images=20, image_size=256 * 1024):
+    """
+    Startup time, page load time and memory of a browser in each driver mode, on a local
+    profile page carrying `images` images of `image_size` bytes. Requires Chrome.
+    """
+    from functools import partial
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+    from DriverFactory import DRIVER_MODES, make_driver
+    from DriverHealth import process_tree_rss
+
+    work_dir = Path(tempfile.mkdtemp(prefix='doctolib-bench-'))
+    for i in range(images):
+        (work_dir / f'photo-{i}.png').write_bytes(os.urandom(image_size))
+    gallery = ''.join(f'<img src="photo-{i}.png">' for i in range(images))
+    (work_dir / 'profile.html').write_text(profile_html().replace('</body>', gallery + '</body>'), encoding='utf-8')
+
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=str(work_dir)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/profile.html'
+
+    results = []
+    try:
+        for mode in DRIVER_MODES:
+            start = time.perf_counter()
+            driver = make_driver(mode)
+            startup = time.perf_counter() - start
+            try:
+                start = time.perf_counter()
+                for page in range(pages):
+                    driver.get(f'{url}?page={page}')
+                page_load = (time.perf_counter() - start) / pages
+                rss = process_tree_rss(driver.service.process.pid)
+            finally:
+                driver.quit()
+            results.append((mode, startup, page_load, rss))
+    finally:
+        server.shutdown()
+
+    print(f"{'mode':<10}{'startup':>12}{'page load':>12}{'RSS':>12}")
+    for mode, startup, page_load, rss in results:
+        print(f"{mode:<10}{startup:>11.2f}s{page_load * 1000:>10.0f}ms{rss / 1024 / 1024:>9.0f}MiB")
+    return results
+
+
+@contextmanager
+def fixture_server(pages, cards, fees, latency):
+    """
+    Run FixtureServer in a separate process, so its CPU and memory are not measured, and yield
+    (listing URL, server pid).
+    """
+    import subprocess
+
+    server = subprocess.Popen(
+        [sys.executable, str(Path(__file__).with_name('FixtureServer.py')), '--port', '0', '--pages', str(pages),
+         '--cards', str(cards), '--fees', str(fees), '--latency', str(latency)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        yield server.stdout.readline().strip(), server.pid
+    finally:
+        server.terminate()
+        server.wait()
+
+
+@contextmanager
+def peak_memory(exclude=(), interval=0.2):
+    """
+    Peak resident memory of this process and its descendants (browsers included), the `exclude`
+    pids left out, sampled every `interval` seconds inside the `with` block.
+    """
+    from DriverHealth import process_tree_rss
+
+    peak = {'bytes': 0}
+    stop = threading.Event()
+
+    def sample():
+        while True:
+            rss = process_tree_rss(os.getpid()) - sum(process_tree_rss(pid) for pid in exclude)
+            peak['bytes'] = max(peak['bytes'], rss)
+            if stop.wait(interval):
+                return
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield peak
+    finally:
+        stop.set()
+        sampler.join()
+
+
+def cpu_seconds():
+    import resource
+
+    # Browsers and drivers are counted once they have been reaped, i.e. after the pool is closed
+    return sum(usage.ru_utime + usage.ru_stime
+               for usage in (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)))
+
+
+def bench_crawl(pages=10, cards=20, fees=3, latency=0.05, workers=4, engines=('http', 'selenium')):
+    """
+    Listing and profile stages end to end, through `Pipeline.run_pipeline`, against a local
+    FixtureServer answering after `latency` seconds: pages per second, CPU time and peak
+    memory of each engine. Each run starts cold, with its own checkpoint, page cache and
+    profile index, and without rate limit. The selenium engine requires Chrome.
+    """
+    import io
+    import json
+    from DriverFactory import make_driver
+    from PageCache import PageCache
+    from Pipeline import run_pipeline
+    from ProfileIndex import ProfileIndex
+    from RunReport import report_path
+
+    results = []
+    with fixture_server(pages, cards, fees, latency) as (listing_url, server_pid):
+        for engine in engines:
+            work_dir = Path(tempfile.mkdtemp(prefix='doctolib-bench-'))
+            log = io.StringIO()
+            cpu = cpu_seconds()
+            start = time.perf_counter()
+            try:
+                with peak_memory(exclude=(server_pid,)) as peak, redirect_stdout(log):
+                    file_path = run_pipeline(
+                        'psychologue', 'tourcoing', make_driver if engine == 'selenium' else None, engine=engine,
+                        workers=workers, min_interval=0, file_path=str(work_dir / 'bench.xlsx'), base_url=listing_url,
+                        cache=PageCache(str(work_dir / 'cache.db')), index=ProfileIndex(str(work_dir / 'index.db')),
+                    )
+            except Exception as e:
+                print(f"{engine}: skipped ({type(e).__name__}: {e})")
+                continue
+            wall = time.perf_counter() - start
+            cpu = cpu_seconds() - cpu
+            with open(report_path(file_path), encoding='utf-8') as f:
+                fetched = json.load(f)['pages']
+            if not fetched:
+                errors = [line for line in log.getvalue().splitlines() if line.startswith('Error')]
+                print(f"{engine}: skipped, no page fetched ({errors[-1] if errors else 'see the run log'})")
+                continue
+            results.append((engine, fetched, wall, cpu, peak['bytes']))
+
+    print(f"{pages} listing pages x {cards} profiles, {latency * 1000:.0f}ms latency, {workers} worker(s)")
+    print(f"{'engine':<10}{'pages':>8}{'wall':>10}{'pages/s':>10}{'CPU':>10}{'CPU %':>8}{'peak RSS':>11}")
+    for engine, fetched, wall, cpu, rss in results:
+        print(f"{engine:<10}{fetched:>8}{wall:>9.2f}s{fetched / wall:>10.1f}{cpu:>9.2f}s{100 * cpu / wall:>7.0f}%"
+              f"{rss / 1024 / 1024:>8.0f}MiB")
+    return results
+
+
+BENCHMARKS = {
+    'crawl': bench_crawl,
+    'round_trips': bench_round_trips,
+    'checkpoint': bench_checkpoint,
+    'fees': bench_fees,
+    'memory': bench_memory,
+    'geocode': bench_geocode,
+    'startup': bench_startup,
+    'driver': bench_driver,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for bench_name in names:
+        print(f"== {bench_name} ==")
+        BENCHMARKS[bench_name]()
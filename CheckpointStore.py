@@ -0,0 +1,545 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import nullcontext
+from itertools import islice
+
+import openpyxl
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+
+from CrawlLedger import CrawlLedger, DEAD, DONE, EMPTY, FAILED
+from FeeTable import fee_frame, normalize_fees, wide_fee_view
+from RefreshSchedule import RefreshSchedule, fingerprint, profile_values
+
+
+# Rows read or written at a time when streaming the listing, the profiles or a workbook
+CHUNK_SIZE = 1000
+
+# Header style of the workbooks, as pandas writes it
+HEADER_FONT = Font(bold=True)
+HEADER_BORDER = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'),
+                       bottom=Side(style='thin'))
+HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='top')
+
+
+def chunked(iterable, size):
+    """
+    Lists of at most `size` consecutive items of `iterable`.
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def checkpoint_path(file_path):
+    """
+    Checkpoint database kept next to the Excel file it feeds.
+    """
+    return os.path.splitext(file_path)[0] + '.checkpoint.db'
+
+
+def changes_path(file_path):
+    """
+    Workbook of the rows changed by a refresh, kept next to the Excel file it comes from.
+    """
+    return os.path.splitext(file_path)[0] + '.changes.xlsx'
+
+
+class CheckpointStore:
+    """
+    Append-only SQLite log of listing and profile results.
+
+    Every page or profile is recorded as soon as it is scraped, so a crash loses at
+    most the item in flight. The Excel workbook is only produced by `export_excel`.
+    Listing rows, profile results and workbooks are streamed `CHUNK_SIZE` rows at a
+    time, so memory stays flat however large the query.
+    The crawl ledger of the run lives in the same database, see `CrawlLedger`, and so do
+    the fingerprints and change log of the profiles, see `RefreshSchedule`.
+
+    Parameters:
+        path (str): Location of the SQLite database.
+        index (ProfileIndex): Optional cross-run profile index, fed with every profile field
+            recorded here and consulted by `join_index`.
+        metrics (PacingMetrics): Optional run metrics, receiving the persistence time and the bytes written.
+    """
+
+    def __init__(self, path, index=None, metrics=None):
+        self.path = path
+        self.index = index
+        self.metrics = metrics
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS listings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                page INTEGER,
+                name TEXT,
+                link TEXT,
+                created_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS profiles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                link TEXT,
+                data TEXT,
+                created_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS profiles_link ON profiles (link);
+            CREATE INDEX IF NOT EXISTS listings_link ON listings (link);
+        ''')
+        self.conn.commit()
+        self.ledger = CrawlLedger(self.conn)
+        self.refresh = RefreshSchedule(self.conn)
+
+    @classmethod
+    def for_workbook(cls, file_path, index=None, metrics=None):
+        return cls(checkpoint_path(file_path), index, metrics)
+
+    def _measure(self, url=None):
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.measure('persistence', url)
+
+    def _count(self, name, amount):
+        if self.metrics is not None:
+            self.metrics.count(name, amount)
+
+    def append_listing(self, page, names, links):
+        with self.conn:
+            self._insert_listing(page, names, links)
+
+    def _insert_listing(self, page, names, links):
+        now = time.time()
+        rows = [(page, name, link, now) for name, link in zip(names, links)]
+        self.conn.executemany('INSERT INTO listings (page, name, link, created_at) VALUES (?, ?, ?, ?)', rows)
+        self._count('checkpoint_bytes_written', sum(len(f"{name}{link}".encode()) for _, name, link, _ in rows))
+
+    def record_page(self, docteur, localisation, page, names, links):
+        """
+        Append the rows of a listing page and mark the page done in the ledger, atomically.
+        """
+        with self._measure(), self.conn:
+            self._insert_listing(page, names, links)
+            self.ledger._set_page_status(docteur, localisation, page, DONE)
+
+    def record_profile(self, link, stage, data):
+        """
+        Append the fields scraped for `stage` of a profile and mark it done in the ledger, atomically.
+        """
+        with self._measure(link), self.conn:
+            self._insert_profiles([(link, data)])
+            self.ledger._set_profile_status(link, stage, DONE)
+        self._publish([(link, stage, data)])
+
+    def record_profile_fields(self, link, fields, data):
+        """
+        Record every field read from one visit of a profile, atomically: fields with values
+        are appended and marked done, the others are marked empty in the ledger.
+
+        Parameters:
+            link (str): The profile link.
+            fields (iterable): Fields that were extracted, e.g. ('fees', 'address').
+            data (dict): Values by field, as returned by the backends' scrape_profile.
+        """
+        with self._measure(link), self.conn:
+            for field in fields:
+                if data.get(field):
+                    self._insert_profiles([(link, data[field])])
+                    self.ledger._set_profile_status(link, field, DONE)
+                else:
+                    self.ledger._set_profile_status(link, field, EMPTY)
+        self._publish([(link, field, data[field]) for field in fields if data.get(field)])
+
+    def record_refresh(self, link, data):
+        """
+        Record a refresh visit of a profile, atomically: when the fingerprint of `data` differs
+        from the recorded one, only the values that changed are appended and logged.
+
+        Parameters:
+            link (str): The profile link.
+            data (dict): Values by field of every profile field, as returned by the backends' scrape_profile.
+
+        Returns the changes as (field, before, after) tuples, empty when the profile did not change.
+        """
+        now = time.time()
+        new_fingerprint = fingerprint(data)
+        changes = []
+        with self._measure(link), self.conn:
+            if new_fingerprint != self.refresh.fingerprint_of(link):
+                before, after = profile_values(self.profile_result(link)), profile_values(data)
+                changes = [(key, before.get(key), after.get(key)) for key in sorted(before.keys() | after.keys())
+                           if before.get(key) != after.get(key)]
+            if changes:
+                # Values gone from the page are recorded empty, so they no longer show in the workbook
+                self._insert_profiles([(link, {
+                    key: value if value is not None else ([] if isinstance(previous, list) else None)
+                    for key, previous, value in changes
+                })])
+                self.refresh._log_changes(link, changes, now)
+            self.refresh._observe(link, new_fingerprint, bool(changes), now)
+        changed = {key for key, _, _ in changes}
+        self._publish([(link, field, values) for field, values in data.items() if values and changed & values.keys()])
+        return changes
+
+    def fingerprint_profiles(self):
+        """
+        Fingerprint the recorded profiles that have none yet, e.g. scraped before refreshes existed.
+        """
+        seen_at = dict(self.conn.execute('SELECT link, MAX(created_at) FROM profiles GROUP BY link'))
+        return self.refresh.backfill(self.profile_results(), seen_at)
+
+    def fail_profile(self, link, fields, error):
+        """
+        Record that a visit of `link` failed. A failure whose retries were used up (RetryEngine.GaveUp)
+        goes to the dead-letter list with its class; any other one is retried by the next run.
+        """
+        kind = getattr(error, 'kind', None)
+        with self._measure(link), self.conn:
+            for field in fields:
+                self.ledger._set_profile_status(link, field, DEAD if kind else FAILED, kind)
+
+    def report_dead_letters(self):
+        dead_letters = self.ledger.dead_letters()
+        if dead_letters:
+            kinds = {}
+            for _, _, kind, _ in dead_letters:
+                kinds[kind] = kinds.get(kind, 0) + 1
+            details = ', '.join(f"{count} {kind}" for kind, count in kinds.items())
+            print(f"{len(dead_letters)} profile field(s) given up ({details}), see CrawlLedger.dead_letters().")
+
+    def _publish(self, items):
+        if self.index is not None and items:
+            self.index.record(items)
+
+    def join_index(self, links, fields):
+        """
+        Record the `fields` of `links` already known to the profile index, without fetching them.
+
+        Returns the number of (link, field) values joined in.
+        """
+        if self.index is None or not links:
+            return 0
+        items = []
+        for link, values in self.index.lookup(links, fields).items():
+            for field, data in values.items():
+                if not self.ledger.profile_done(link, field):
+                    items.append((link, field, data))
+        with self.conn:
+            self._insert_profiles([(link, data) for link, _, data in items])
+            for link, field, _ in items:
+                self.ledger._set_profile_status(link, field, DONE)
+        return len(items)
+
+    def pending_profiles(self, fields):
+        """
+        Links of the listing missing one of `fields`, once the values known to the profile index are joined in.
+        """
+        joined = self.join_index(self.ledger.pending_profiles(*fields), fields)
+        if joined:
+            print(f"Joined {joined} profile value(s) from the profile index.")
+        return self.ledger.pending_profiles(*fields)
+
+    def pending_fields(self, link, fields):
+        """
+        The ones of `fields` still to fetch for `link`, once the values known to the profile index are joined in.
+        """
+        link_fields = self.ledger.pending_stages(link, fields)
+        if link_fields and self.join_index([link], link_fields):
+            link_fields = self.ledger.pending_stages(link, link_fields)
+        return link_fields
+
+    def append_profile(self, link, data):
+        """
+        Record the fields scraped for one profile, e.g. {'types': [...], 'fees': [...]} or {'address': '...'}.
+        """
+        self.append_profiles([(link, data)])
+
+    def append_profiles(self, items):
+        with self.conn:
+            self._insert_profiles(items)
+
+    def _insert_profiles(self, items):
+        now = time.time()
+        rows = [(link, json.dumps(data, ensure_ascii=False), now) for link, data in items]
+        self.conn.executemany('INSERT INTO profiles (link, data, created_at) VALUES (?, ?, ?)', rows)
+        self._count('checkpoint_bytes_written', sum(len(f"{link}{data}".encode()) for link, data, _ in rows))
+
+    def import_workbook(self, file_path, chunk_size=CHUNK_SIZE):
+        """
+        Seed an empty checkpoint from a workbook written before checkpoints existed,
+        reading it `chunk_size` rows at a time.
+        """
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        columns = list(next(rows, ()))
+        # Consultation_Type_i and Consultation_Fee_i are read as pairs, so that a blank type or fee keeps its place
+        positions = sorted({column_order(c)[1] for c in columns if str(c).startswith('Consultation_')})
+        pair_columns = [(f'Consultation_Type_{position}', f'Consultation_Fee_{position}') for position in positions]
+
+        count = 0
+        for chunk in chunked(rows, chunk_size):
+            records = [dict(zip(columns, row)) for row in chunk if any(value is not None for value in row)]
+            items = []
+            stages = []
+            for row in records:
+                pairs = [(row.get(type_column), row.get(fee_column)) for type_column, fee_column in pair_columns]
+                pairs = [('' if is_blank(kind) else kind, '' if is_blank(fee) else fee)
+                         for kind, fee in pairs if not (is_blank(kind) and is_blank(fee))]
+                types, fees = [kind for kind, _ in pairs], [fee for _, fee in pairs]
+                if pairs:
+                    items.append((row['Link'], {'types': types, 'fees': fees}))
+                    stages.append((row['Link'], 'fees'))
+                if not is_blank(row.get('Address')):
+                    items.append((row['Link'], {'address': row['Address']}))
+                    stages.append((row['Link'], 'address'))
+            with self.conn:
+                self._insert_listing(0, [row.get('Name') for row in records], [row.get('Link') for row in records])
+                self._insert_profiles(items)
+                for link, stage in stages:
+                    self.ledger._set_profile_status(link, stage, DONE)
+            self._publish([(link, stage, data) for (link, data), (_, stage) in zip(items, stages)])
+            count += len(records)
+        workbook.close()
+        print(f"Imported {count} rows from {file_path} into the checkpoint.")
+
+    def listing_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM listings').fetchone()[0]
+
+    def listing_counts(self):
+        """
+        (rows, profiles): listing rows recorded, and distinct profile links among them.
+        """
+        return self.conn.execute('SELECT COUNT(*), COUNT(DISTINCT link) FROM listings').fetchone()
+
+    def listing_frame(self):
+        # One row per profile link, in the order the links were first found
+        return pd.DataFrame(list(self.iter_listing()), columns=['Name', 'Link'])
+
+    def iter_listing(self, chunk_size=CHUNK_SIZE):
+        """
+        Stream the {'Name', 'Link'} records of the listing, one per profile link in the order
+        the links were first found, `chunk_size` rows read at a time.
+        """
+        last_id = 0
+        while True:
+            # Keyset pagination: no cursor is left open between two chunks, while the run writes
+            rows = self.conn.execute('''
+                SELECT id, name, link FROM listings AS l
+                WHERE id > ? AND NOT EXISTS (SELECT 1 FROM listings AS e WHERE e.link = l.link AND e.id < l.id)
+                ORDER BY id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            for _, name, link in rows:
+                yield {'Name': name, 'Link': link}
+            last_id = rows[-1][0]
+
+    def profile_results(self, links=None):
+        """
+        Latest fields recorded for every profile, or for the ones of `links`, keyed by link.
+        """
+        if links is None:
+            return dict(self.iter_profile_results())
+        results = {}
+        for chunk in chunked(links, CHUNK_SIZE):
+            for link, data in self.conn.execute(
+                    f'SELECT link, data FROM profiles WHERE link IN ({", ".join("?" * len(chunk))}) ORDER BY id',
+                    chunk):
+                results.setdefault(link, {}).update(json.loads(data))
+        return results
+
+    def iter_profile_results(self):
+        """
+        Stream the latest fields recorded for every profile as (link, data) pairs, one profile at a time.
+        """
+        link, result = None, {}
+        for row_link, data in self.conn.execute('SELECT link, data FROM profiles ORDER BY link, id'):
+            if row_link != link:
+                if link is not None:
+                    yield link, result
+                link, result = row_link, {}
+            result.update(json.loads(data))
+        if link is not None:
+            yield link, result
+
+    def profile_result(self, link):
+        """
+        Latest fields recorded for one profile.
+        """
+        return self.profile_results([link]).get(link, {})
+
+    def fee_table(self, results=None):
+        """
+        Tidy table of every recorded fee, one row per consultation, see `FeeTable.normalize_fees`.
+        """
+        return normalize_fees(self.profile_results() if results is None else results)
+
+    def export_excel(self, file_path):
+        """
+        Write the workbook: listing rows joined with every recorded profile result on the
+        first sheet, and the tidy fee table on the "Fees" sheet.
+
+        Both sheets are streamed to the file `CHUNK_SIZE` rows at a time, after a first
+        pass over the profile results sizing the Consultation_Type_i/Consultation_Fee_i columns.
+        """
+        with self._measure():
+            positions, has_address = 0, False
+            for _, result in self.iter_profile_results():
+                positions = max(positions, len(result.get('types') or []), len(result.get('fees') or []))
+                has_address = has_address or bool(result.get('address'))
+            profile_columns = [f"Consultation_{kind}_{position}" for position in range(1, positions + 1)
+                               for kind in ('Type', 'Fee')] + (['Address'] if has_address else [])
+
+            workbook = openpyxl.Workbook(write_only=True)
+            sheet = workbook.create_sheet('Sheet1')
+            sheet.append(header_cells(sheet, ['Name', 'Link', *profile_columns]))
+            for records in chunked(self.iter_listing(), CHUNK_SIZE):
+                results = self.profile_results([record['Link'] for record in records])
+                for record in records:
+                    sheet.append([record['Name'], record['Link'],
+                                  *profile_row(results.get(record['Link'], {}), positions, has_address)])
+
+            fees = workbook.create_sheet('Fees')
+            header = False
+            for chunk in chunked(self.iter_profile_results(), CHUNK_SIZE):
+                table = normalize_fees(dict(chunk))
+                if not header:
+                    fees.append(header_cells(fees, list(table.columns)))
+                    header = True
+                for row in table.itertuples(index=False):
+                    fees.append([None if pd.isna(value) else value for value in row])
+            if not header:
+                fees.append(header_cells(fees, list(normalize_fees({}).columns)))
+            workbook.save(file_path)
+        self._count('workbook_writes', 1)
+        self._count('workbook_bytes_written', os.path.getsize(file_path))
+        print(f'Data has been saved to {file_path}')
+
+    def export_changes(self, file_path, since=0.0):
+        """
+        Write the workbook of the profiles changed since `since`: their rows, as on the first
+        sheet of `export_excel`, and the change log on the "Change Log" sheet.
+
+        Returns the number of changed rows.
+        """
+        changes = self.refresh.changes(since)
+        links = list(dict.fromkeys(link for link, *_ in changes))
+        with self._measure():
+            changed = set(links)
+            df = pd.DataFrame([record for record in self.iter_listing() if record['Link'] in changed],
+                              columns=['Name', 'Link'])
+            df = apply_profile_results(df, self.profile_results(links))
+            log = pd.DataFrame(
+                [(link, field, change_text(before), change_text(after), pd.to_datetime(changed_at, unit='s'))
+                 for link, field, before, after, changed_at in changes],
+                columns=['Link', 'Field', 'Before', 'After', 'Changed_At'],
+            )
+            with pd.ExcelWriter(file_path) as writer:
+                df.to_excel(writer, index=False)
+                log.to_excel(writer, sheet_name='Change Log', index=False)
+        self._count('workbook_writes', 1)
+        self._count('workbook_bytes_written', os.path.getsize(file_path))
+        print(f'{len(df)} changed rows and {len(log)} changes saved to {file_path}')
+        return len(df)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_checkpoint(file_path, index=None, metrics=None):
+    """
+    Open the checkpoint of `file_path`, importing the workbook the first time.
+    """
+    store = CheckpointStore.for_workbook(file_path, index, metrics)
+    if store.listing_count() == 0 and os.path.exists(file_path):
+        store.import_workbook(file_path)
+    return store
+
+
+def is_blank(value):
+    return value is None or value == '' or (isinstance(value, float) and pd.isna(value))
+
+
+def header_cells(sheet, columns):
+    cells = []
+    for column in columns:
+        cell = WriteOnlyCell(sheet, value=column)
+        cell.font, cell.border, cell.alignment = HEADER_FONT, HEADER_BORDER, HEADER_ALIGNMENT
+        cells.append(cell)
+    return cells
+
+
+def profile_row(result, positions, has_address):
+    """
+    Profile cells of one workbook row: `positions` Consultation_Type_i/Consultation_Fee_i pairs, then Address.
+
+    Pairs are laid out as in `profile_frame`: a profile with fees fills its own positions,
+    a missing type or fee being an empty text, and leaves the following ones blank.
+    """
+    types, fees = result.get('types') or [], result.get('fees') or []
+    count = max(len(types), len(fees))
+    cells = []
+    for position in range(positions):
+        if position < count:
+            cells += [types[position] if position < len(types) else '', fees[position] if position < len(fees) else '']
+        else:
+            cells += [None, None]
+    if has_address:
+        cells.append(result.get('address') or None)
+    return cells
+
+
+def change_text(value):
+    # Lists of the change log (consultation types, fees) as one cell
+    if isinstance(value, list):
+        return ' | '.join(str(item) for item in value)
+    return value
+
+
+def profile_frame(results):
+    """
+    Wide view of profile results: one row per link, Consultation_Type_i/Consultation_Fee_i pairs and Address.
+    """
+    frame = wide_fee_view(fee_frame(results))
+    addresses = {link: data['address'] for link, data in results.items() if data.get('address')}
+    if addresses:
+        frame = frame.join(pd.Series(addresses, name='Address'), how='outer')
+    return frame[sorted(frame.columns, key=column_order)]
+
+
+def column_order(column):
+    # Consultation_Type_1, Consultation_Fee_1, Consultation_Type_2, ... then Address
+    if column.startswith('Consultation_'):
+        kind, number = column.rsplit('_', 2)[1:]
+        return (0, int(number), kind != 'Type')
+    return (1, 0, column)
+
+
+def apply_profile_results(df, results):
+    """
+    Fill the profile columns of `df` from `results`, matching rows on the Link column.
+
+    Values already present in `df` are kept when a profile has no result.
+    """
+    if not results:
+        return df
+    frame = profile_frame(results)
+    df = df.copy()
+    columns = {}
+    for column in frame.columns:
+        values = df['Link'].map(frame[column])
+        if column in df.columns:
+            values = values.where(values.notna(), df[column])
+        columns[column] = values
+    for column, values in columns.items():
+        df[column] = values
+    return df
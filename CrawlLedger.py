@@ -0,0 +1,212 @@
+import time
+
+# A listing page or profile is finished once its results are recorded; 'empty' and
+# 'failed' units are fetched again by the next run. 'dead' profiles used up every retry
+# of a run and wait in the dead-letter list until they are revived.
+DONE = 'done'
+EMPTY = 'empty'
+FAILED = 'failed'
+IN_PROGRESS = 'in_progress'
+DEAD = 'dead'
+
+
+class CrawlLedger:
+    """
+    Per-run record of which listing pages and profiles have been fetched.
+
+    Listing pages are keyed by (docteur, localisation, page) and profiles by
+    (link, stage), each with a status, the time of the last change and the number
+    of attempts. The last page announced by the pagination of each listing is kept
+    too. A restarted run asks the ledger where to resume, and where to stop, instead
+    of guessing from the number of rows in the workbook.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to the checkpoint database.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS ledger_pages (
+                docteur TEXT,
+                localisation TEXT,
+                page INTEGER,
+                status TEXT,
+                attempts INTEGER DEFAULT 0,
+                updated_at REAL,
+                PRIMARY KEY (docteur, localisation, page)
+            );
+            CREATE TABLE IF NOT EXISTS ledger_listings (
+                docteur TEXT,
+                localisation TEXT,
+                last_page INTEGER,
+                updated_at REAL,
+                PRIMARY KEY (docteur, localisation)
+            );
+            CREATE TABLE IF NOT EXISTS ledger_profiles (
+                link TEXT,
+                stage TEXT,
+                status TEXT,
+                attempts INTEGER DEFAULT 0,
+                updated_at REAL,
+                PRIMARY KEY (link, stage)
+            );
+        ''')
+        # Ledgers created before dead letters existed have no error column
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(ledger_profiles)')]
+        if 'error' not in columns:
+            self.conn.execute('ALTER TABLE ledger_profiles ADD COLUMN error TEXT')
+        self.conn.commit()
+
+    def start_page(self, docteur, localisation, page):
+        with self.conn:
+            self._set_page_status(docteur, localisation, page, IN_PROGRESS)
+
+    def finish_page(self, docteur, localisation, page, status):
+        with self.conn:
+            self._set_page_status(docteur, localisation, page, status)
+
+    def _set_page_status(self, docteur, localisation, page, status):
+        # Callers own the transaction, so the status can be committed with the page rows.
+        # Every terminal status counts as one attempt.
+        attempt = int(status != IN_PROGRESS)
+        self.conn.execute('''
+            INSERT INTO ledger_pages (docteur, localisation, page, status, attempts, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (docteur, localisation, page) DO UPDATE SET
+                status = excluded.status, attempts = attempts + excluded.attempts, updated_at = excluded.updated_at
+        ''', (docteur, localisation, page, status, attempt, time.time()))
+
+    def drop_page(self, docteur, localisation, page):
+        # A page cancelled before its results were read, e.g. a speculative fetch past the last page
+        with self.conn:
+            self.conn.execute('DELETE FROM ledger_pages WHERE docteur = ? AND localisation = ? AND page = ?',
+                              (docteur, localisation, page))
+
+    def record_last_page(self, docteur, localisation, last_page):
+        with self.conn:
+            self.conn.execute('''
+                INSERT INTO ledger_listings (docteur, localisation, last_page, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (docteur, localisation) DO UPDATE SET
+                    last_page = excluded.last_page, updated_at = excluded.updated_at
+            ''', (docteur, localisation, last_page, time.time()))
+
+    def last_page(self, docteur, localisation):
+        """
+        Last page announced by the pagination of the listing, None when it never showed it.
+        """
+        row = self.conn.execute(
+            'SELECT last_page FROM ledger_listings WHERE docteur = ? AND localisation = ?', (docteur, localisation)
+        ).fetchone()
+        return row[0] if row else None
+
+    def last_done_page(self, docteur, localisation):
+        """
+        Highest page of the listing whose results are recorded, None when there is none.
+        """
+        row = self.conn.execute(
+            'SELECT MAX(page) FROM ledger_pages WHERE docteur = ? AND localisation = ? AND status = ?',
+            (docteur, localisation, DONE),
+        ).fetchone()
+        return row[0]
+
+    def page_done(self, docteur, localisation, page):
+        row = self.conn.execute(
+            'SELECT status FROM ledger_pages WHERE docteur = ? AND localisation = ? AND page = ?',
+            (docteur, localisation, page),
+        ).fetchone()
+        return row is not None and row[0] == DONE
+
+    def first_unfinished_page(self, docteur, localisation):
+        """
+        Smallest page number whose results have not been recorded yet.
+        """
+        row = self.conn.execute('''
+            SELECT MIN(candidate) FROM (
+                SELECT 1 AS candidate
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM ledger_pages
+                    WHERE docteur = ? AND localisation = ? AND page = 1 AND status = ?
+                )
+                UNION ALL
+                SELECT page + 1 FROM ledger_pages AS done
+                WHERE docteur = ? AND localisation = ? AND status = ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM ledger_pages AS following
+                    WHERE following.docteur = done.docteur AND following.localisation = done.localisation
+                    AND following.page = done.page + 1 AND following.status = ?
+                )
+            )
+        ''', (docteur, localisation, DONE, docteur, localisation, DONE, DONE)).fetchone()
+        return row[0]
+
+    def start_profile(self, link, stage):
+        with self.conn:
+            self._set_profile_status(link, stage, IN_PROGRESS)
+
+    def finish_profile(self, link, stage, status, error=None):
+        with self.conn:
+            self._set_profile_status(link, stage, status, error)
+
+    def _set_profile_status(self, link, stage, status, error=None):
+        attempt = int(status != IN_PROGRESS)
+        self.conn.execute('''
+            INSERT INTO ledger_profiles (link, stage, status, attempts, updated_at, error)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (link, stage) DO UPDATE SET
+                status = excluded.status, attempts = attempts + excluded.attempts, updated_at = excluded.updated_at,
+                error = excluded.error
+        ''', (link, stage, status, attempt, time.time(), error))
+
+    def profile_done(self, link, stage):
+        row = self.conn.execute(
+            'SELECT status FROM ledger_profiles WHERE link = ? AND stage = ?', (link, stage)
+        ).fetchone()
+        return row is not None and row[0] == DONE
+
+    def pending_profiles(self, *stages):
+        """
+        Links of the listing with at least one of `stages` ('fees', 'address', ...) not recorded yet, in listing order.
+
+        Dead letters are left out.
+        """
+        placeholders = ', '.join('?' for _ in stages)
+        rows = self.conn.execute(f'''
+            SELECT link FROM listings
+            WHERE link IS NOT NULL
+            AND link NOT IN (
+                SELECT link FROM ledger_profiles
+                WHERE stage IN ({placeholders}) AND status IN (?, ?)
+                GROUP BY link
+                HAVING COUNT(DISTINCT stage) = ?
+            )
+            GROUP BY link
+            ORDER BY MIN(id)
+        ''', (*stages, DONE, DEAD, len(set(stages))))
+        return [row[0] for row in rows]
+
+    def pending_stages(self, link, stages):
+        """
+        The ones of `stages` neither recorded nor dead for `link`.
+        """
+        settled = {stage for stage, status in self.conn.execute(
+            'SELECT stage, status FROM ledger_profiles WHERE link = ?', (link,)
+        ) if status in (DONE, DEAD)}
+        return [stage for stage in stages if stage not in settled]
+
+    def dead_letters(self):
+        """
+        Profiles whose retries were used up, as (link, stage, error, attempts) tuples.
+        """
+        return self.conn.execute(
+            'SELECT link, stage, error, attempts FROM ledger_profiles WHERE status = ? ORDER BY updated_at', (DEAD,)
+        ).fetchall()
+
+    def revive_dead_letters(self):
+        """
+        Put every dead letter back in the queue of the next run. Returns how many were revived.
+        """
+        with self.conn:
+            return self.conn.execute(
+                'UPDATE ledger_profiles SET status = ? WHERE status = ?', (FAILED, DEAD)
+            ).rowcount
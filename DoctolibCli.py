@@ -0,0 +1,185 @@
+import argparse
+import os
+
+# Only the standard library is imported here: `--help` and `--dry-run` answer without
+# loading pandas, requests or Selenium, each subcommand imports what it runs.
+
+# Profile fields read when none are given, as ProfileExtractor.PROFILE_FIELDS. They are
+# also the names --fields accepts, checked here without importing the extractors
+DEFAULT_FIELDS = ('fees', 'address')
+
+
+def make_driver():
+    # Selenium is only imported by the runs that start a browser
+    from DriverFactory import make_driver as start_driver
+    return start_driver()
+
+
+def workbook_name(docteur, localisation):
+    return f'{docteur}_{localisation}.xlsx'.replace(' ', '_')
+
+
+def field_list(text):
+    """
+    Fields of a --fields value, e.g. "fees,address"; an empty value reads none.
+
+    Unknown names are rejected while parsing, with the list of the valid ones, instead of
+    failing on every profile of the run.
+    """
+    fields = tuple(field.strip() for field in text.split(',') if field.strip())
+    unknown = [field for field in fields if field not in DEFAULT_FIELDS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown profile field(s): {', '.join(unknown)}. "
+                                         f"Valid fields: {', '.join(DEFAULT_FIELDS)}")
+    return fields
+
+
+def describe(args, **values):
+    # Dry runs print what would be done, without importing the scrapers
+    print(f"{args.command}: " + ', '.join(f"{name}={value}" for name, value in values.items()))
+
+
+def run_list(args):
+    docteur, localisation = args.docteur.lower(), args.localisation.lower()
+    file_path = args.output or workbook_name(docteur, localisation)
+    if args.dry_run:
+        describe(args, query=f'{docteur}/{localisation}', workbook=file_path,
+                 engine=args.engine or os.environ.get('DOCTOLIB_ENGINE', 'selenium'), workers=args.workers,
+                 fields=','.join(args.fields) or 'none', resume=os.path.exists(file_path))
+        if args.split:
+            from PlaceList import QueryPlanner
+            shards = QueryPlanner().plan(localisation)
+            refined = ', saturated ones split into their cities' if args.split == 'city' else ''
+            print(f"{len(shards)} sub-queries{refined}, {args.parallel} at a time: {', '.join(shards)}")
+        return
+
+    if args.split:
+        from QueryPlanner import run_planned_query
+        file_path = run_planned_query(docteur, localisation, args.split, args.parallel, args.workers, args.engine,
+                                      make_driver, args.min_interval, file_path, base_url=args.base_url,
+                                      fields=args.fields)
+    else:
+        from Pipeline import run_pipeline
+        file_path = run_pipeline(docteur, localisation, make_driver, args.engine, args.fields, args.workers,
+                                 args.min_interval, file_path, base_url=args.base_url)
+    print(f"Updated Excel file saved to {file_path}")
+
+
+def run_enrich(args):
+    if args.dry_run:
+        describe(args, workbook=args.file_path, exists=os.path.exists(args.file_path),
+                 engine=args.engine or os.environ.get('DOCTOLIB_ENGINE', 'selenium'), workers=args.workers,
+                 **({'refresh': True, 'budget': args.budget} if args.refresh else {'fields': ','.join(args.fields)}))
+        return
+    if not os.path.exists(args.file_path):
+        raise SystemExit(f"{args.file_path} not found, run the list subcommand first")
+
+    if args.refresh:
+        from ProfileRefresh import refresh_profiles
+        # Without --budget, DOCTOLIB_REFRESH_BUDGET applies
+        budget = {} if args.budget is None else {'budget': args.budget}
+        refresh_profiles(args.file_path, engine=args.engine, driver_factory=make_driver, workers=args.workers,
+                         min_interval=args.min_interval, **budget)
+    else:
+        from StandaloneDoctolibScraper import scrape_profiles
+        scrape_profiles(args.file_path, args.workers, args.min_interval, args.engine, args.fields)
+
+
+def run_export(args):
+    output = args.output or args.file_path
+    if args.dry_run:
+        describe(args, workbook=args.file_path, exists=os.path.exists(args.file_path),
+                 output=args.output or ('<workbook>.geocoded.csv' if args.geocode else output), geocode=args.geocode)
+        return
+    if not os.path.exists(args.file_path):
+        raise SystemExit(f"{args.file_path} not found")
+
+    if args.geocode:
+        from AddressGeocoder import POSTCODES_PATH, Geocoder, default_gazetteer, geocode_workbook
+        geocode_workbook(args.file_path, args.output, Geocoder(default_gazetteer(args.postcodes or POSTCODES_PATH)))
+        return
+    from CheckpointStore import open_checkpoint
+    with open_checkpoint(args.file_path) as store:
+        store.export_excel(output)
+
+
+def run_bench(args):
+    if args.dry_run:
+        describe(args, benchmarks=','.join(args.names) or 'all')
+        return
+    from Benchmarks import BENCHMARKS
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"Unknown benchmark(s): {', '.join(unknown)}. Available: {', '.join(BENCHMARKS)}")
+    for name in args.names or BENCHMARKS:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='doctolib-scraper',
+        description='Scrape Doctolib listings and profiles into Excel workbooks, without prompts.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_backend_options(subparser, workers):
+        subparser.add_argument('--engine', choices=('selenium', 'http'),
+                               help='extraction backend (default: DOCTOLIB_ENGINE or selenium)')
+        subparser.add_argument('--workers', type=int, default=workers, help='number of backends')
+        subparser.add_argument('--min-interval', type=float, help='seconds between two requests to Doctolib')
+
+    def add_dry_run(subparser):
+        subparser.add_argument('--dry-run', action='store_true', help='print what would be done and exit')
+
+    listing = subparsers.add_parser('list', help='crawl the listing of a query, and optionally its profiles')
+    listing.add_argument('docteur', help='type of doctor, e.g. psychologue')
+    listing.add_argument('localisation', help='location, e.g. france')
+    listing.add_argument('--fields', type=field_list, default=(),
+                         help='profile fields read while listing, e.g. fees,address (default: none)')
+    listing.add_argument('--split', choices=('city', 'department'),
+                         help='crawl a country or region as sub-queries of its departments, the ones reaching '
+                              'the page cap split into their cities with "city"')
+    listing.add_argument('--parallel', type=int, default=int(os.environ.get('DOCTOLIB_PARALLEL_SHARDS', 4)),
+                         help='sub-queries crawled at the same time with --split')
+    listing.add_argument('--output', help='workbook to write (default: {docteur}_{localisation}.xlsx)')
+    listing.add_argument('--base-url', help='listing URL without the page number, e.g. of a FixtureServer '
+                                            '(with {docteur} and {localisation} placeholders with --split)')
+    add_backend_options(listing, 1)
+    add_dry_run(listing)
+    listing.set_defaults(handler=run_list)
+
+    enrich = subparsers.add_parser('enrich', help='read the profile fields missing from a workbook')
+    enrich.add_argument('file_path', help='workbook to enrich, e.g. psychologue_france.xlsx')
+    enrich.add_argument('--fields', type=field_list, default=DEFAULT_FIELDS,
+                        help=f"profile fields to read (default: {','.join(DEFAULT_FIELDS)})")
+    enrich.add_argument('--refresh', action='store_true',
+                        help='visit again the profiles most likely to have changed instead')
+    enrich.add_argument('--budget', type=int, help='maximum number of profiles visited by --refresh')
+    add_backend_options(enrich, 4)
+    add_dry_run(enrich)
+    enrich.set_defaults(handler=run_enrich)
+
+    export = subparsers.add_parser('export', help='write a workbook again from its checkpoint')
+    export.add_argument('file_path', help='workbook to export, e.g. psychologue_france.xlsx')
+    export.add_argument('--output', help='file to write (default: the workbook itself)')
+    export.add_argument('--geocode', action='store_true',
+                        help='write the geocoded addresses instead (default: <workbook>.geocoded.csv)')
+    export.add_argument('--postcodes', help='CSV of postcodes, communes and coordinates for --geocode '
+                                            '(default: DOCTOLIB_POSTCODES or postcodes_fr.csv)')
+    add_dry_run(export)
+    export.set_defaults(handler=run_export)
+
+    bench = subparsers.add_parser('bench', help='run the local benchmarks')
+    bench.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+    add_dry_run(bench)
+    bench.set_defaults(handler=run_bench)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,102 +1,86 @@
-import time
-import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-
-# Define the name of the Excel file
-file_name = "ergotherapeute_france.xlsx"
-file_path = f"./{file_name}"  # Assuming the file is in the same directory as this script
-
-def scrape_profile(file_path):
+import argparse
+from Backends import make_backend
+from DriverFactory import make_driver
+from DriverPool import DriverPool
+from Pacing import PacingMetrics
+from PageCache import report_default_cache
+from RateLimiter import HostRateLimiter
+from CheckpointStore import open_checkpoint
+from ProfileExtractor import PROFILE_FIELDS
+from ProfileIndex import default_index
+from RetryEngine import RetryEngine
+from RunReport import write_run_report
+
+def init_driver():
+    # Set DOCTOLIB_DRIVER_MODE=full to see the browser
+    return make_driver()
+
+def scrape_profile(file_path, engine=None, fields=PROFILE_FIELDS):
     """
-    Function to scrape consultation types and fees from Doctolib profiles.
+    Function to scrape consultation types, fees and addresses from Doctolib profiles.
+
+    Every field is read from the same page load, so each profile is opened once.
     
     Parameters:
         file_path (str): The path to the Excel file containing Doctolib profile links.
+        engine (str): Extraction backend, 'selenium' or 'http'. Defaults to the DOCTOLIB_ENGINE environment variable.
+        fields (tuple): Profile fields to scrape, among ProfileExtractor.FIELD_EXTRACTORS.
     """
-    # Load the Excel file
-    df = pd.read_excel(file_path)
-    print(f"Loaded Excel file: {file_path}")
-
-    # Set up the Selenium WebDriver
-    service = Service(ChromeDriverManager().install())
-    options = Options()
-    # options.add_argument('--headless')  # Uncomment to run in headless mode
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    driver = webdriver.Chrome(service=service, options=options)
-    print("WebDriver initialized.")
-
-    # Loop through each link in the DataFrame
-    for index, row in df.iterrows():
-        # Skip rows that already have consultation type and fee values
-        if not (pd.isna(row.get('Consultation_Type_1')) and pd.isna(row.get('Consultation_Fee_1'))):
-            continue
-
-        link = row['Link']
-        print(f"Processing {index + 1}/{len(df)}: {link}")
+    # Load the profile links and the results already recorded in the checkpoint
+    metrics = PacingMetrics()
+    store = open_checkpoint(file_path, default_index(), metrics)
+    ledger = store.ledger
+    pending_links = store.pending_profiles(fields)
+
+    # Set up the extraction backend, supervised so that a crashed or bloated browser is replaced
+    # and retried by failure class
+    rate_limiter = HostRateLimiter()
+    pool = DriverPool(1, lambda: make_backend(engine, init_driver, rate_limiter, metrics),
+                      retry=RetryEngine(rate_limiter))
+
+    # Loop through the links that miss at least one of the fields in the ledger
+    for index, link in enumerate(pending_links):
+        print(f"Processing {index + 1}/{len(pending_links)}: {link}")
+        link_fields = store.pending_fields(link, fields)
+        for field in link_fields:
+            ledger.start_profile(link, field)
 
         try:
-            # Open the page
-            driver.get(link)
-            time.sleep(3)  # Wait for 3 seconds on each page
-
-            # Look for the specific div and spans
-            profile_cards = driver.find_elements(By.CLASS_NAME, 'dl-profile-card-content')
+            # Open the page once and read every missing field
+            data = pool.run(lambda backend, link: backend.scrape_profile(link, link_fields), link)
 
-            types = []
-            fees = []
+            # Record the values in the checkpoint, fields without values are marked empty
+            store.record_profile_fields(link, link_fields, data)
 
-            for card in profile_cards:
-                ul_elements = card.find_elements(By.TAG_NAME, 'ul')
-                for ul in ul_elements:
-                    li_elements = ul.find_elements(By.CLASS_NAME, 'list-none')
-                    for li in li_elements:
-                        fee_names = li.find_elements(By.CLASS_NAME, 'dl-profile-fee-name')
-                        fee_tags = li.find_elements(By.CLASS_NAME, 'dl-profile-fee-tag')
-
-                        for name, tag in zip(fee_names, fee_tags):
-                            types.append(name.text)
-                            fees.append(tag.text)
-
-            if not types and not fees:
+            if not data:
                 print(f"No data found on page {index + 1}. Skipping this link.")
                 continue
 
-            # Ensure equal length by padding with empty strings if necessary
-            max_length = max(len(types), len(fees))
-            types.extend([''] * (max_length - len(types)))
-            fees.extend([''] * (max_length - len(fees)))
-
-            # Add the pairs to the DataFrame with explicit type casting to str
-            for i in range(len(types)):
-                column_name_type = f"Consultation_Type_{i+1}"
-                column_name_fee = f"Consultation_Fee_{i+1}"
-                if column_name_type not in df.columns:
-                    df[column_name_type] = [''] * len(df)
-                if column_name_fee not in df.columns:
-                    df[column_name_fee] = [''] * len(df)
-                df.at[index, column_name_type] = str(types[i])
-                df.at[index, column_name_fee] = str(fees[i])
-
-            print(f"Scraped data for {link}: {types}, {fees}")
+            print(f"Scraped data for {link}: {data}")
 
         except Exception as e:
+            store.fail_profile(link, link_fields, e)
             print(f"Error processing {link}: {e}")
-            time.sleep(5)
-
-        # Save the updated DataFrame to a new Excel file after each page
-        df.to_excel(file_path, index=False)
-        print(f"Data saved to Excel file: {file_path}")
 
-    # Close the WebDriver
-    driver.quit()
-    print("WebDriver closed.")
+    # Close the backend
+    pool.close()
+    print("Backend closed.")
+    metrics.report()
+    report_default_cache()
+    store.report_dead_letters()
+    # Write the workbook once, from the checkpoint
+    store.export_excel(file_path)
+    store.close()
+    write_run_report(metrics, file_path, profiles={'pending': len(pending_links)}, **pool.stats())
     print(f"Updated Excel file saved to {file_path}")
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Read the consultation types, fees and addresses missing from a Doctolib workbook.')
+    parser.add_argument('file_path', help='workbook to enrich, e.g. psychologue_france.xlsx')
+    parser.add_argument('--engine', choices=('selenium', 'http'))
+    args = parser.parse_args(argv)
+    scrape_profile(args.file_path, args.engine)
+
 if __name__ == "__main__":
-    # Directly calling the scrape_profile function with the specified file path
-    scrape_profile(file_path)
+    main()
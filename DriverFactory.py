@@ -0,0 +1,67 @@
+import os
+import threading
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+# 'lean': headless, no images, fonts or media, DOM-ready page loads; 'full': a regular visible browser
+DEFAULT_DRIVER_MODE = os.environ.get('DOCTOLIB_DRIVER_MODE', 'lean')
+DRIVER_MODES = ('lean', 'full')
+
+# Requests the lean mode never sends; the listing and profile data is in the DOM
+BLOCKED_URLS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3', '*.ogg', '*.wav',
+]
+
+_chromedriver_path = None
+_chromedriver_lock = threading.Lock()
+
+
+def chromedriver_path():
+    """
+    Path of the chromedriver binary, resolved by webdriver-manager once per process instead of once per browser.
+    """
+    global _chromedriver_path
+    with _chromedriver_lock:
+        if _chromedriver_path is None:
+            from webdriver_manager.chrome import ChromeDriverManager
+            _chromedriver_path = ChromeDriverManager().install()
+    return _chromedriver_path
+
+
+def chrome_options(mode=None):
+    mode = mode or DEFAULT_DRIVER_MODE
+    if mode not in DRIVER_MODES:
+        raise ValueError(f"Unknown driver mode: {mode}")
+
+    options = Options()
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    if mode == 'lean':
+        options.add_argument('--headless=new')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--disable-extensions')
+        options.add_argument('--mute-audio')
+        options.add_argument('--blink-settings=imagesEnabled=false')
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+        # Return from get() once the DOM is ready; the backends wait for the elements they read
+        options.page_load_strategy = 'eager'
+    return options
+
+
+def make_driver(mode=None):
+    """
+    Start a Chrome WebDriver in `mode` ('lean' or 'full', DOCTOLIB_DRIVER_MODE by default).
+
+    Every scraper builds its browsers here, so they share the cached driver binary and the same profile.
+    """
+    mode = mode or DEFAULT_DRIVER_MODE
+    driver = webdriver.Chrome(service=Service(chromedriver_path()), options=chrome_options(mode))
+    if mode == 'lean':
+        # Fonts and media are not covered by the content settings, block them at the network level
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
+    return driver
@@ -0,0 +1,143 @@
+import os
+import threading
+
+from selenium.common.exceptions import InvalidSessionIdException, NoSuchWindowException, WebDriverException
+from urllib3.exceptions import MaxRetryError, ProtocolError
+
+# Pages a browser session serves before it is replaced by a fresh one
+MAX_SESSION_PAGES = int(os.environ.get('DOCTOLIB_MAX_SESSION_PAGES', 500))
+# Resident memory of a browser and its child processes above which the session is replaced
+MAX_SESSION_RSS = int(os.environ.get('DOCTOLIB_MAX_SESSION_RSS_MB', 1500)) * 1024 * 1024
+# Failures in a row after which the session is considered broken
+MAX_CONSECUTIVE_ERRORS = 3
+# Pages between two memory readings of a session
+RSS_CHECK_INTERVAL = 20
+
+# WebDriver errors meaning the browser behind the session is gone
+SESSION_LOST_MESSAGES = (
+    'invalid session id', 'session deleted', 'chrome not reachable', 'disconnected',
+    'target window already closed', 'tab crashed', 'no such window',
+)
+
+
+def is_session_lost(error):
+    """
+    True if `error` means the browser session died, as opposed to a failure of the page itself.
+    """
+    if isinstance(error, (InvalidSessionIdException, NoSuchWindowException, MaxRetryError, ProtocolError,
+                          ConnectionError)):
+        return True
+    if isinstance(error, WebDriverException):
+        message = (error.msg or '').lower()
+        return any(lost in message for lost in SESSION_LOST_MESSAGES)
+    return False
+
+
+def process_tree_rss(pid):
+    """
+    Resident memory in bytes of process `pid` and all its descendants, read from /proc (Linux only).
+    """
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as stat:
+                    # The command name may contain spaces, the parent pid is the second field after it
+                    parent = int(stat.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+class SessionHealth:
+    def __init__(self):
+        self.pages = 0
+        self.consecutive_errors = 0
+        self.rss = 0
+        self.lost = False
+
+
+class HealthSupervisor:
+    """
+    Watch the sessions of a DriverPool and decide when one must be replaced.
+
+    A session is recycled when its browser died, after `max_errors` failures in a row,
+    once it has served `max_pages` pages, or when its browser uses more than `max_rss`
+    bytes of memory (read every `rss_interval` pages, through the backend's `rss()`).
+
+    Parameters:
+        max_pages (int): Pages served before a session is recycled.
+        max_rss (int): Resident memory in bytes above which a session is recycled.
+        max_errors (int): Consecutive failures after which a session is recycled.
+        rss_interval (int): Pages between two memory readings.
+    """
+
+    def __init__(self, max_pages=MAX_SESSION_PAGES, max_rss=MAX_SESSION_RSS, max_errors=MAX_CONSECUTIVE_ERRORS,
+                 rss_interval=RSS_CHECK_INTERVAL):
+        self.max_pages = max_pages
+        self.max_rss = max_rss
+        self.max_errors = max_errors
+        self.rss_interval = max(1, rss_interval)
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self.recycled = {}
+
+    def _health(self, backend):
+        with self._lock:
+            return self._sessions.setdefault(id(backend), SessionHealth())
+
+    def record(self, backend, error=None):
+        """
+        Account one use of `backend`, failed with `error` or successful.
+        """
+        health = self._health(backend)
+        health.pages += 1
+        if error is None:
+            health.consecutive_errors = 0
+        else:
+            health.consecutive_errors += 1
+            health.lost = health.lost or is_session_lost(error)
+        if health.pages % self.rss_interval == 0 and hasattr(backend, 'rss'):
+            try:
+                health.rss = backend.rss()
+            except Exception:
+                pass
+
+    def recycle_reason(self, backend):
+        """
+        Why `backend` must be replaced, as (kind, description), or None while it is healthy.
+        """
+        health = self._health(backend)
+        if health.lost:
+            return 'session lost', 'the browser session was lost'
+        if health.consecutive_errors >= self.max_errors:
+            return 'errors', f'{health.consecutive_errors} errors in a row'
+        if health.pages >= self.max_pages:
+            return 'pages', f'{health.pages} pages served'
+        if health.rss > self.max_rss:
+            return 'memory', f'{health.rss / 1024 / 1024:.0f} MiB in use'
+        return None
+
+    def forget(self, backend, kind):
+        with self._lock:
+            self._sessions.pop(id(backend), None)
+            self.recycled[kind] = self.recycled.get(kind, 0) + 1
+
+    def report(self):
+        if self.recycled:
+            details = ', '.join(f"{count} ({kind})" for kind, count in self.recycled.items())
+            print(f"Recycled {sum(self.recycled.values())} browser session(s): {details}")
@@ -0,0 +1,190 @@
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from DriverHealth import HealthSupervisor
+from RetryEngine import RetryEngine
+
+
+class DriverPool:
+    """
+    A fixed number of reusable WebDriver instances handed out through a queue.
+
+    Drivers are created lazily by `driver_factory` the first time they are needed
+    and are kept open until `close()` is called, unless the health supervisor asks
+    for one to be replaced: it is then quit and a fresh one is created on the next
+    checkout.
+
+    Parameters:
+        size (int): Maximum number of drivers alive at the same time.
+        driver_factory (callable): Function returning a new WebDriver.
+        supervisor (HealthSupervisor): Decides when a driver is recycled. Defaults to the
+            thresholds of DriverHealth.
+        retry (RetryEngine): Retries of the tasks given to `run`. Defaults to the policies of
+            RetryEngine, without host backoff.
+    """
+
+    def __init__(self, size, driver_factory, supervisor=None, retry=None):
+        self.size = max(1, int(size))
+        self.driver_factory = driver_factory
+        self.supervisor = supervisor or HealthSupervisor()
+        self.retry = retry or RetryEngine()
+        self._idle = queue.Queue()
+        self._created = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        """
+        Borrow a driver for the duration of the `with` block.
+        """
+        driver = self._checkout()
+        try:
+            yield driver
+        except Exception as e:
+            self.supervisor.record(driver, e)
+            raise
+        else:
+            self.supervisor.record(driver)
+        finally:
+            self._checkin(driver)
+
+    def run(self, task, item, is_empty=None):
+        """
+        Call task(driver, item) on a borrowed driver, retried by the pool's RetryEngine.
+
+        `item` is a URL, or a tuple starting with one. A session that died during the call
+        is recycled before the retry, so the item is handed to a fresh browser.
+
+        Raises:
+            GaveUp: when the retries allowed for the failure are exhausted.
+        """
+        def attempt():
+            with self.acquire() as driver:
+                return task(driver, item)
+
+        url = item if isinstance(item, str) else item[0]
+        return self.retry.call(attempt, url, is_empty)
+
+    def _checkout(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                # No idle driver: create one if there is room, otherwise wait for one
+                driver = None if len(self._created) < self.size else self._idle.get()
+            if driver is not None:
+                return driver
+            # None stands for the free slot of a recycled driver
+            with self._lock:
+                if len(self._created) < self.size:
+                    return self._create()
+
+    def _create(self):
+        try:
+            driver = self.driver_factory()
+        except Exception:
+            # Leave the slot to the next checkout
+            self._idle.put(None)
+            raise
+        self._created.append(driver)
+        print(f"Worker {len(self._created)}/{self.size} initialized.")
+        return driver
+
+    def _checkin(self, driver):
+        reason = self.supervisor.recycle_reason(driver)
+        if reason is None:
+            self._idle.put(driver)
+            return
+        kind, description = reason
+        print(f"Recycling a worker: {description}.")
+        with self._lock:
+            if driver in self._created:
+                self._created.remove(driver)
+        self.supervisor.forget(driver, kind)
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Error closing WebDriver: {e}")
+        self._idle.put(None)
+
+    def close(self):
+        """
+        Quit every driver created by the pool.
+        """
+        with self._lock:
+            for driver in self._created:
+                try:
+                    driver.quit()
+                except Exception as e:
+                    print(f"Error closing WebDriver: {e}")
+            self._created = []
+        self._idle = queue.Queue()
+        self.supervisor.report()
+        self.retry.report()
+
+    def stats(self):
+        """
+        Retries, abandoned items and recycled sessions of the pool, for the run report.
+        """
+        return {'retries': dict(self.retry.retries), 'gave_up': dict(self.retry.gave_up),
+                'recycled': dict(self.supervisor.recycled)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_in_pool(pool, items, task, max_in_flight=None):
+    """
+    Fan `items` out to the backends of `pool` and yield results as they complete.
+
+    Items are pulled lazily, at most `max_in_flight` at a time (twice the pool size by
+    default), so `items` can be a stream produced while the pool is working. Items whose
+    url is None are not submitted: they are yielded as (key, None, None) in their turn.
+
+    Parameters:
+        pool (DriverPool): Pool providing the drivers.
+        items (iterable): Pairs of (key, url) to process.
+        task (callable): Function called as task(driver, url) for each item.
+        max_in_flight (int): Maximum number of items submitted and not yet yielded.
+
+    Yields:
+        (key, result, error) tuples, where `error` is the exception raised by `task` or None.
+    """
+    max_in_flight = max_in_flight or 2 * pool.size
+
+    def work(url):
+        return pool.run(task, url)
+
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        futures = {}
+        try:
+            exhausted = False
+            while True:
+                while not exhausted and len(futures) < max_in_flight:
+                    try:
+                        key, url = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if url is None:
+                        yield key, None, None
+                        continue
+                    futures[executor.submit(work, url)] = key
+                if not futures:
+                    return
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = futures.pop(future)
+                    try:
+                        yield key, future.result(), None
+                    except Exception as e:
+                        yield key, None, e
+        finally:
+            for future in futures:
+                future.cancel()
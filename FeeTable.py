@@ -0,0 +1,83 @@
+import re
+from itertools import zip_longest
+
+import pandas as pd
+
+# Amounts as written on Doctolib: "50 €", "60,00 €", "De 50 € à 80 €"
+NUMBER = r'\d+(?:[.,]\d{1,2})?'
+AMOUNT = '(' + NUMBER + ')'
+CURRENCY_MARK = r'(?:€|EUR|CHF|£|\$)'
+CURRENCY = '(' + CURRENCY_MARK + ')'
+# A range is two amounts around "à", "-" or "–" ("De 40 € à 70 €", "40-60 €"), or "Entre 40 et 60 €".
+# Its top must be followed by a currency or end the text, so that other numbers of the text
+# ("50 € (secteur 2)", "45 € - remboursé sur la base de 30 €") are not read as one.
+AMOUNT_RANGE = (r'(?:\b(?P<entre>entre)\s+|\bde\s+)?(?P<low>' + NUMBER + r')\s*' + CURRENCY_MARK + r'?'
+                r'(?:\s*(?(entre)et|[-–à])\s*(?P<high>' + NUMBER + r')(?=\s*' + CURRENCY_MARK + r'|\s*$))?')
+# Space (including non-breaking ones) used as a thousands separator, e.g. "1 200 €"
+THOUSANDS_SEPARATOR = r'(?<=\d)\s(?=\d{3}(?!\d))'
+CURRENCIES = {'€': 'EUR', 'EUR': 'EUR', 'CHF': 'CHF', '£': 'GBP', '$': 'USD'}
+
+LONG_COLUMNS = ['Link', 'Position', 'Consultation_Type', 'Fee']
+
+
+def fee_frame(results):
+    """
+    Long table of the consultation fees in `results` ({link: {'types': [...], 'fees': [...]}}):
+    one row per (Link, Position) with the raw Consultation_Type and Fee texts.
+    """
+    rows = [
+        (link, position, consultation_type, fee)
+        for link, data in results.items()
+        for position, (consultation_type, fee) in enumerate(
+            zip_longest(data.get('types', []), data.get('fees', []), fillvalue=''), start=1)
+    ]
+    return pd.DataFrame(rows, columns=LONG_COLUMNS)
+
+
+def parse_amounts(fees):
+    """
+    Parse a Series of fee texts, all at once.
+
+    Returns a frame on the same index with Min_Cents and Max_Cents (equal unless the fee
+    is a range), Amount_Cents (only for single amounts) and Currency.
+    """
+    # Fee texts repeat a lot across profiles, each distinct text is parsed once
+    codes, texts = pd.factorize(fees.fillna('').astype(str))
+    texts = pd.Series(texts, dtype=object).str.replace(THOUSANDS_SEPARATOR, '', regex=True)
+
+    # A fee holds one amount, or two for a range
+    amounts = texts.str.extract(AMOUNT_RANGE, flags=re.IGNORECASE)[['low', 'high']]
+    cents = (amounts.apply(lambda column: column.str.replace(',', '.', regex=False)).astype(float) * 100).round()
+    parsed_texts = pd.DataFrame({
+        'Min_Cents': cents.min(axis=1).astype('Int64'),
+        'Max_Cents': cents.max(axis=1).astype('Int64'),
+        'Currency': texts.str.extract(CURRENCY, expand=False).map(CURRENCIES),
+    })
+    parsed_texts['Amount_Cents'] = parsed_texts['Min_Cents'].where(parsed_texts['Min_Cents'] == parsed_texts['Max_Cents'])
+
+    parsed = parsed_texts.take(codes)
+    parsed.index = fees.index
+    return parsed[['Min_Cents', 'Max_Cents', 'Amount_Cents', 'Currency']]
+
+
+def normalize_fees(results):
+    """
+    Tidy fee table of `results`, ready for price analysis: the long table of `fee_frame`
+    with the amounts in cents and the currency parsed from the fee texts.
+    """
+    frame = fee_frame(results)
+    return pd.concat([frame, parse_amounts(frame['Fee'])], axis=1)
+
+
+def wide_fee_view(frame):
+    """
+    Export layout of a long fee table: one row per Link with Consultation_Type_i/Consultation_Fee_i pairs.
+    """
+    if frame.empty:
+        return pd.DataFrame(index=pd.Index([], name='Link'))
+    wide = frame.pivot(index='Link', columns='Position', values=['Consultation_Type', 'Fee'])
+    wide.columns = [
+        f"Consultation_Type_{position}" if value == 'Consultation_Type' else f"Consultation_Fee_{position}"
+        for value, position in wide.columns
+    ]
+    return wide
@@ -0,0 +1,181 @@
+import argparse
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Synthetic pages with the markup the parsers read on Doctolib
+LISTING_CARD_HTML = """
+<div class="dl-flex-row dl-justify-between dl-align-items-start">
+  <div class="dl-layout-item dl-layout-size-xs-12">
+    <h2 class="dl-text dl-text-body dl-text-bold dl-text-s dl-text-primary-110">{name}</h2>
+  </div>
+  <a class="dl-p-doctor-result-link dl-full-width dl-flex-center" href="{link}">Prendre rendez-vous</a>
+</div>
+"""
+
+PAGINATION_HTML = """
+<nav class="dl-pagination"><a href="{prefix}?page={last_page}">{last_page}</a></nav>
+"""
+
+PROFILE_FEE_HTML = """
+    <li class="list-none"><span class="dl-profile-fee-name">{name}</span><span class="dl-profile-fee-tag">{fee}</span></li>
+"""
+
+PROFILE_HTML = """<!DOCTYPE html>
+<html lang="fr"><head><meta charset="utf-8"><title>{name}</title></head><body>
+<div class="dl-profile-card-content">
+  <h2 class="dl-profile-card-title dl-text dl-text-title dl-text-bold dl-text-s dl-text-neutral-150">Tarifs</h2>
+  <ul>{fees}</ul>
+</div>
+<div class="dl-profile-card-content">
+  <h2 class="dl-profile-card-title dl-text dl-text-title dl-text-bold dl-text-s dl-text-neutral-150">Carte et informations d'accès</h2>
+  <div class="dl-profile-text"><div>{number} rue de la Gare</div><div>59200 Tourcoing</div></div>
+</div>
+</body></html>
+"""
+
+
+# Function to build a synthetic listing page with the Doctolib markup
+def listing_html(cards=20, page=1, link_prefix='/psychologue/tourcoing', last_page=None):
+    body = ''.join(
+        LISTING_CARD_HTML.format(name=f"Dr Praticien {page}-{i}", link=f"{link_prefix}/praticien-{page}-{i}")
+        for i in range(1, cards + 1)
+    )
+    if last_page is not None:
+        body += PAGINATION_HTML.format(prefix=link_prefix, last_page=last_page)
+    return f'<!DOCTYPE html>\n<html lang="fr"><head><meta charset="utf-8"></head><body>{body}</body></html>'
+
+
+# Function to build a synthetic profile page with fee and address cards
+def profile_html(name='Dr Praticien', fees=3, number=1):
+    rows = ''.join(
+        PROFILE_FEE_HTML.format(name=f"Consultation {i}", fee=f"{40 + 10 * i} €")
+        for i in range(1, fees + 1)
+    )
+    return PROFILE_HTML.format(name=name, fees=rows, number=number)
+
+
+PROFILE_SLUG = re.compile(r'praticien-(\d+)-(\d+)$')
+
+
+class FixtureServer:
+    """
+    Local HTTP server answering like Doctolib for any query, without network.
+
+    `/{docteur}/{localisation}?page=N` is a listing page of `cards` results for N up to
+    `pages`, with a pagination link to the last page, and an empty listing past it.
+    `/{docteur}/{localisation}/praticien-P-I` is the profile page of the I-th result of
+    page P, with `fees` consultation fees and an address. Every response is delayed by
+    `latency` seconds, to mimic the round-trip to the site.
+
+    Parameters:
+        pages (int): Listing pages of every query.
+        cards (int): Results per listing page.
+        fees (int): Consultation fees per profile.
+        latency (float): Seconds every response is delayed.
+        host (str): Address to listen on.
+        port (int): Port to listen on, 0 for any free port.
+    """
+
+    def __init__(self, pages=10, cards=20, fees=3, latency=0.0, host='127.0.0.1', port=0):
+        self.pages = pages
+        self.cards = cards
+        self.fees = fees
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def listing_url(self, docteur='psychologue', localisation='tourcoing'):
+        """
+        Listing URL of a query without the page number, as `base_url` of the scrapers.
+        """
+        return f'{self.url}/{docteur}/{localisation}?page='
+
+    def page(self, path, query):
+        """
+        HTML served for `path`, or None for a 404.
+        """
+        parts = [part for part in path.split('/') if part]
+        if len(parts) == 2:
+            page = int(query.get('page', ['1'])[0])
+            cards = self.cards if page <= self.pages else 0
+            return listing_html(cards, page, '/' + '/'.join(parts), last_page=self.pages)
+        if len(parts) == 3:
+            match = PROFILE_SLUG.match(parts[2])
+            if match:
+                page, card = map(int, match.groups())
+                return profile_html(f"Dr Praticien {page}-{card}", self.fees, (page - 1) * self.cards + card)
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                parts = urlsplit(self.path)
+                html = server.page(parts.path, parse_qs(parts.query))
+                body = (html or 'Not found').encode('utf-8')
+                self.send_response(200 if html is not None else 404)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve Doctolib-shaped listing and profile pages locally.')
+    parser.add_argument('--pages', type=int, default=10, help='listing pages of every query')
+    parser.add_argument('--cards', type=int, default=20, help='results per listing page')
+    parser.add_argument('--fees', type=int, default=3, help='consultation fees per profile')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds every response is delayed')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on, 0 for any free port')
+    args = parser.parse_args(argv)
+
+    server = FixtureServer(args.pages, args.cards, args.fees, args.latency, port=args.port)
+    # The first line gives the listing URL to the process that started the server
+    print(server.listing_url(), flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Longest time a page may take to render its content before it is considered empty
+READY_TIMEOUT = 10
+# Interval between two readiness checks
+READY_POLL = 0.1
+
+STAGES = ('throttle', 'navigation', 'wait', 'extraction', 'persistence')
+# Stages where the run waits instead of working
+WAITING_STAGES = ('throttle', 'wait')
+# URLs whose timings are still added up, the most recently timed ones: older URLs are
+# closed into the samples below, so memory does not grow with the length of the run
+OPEN_URLS = 1024
+# Per-URL times kept per stage for the percentiles of the run report
+SAMPLE_SIZE = 10000
+# URLs listed in the report as the slowest of the run
+SLOWEST_URLS = 10
+
+
+class Reservoir:
+    """
+    Uniform sample of at most `size` values of a stream (reservoir sampling), for its percentiles.
+
+    Parameters:
+        size (int): Maximum number of values kept.
+        rng (random.Random): Source of randomness, e.g. seeded by tests.
+    """
+
+    def __init__(self, size=SAMPLE_SIZE, rng=None):
+        self.size = size
+        self.rng = rng or random.Random()
+        self.values = []
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+            return
+        index = self.rng.randrange(self.count)
+        if index < self.size:
+            self.values[index] = value
+
+
+class PacingMetrics:
+    """
+    Time spent by a run, split by stage, with per-URL timings and counters.
+
+    - throttle: waiting for the rate limiter
+    - navigation: requesting the page (browser navigation or HTTP request)
+    - wait: waiting for a page to render the elements we read
+    - extraction: reading the page and running the parsers
+    - persistence: recording results in the checkpoint and writing the workbook
+
+    Time measured for a URL is also added up per URL and stage, for the percentiles of
+    the run report (see `RunReport`). Only the `open_urls` most recently timed URLs are
+    kept; older ones go into a fixed-size sample per stage and a list of the slowest
+    URLs, so a run of any length uses the same memory. Counters hold the WebDriver
+    commands sent, the bytes read and the bytes written.
+    """
+
+    def __init__(self, open_urls=OPEN_URLS, sample_size=SAMPLE_SIZE, rng=None):
+        self._lock = threading.Lock()
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.open_urls = open_urls
+        self._open = OrderedDict()
+        self.samples = {stage: Reservoir(sample_size, rng) for stage in STAGES}
+        self._slowest = []
+        self._closed = itertools.count()
+        self.urls = 0
+        self.counters = {}
+        self.pages = 0
+        self.started_at = time.time()
+
+    def add(self, stage, seconds, url=None):
+        with self._lock:
+            self.seconds[stage] += seconds
+            if url is None:
+                return
+            timings = self._open.pop(url, None)
+            if timings is None:
+                self.urls += 1
+                timings = {}
+            timings[stage] = timings.get(stage, 0.0) + seconds
+            self._open[url] = timings
+            if len(self._open) > self.open_urls:
+                self._close(*self._open.popitem(last=False))
+
+    def _close(self, url, timings):
+        for stage, seconds in timings.items():
+            self.samples[stage].add(seconds)
+        # The sequence number breaks ties, timings are never compared
+        entry = (sum(timings.values()), next(self._closed), url, timings)
+        if len(self._slowest) < SLOWEST_URLS:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+
+    def stage_times(self, stage):
+        """
+        Sorted per-URL times of `stage`: a sample of the closed URLs, and every open one.
+        """
+        with self._lock:
+            values = self.samples[stage].values + [timings[stage] for timings in self._open.values()
+                                                   if stage in timings]
+        return sorted(values)
+
+    def stage_urls(self, stage):
+        """
+        Number of URLs timed in `stage`.
+        """
+        with self._lock:
+            return self.samples[stage].count + sum(stage in timings for timings in self._open.values())
+
+    def slowest(self, count=SLOWEST_URLS):
+        """
+        (url, timings) of the `count` URLs with the longest total time, slowest first.
+        """
+        with self._lock:
+            entries = self._slowest + [(sum(timings.values()), -1, url, timings) for url, timings in self._open.items()]
+        return [(url, timings) for _, _, url, timings in heapq.nlargest(count, entries, key=lambda entry: entry[0])]
+
+    @contextmanager
+    def measure(self, stage, url=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, url)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def page_done(self):
+        with self._lock:
+            self.pages += 1
+
+    def report(self):
+        waiting = sum(self.seconds[stage] for stage in WAITING_STAGES)
+        working = sum(self.seconds.values()) - waiting
+        total = waiting + working or 1.0
+        print(f"Pacing over {self.pages} page(s): "
+              f"waiting {waiting:.1f}s ({100 * waiting / total:.0f}%: "
+              f"rate limit {self.seconds['throttle']:.1f}s, rendering {self.seconds['wait']:.1f}s), "
+              f"working {working:.1f}s ({100 * working / total:.0f}%: "
+              f"navigation {self.seconds['navigation']:.1f}s, extraction {self.seconds['extraction']:.1f}s, "
+              f"persistence {self.seconds['persistence']:.1f}s)")
+
@@ -0,0 +1,152 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Where fetched pages are kept between runs; an empty value disables the cache
+DEFAULT_CACHE_PATH = os.environ.get('DOCTOLIB_CACHE', 'doctolib.cache.db')
+# Seconds a cached page stays fresh: profiles rarely change, listings gain and lose doctors
+PROFILE_TTL = float(os.environ.get('DOCTOLIB_PROFILE_TTL', 7 * 24 * 3600))
+LISTING_TTL = float(os.environ.get('DOCTOLIB_LISTING_TTL', 24 * 3600))
+# Compressed bytes kept on disk before the least recently used pages are evicted
+DEFAULT_MAX_BYTES = int(os.environ.get('DOCTOLIB_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+
+def normalize_url(url):
+    """
+    Canonical form of `url` used as the cache key: lower-case scheme and host, no
+    fragment, no trailing slash and query parameters sorted.
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ''))
+
+
+def cache_key(url):
+    return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """
+    On-disk cache of fetched pages shared by every backend and every run.
+
+    Pages are stored zlib-compressed in a SQLite file, keyed by the digest of their
+    normalized URL. A page older than the `ttl` given on lookup is treated as missing,
+    and once the compressed pages exceed `max_bytes` the least recently used ones are
+    evicted. Lookups are counted as hits, misses (never fetched) or stale.
+
+    Parameters:
+        path (str): The cache file.
+        max_bytes (int): Compressed size above which pages are evicted.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.counts = {'hits': 0, 'misses': 0, 'stale': 0, 'stored': 0, 'evicted': 0}
+        # Backends of a pool run in worker threads, the lock serializes access to the connection
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                body BLOB,
+                size INTEGER,
+                fetched_at REAL,
+                accessed_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at);
+        ''')
+        self.conn.commit()
+        self._size = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    def get(self, url, ttl=PROFILE_TTL):
+        """
+        Return the cached page of `url`, or None if it was never stored or is older than `ttl` seconds.
+        """
+        key = cache_key(url)
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute('SELECT body, fetched_at FROM pages WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.counts['misses'] += 1
+                return None
+            if now - row[1] > ttl:
+                self.counts['stale'] += 1
+                return None
+            with self.conn:
+                self.conn.execute('UPDATE pages SET accessed_at = ? WHERE key = ?', (now, key))
+            self.counts['hits'] += 1
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, url, html):
+        body = zlib.compress(html.encode('utf-8'), 6)
+        key = cache_key(url)
+        now = time.time()
+        with self._lock:
+            with self.conn:
+                previous = self.conn.execute('SELECT size FROM pages WHERE key = ?', (key,)).fetchone()
+                self.conn.execute('''
+                    INSERT OR REPLACE INTO pages (key, url, body, size, fetched_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (key, normalize_url(url), body, len(body), now, now))
+                self._size += len(body) - (previous[0] if previous else 0)
+                self.counts['stored'] += 1
+                if self._size > self.max_bytes:
+                    self._evict()
+
+    def _evict(self):
+        # Drop the least recently used pages until the cache is back to 90% of its budget
+        target = self.max_bytes * 0.9
+        rows = self.conn.execute('SELECT key, size FROM pages ORDER BY accessed_at')
+        evicted = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self.conn.executemany('DELETE FROM pages WHERE key = ?', evicted)
+        self.counts['evicted'] += len(evicted)
+
+    def report(self):
+        lookups = self.counts['hits'] + self.counts['misses'] + self.counts['stale']
+        hit_rate = 100 * self.counts['hits'] / lookups if lookups else 0
+        print(f"Page cache: {self.counts['hits']} hit(s), {self.counts['misses']} miss(es), "
+              f"{self.counts['stale']} stale ({hit_rate:.0f}% hit rate), {self.counts['stored']} stored, "
+              f"{self.counts['evicted']} evicted, {self._size / 1024 / 1024:.1f} MiB on disk")
+
+    def close(self):
+        self.conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """
+    The cache shared by every backend of the process, or None when DOCTOLIB_CACHE is empty.
+    """
+    global _default_cache
+    if not DEFAULT_CACHE_PATH:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PageCache(DEFAULT_CACHE_PATH)
+    return _default_cache
+
+
+def report_default_cache():
+    if _default_cache is not None:
+        _default_cache.report()
+
+
+def default_cache_counts():
+    return dict(_default_cache.counts) if _default_cache is not None else None
@@ -0,0 +1,110 @@
+from urllib.parse import urljoin
+
+import lxml.html
+
+from SelectorRegistry import DEFAULT_REGISTRY, LAYOUTS, LISTING, PAGE_PARAMETER, PROFILE
+
+# Selectors of the current layout, see SelectorRegistry.LAYOUTS for every known layout
+LISTING_CARD = LAYOUTS[0].css['listing_card']
+LISTING_LINK = LAYOUTS[0].css['listing_link']
+LISTING_NAME = LAYOUTS[0].css['listing_name']
+PROFILE_CARD = LAYOUTS[0].css['profile_card']
+ADDRESS_TITLE_TEXT = "Carte et informations d'accès"
+
+
+def text_of(element):
+    # Collapse whitespace and keep text nodes apart, close to what WebElement.text returns
+    return ' '.join(' '.join(chunk.split()) for chunk in element.itertext() if chunk.strip())
+
+
+def parse_html(html, base_url=None):
+    return lxml.html.fromstring(html, base_url=base_url)
+
+
+def parse_listing(html, base_url=None, registry=DEFAULT_REGISTRY):
+    """
+    Extract doctor names and profile links from a listing page.
+
+    Returns (links, names, found), where `found` is the SelectorRegistry.Layout the result cards
+    matched, None when the page has none at all.
+    """
+    return parse_listing_page(html, base_url, registry)[:3]
+
+
+def parse_listing_page(html, base_url=None, registry=DEFAULT_REGISTRY):
+    """
+    Same as `parse_listing`, plus the number of the last listing page when the pagination shows it.
+
+    The cards are read with the first layout of `registry` they match.
+
+    Returns (links, names, found, last_page), `last_page` being None when unknown.
+    """
+    tree = parse_html(html, base_url)
+    links = []
+    names = []
+
+    layout, cards = registry.match(tree, LISTING)
+    for card in cards:
+        link_elements = layout.select('listing_link', card)
+        name_elements = layout.select('listing_name', card)
+        if not link_elements or not name_elements:
+            continue
+        href = link_elements[0].get('href')
+        if base_url:
+            href = urljoin(base_url, href)
+        links.append(href)
+        names.append(text_of(name_elements[0]))
+
+    return links, names, layout, last_page_of(tree)
+
+
+def last_page_of(tree):
+    # Highest ?page=N linked from the page, the pagination always links to the last page
+    pages = []
+    for href in tree.xpath('//a/@href'):
+        match = PAGE_PARAMETER.search(href)
+        if match:
+            pages.append(int(match.group(1)))
+    return max(pages) if pages else None
+
+
+def parse_fees(html, registry=DEFAULT_REGISTRY):
+    """
+    Extract consultation types and fees from a profile page.
+
+    Returns (types, fees, found), where `found` is False when the page has no profile cards at all.
+    """
+    layout, cards = registry.match(parse_html(html), PROFILE)
+    types, fees = fees_of(cards, layout)
+    return types, fees, bool(cards)
+
+
+def fees_of(cards, layout=LAYOUTS[0]):
+    types = []
+    fees = []
+    for card in cards:
+        for name, tag in zip(layout.select('fee_name', card), layout.select('fee_tag', card)):
+            types.append(text_of(name))
+            fees.append(text_of(tag))
+    return types, fees
+
+
+def parse_address(html, registry=DEFAULT_REGISTRY):
+    """
+    Extract the address blocks from the "Carte et informations d'accès" card of a profile page.
+
+    Returns (address, found), where `found` is False when the page has no profile cards at all.
+    """
+    layout, cards = registry.match(parse_html(html), PROFILE)
+    return address_of(cards, layout), bool(cards)
+
+
+def address_of(cards, layout=LAYOUTS[0]):
+    address = []
+    for card in cards:
+        for title in layout.select('address_title', card):
+            if text_of(title) == ADDRESS_TITLE_TEXT:
+                address_divs = layout.select('address_text', card)
+                if address_divs:
+                    address.append(text_of(address_divs[0]))
+    return address
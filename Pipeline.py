@@ -0,0 +1,199 @@
+from Backends import make_backend
+from CheckpointStore import open_checkpoint
+from CrawlLedger import EMPTY, FAILED
+from DriverPool import DriverPool, run_in_pool
+from Pacing import PacingMetrics
+from PageCache import report_default_cache
+from ProfileExtractor import PROFILE_FIELDS, check_fields
+from ProfileIndex import default_index
+from RateLimiter import HostRateLimiter
+from RetryEngine import MISSING_SELECTOR, GaveUp, RetryEngine
+from RunReport import write_run_report
+
+# Listing pages failing in a row after which the listing is abandoned, e.g. when no browser can be started
+MAX_FAILED_PAGES = 3
+
+
+def listing_is_empty(result):
+    return result is not None and not result[0] and not result[1]
+
+
+def fetch_listing_page(pool, url, scrape=None):
+    """
+    Scrape one listing page through `pool`, with retries, and return (links, names, last_page).
+
+    A page still without result cards after its retries is past the last page: it is
+    returned empty instead of failing.
+    """
+    scrape = scrape or (lambda backend, url: backend.scrape_listing_page(url))
+    try:
+        return pool.run(scrape, url, is_empty=listing_is_empty)
+    except GaveUp as e:
+        if e.kind == MISSING_SELECTOR:
+            return [], [], None
+        raise
+
+
+def listing_stage(pool, store, docteur, localisation, max_empty_pages=2, base_url=None):
+    """
+    Stream the {'Name', 'Link'} records of a query: first the ones recorded by earlier
+    runs, then the ones found on the listing pages that are not recorded yet.
+    """
+    base_url = base_url or f'https://www.doctolib.fr/{docteur}/{localisation}?page='
+    ledger = store.ledger
+
+    yield from store.iter_listing()
+
+    empty_page_count = 0
+    failed_page_count = 0
+    page_number = ledger.first_unfinished_page(docteur, localisation)
+    known_last_page = ledger.last_page(docteur, localisation)
+    if page_number > 1 and (known_last_page is None or page_number <= known_last_page):
+        print(f"Resuming from page {page_number}")
+
+    while empty_page_count < max_empty_pages:
+        if known_last_page is not None and page_number > known_last_page:
+            print(f"Reached the last page ({known_last_page}).")
+            break
+        # Pages recorded by an earlier run are not fetched again
+        if ledger.page_done(docteur, localisation, page_number):
+            empty_page_count = 0
+            page_number += 1
+            continue
+
+        url = base_url + str(page_number)
+        print(f"Opening URL: {url}")
+        ledger.start_page(docteur, localisation, page_number)
+
+        try:
+            links, names, last_page = fetch_listing_page(pool, url)
+        except Exception as e:
+            ledger.finish_page(docteur, localisation, page_number, FAILED)
+            print(f"Error scraping page: {e}")
+            failed_page_count += 1
+            if failed_page_count >= MAX_FAILED_PAGES:
+                print(f"{MAX_FAILED_PAGES} pages failed in a row. Stopping the listing.")
+                break
+            page_number += 1
+            continue
+        failed_page_count = 0
+        if last_page is not None and last_page != known_last_page:
+            known_last_page = last_page
+            ledger.record_last_page(docteur, localisation, last_page)
+
+        if not links and not names:
+            ledger.finish_page(docteur, localisation, page_number, EMPTY)
+            empty_page_count += 1
+            print(f"No data found on page {page_number}. Empty page count: {empty_page_count}")
+        else:
+            empty_page_count = 0
+            print(f"Found {len(links)} links and {len(names)} names on this page.")
+            store.record_page(docteur, localisation, page_number, names, links)
+            for name, link in zip(names, links):
+                yield {'Name': name, 'Link': link}
+
+        page_number += 1
+
+    print('Listing completed.')
+
+
+def profile_stage(records, pool, store, fields=PROFILE_FIELDS, max_in_flight=None):
+    """
+    Enrich a stream of records with the profile `fields`, fanned out to the backends of `pool`.
+
+    Each profile is loaded once and every field not done in the ledger is read from
+    that page. Links with every field done in the ledger and links already in flight are
+    passed through without a request, in their turn, so nothing piles up however many
+    of them there are. Records come out in completion order.
+
+    Parameters:
+        records (iterable): Upstream stream of dicts with at least a 'Link' key.
+        pool (DriverPool): Pool of backends shared by every stage.
+        store (CheckpointStore): Checkpoint receiving the results and ledger updates.
+        fields (tuple): Profile fields to read, among ProfileExtractor.FIELD_EXTRACTORS.
+    """
+    ledger = store.ledger
+    # Links in flight only: once recorded, the ledger tells that they are done
+    in_flight = set()
+
+    def pending():
+        for record in records:
+            link = record.get('Link')
+            link_fields = store.pending_fields(link, fields) if link and link not in in_flight else []
+            if not link_fields:
+                yield (record, None), None
+                continue
+            in_flight.add(link)
+            for field in link_fields:
+                ledger.start_profile(link, field)
+            yield (record, link_fields), (link, link_fields)
+
+    def scrape(backend, item):
+        link, link_fields = item
+        return backend.scrape_profile(link, link_fields)
+
+    for (record, link_fields), data, error in run_in_pool(pool, pending(), scrape, max_in_flight):
+        if link_fields is None:
+            yield record
+            continue
+        link = record['Link']
+        in_flight.discard(link)
+        if error is not None:
+            store.fail_profile(link, link_fields, error)
+            print(f"Error processing {link}: {error}")
+        else:
+            store.record_profile_fields(link, link_fields, data)
+            if data:
+                print(f"Scraped {', '.join(data)} for {link}: {data}")
+                for values in data.values():
+                    record = {**record, **values}
+            else:
+                print(f"No profile data found for {link}.")
+        yield record
+
+
+def run_pipeline(docteur, localisation, driver_factory, engine=None, fields=PROFILE_FIELDS,
+                 workers=1, min_interval=None, file_path=None, max_empty_pages=2, base_url=None, cache=None,
+                 index=None):
+    """
+    Listing, then the profile fields, in one process: one driver pool, one checkpoint
+    and one stream of records from the listing to the workbook.
+
+    Parameters:
+        docteur (str): Type of doctor, e.g. psychologue.
+        localisation (str): Location, e.g. france.
+        driver_factory (callable): Function returning a new WebDriver.
+        engine (str): Extraction backend, 'selenium' or 'http'.
+        fields (tuple): Profile fields to read, among ProfileExtractor.FIELD_EXTRACTORS.
+        workers (int): Number of backends in the shared pool.
+        min_interval (float): Minimum number of seconds between two requests to Doctolib.
+        file_path (str): Workbook to write. Defaults to {docteur}_{localisation}.xlsx.
+        max_empty_pages (int): Empty listing pages in a row after which the listing is considered finished.
+        base_url (str): Listing URL without the page number. Defaults to the Doctolib search of the query.
+        cache (PageCache): Page cache of the run. Defaults to the process-wide cache.
+        index (ProfileIndex): Profile index of the run. Defaults to the process-wide index.
+    """
+    fields = check_fields(fields)
+    file_path = file_path or f'{docteur}_{localisation}.xlsx'.replace(' ', '_')
+    metrics = PacingMetrics()
+    store = open_checkpoint(file_path, index if index is not None else default_index(), metrics)
+    # Profiles already scraped for another query are joined in bulk instead of fetched
+    store.pending_profiles(fields)
+    rate_limiter = HostRateLimiter(min_interval)
+    retry = RetryEngine(rate_limiter)
+
+    with DriverPool(workers, lambda: make_backend(engine, driver_factory, rate_limiter, metrics, cache),
+                    retry=retry) as pool:
+        records = listing_stage(pool, store, docteur, localisation, max_empty_pages, base_url)
+        records = profile_stage(records, pool, store, fields)
+        count = sum(1 for _ in records)
+
+    print(f'Scraping completed: {count} records.')
+    store.report_dead_letters()
+    metrics.report()
+    report_default_cache()
+
+    store.export_excel(file_path)
+    store.close()
+    write_run_report(metrics, file_path, **pool.stats())
+    return file_path
@@ -0,0 +1,98 @@
+import csv
+import os
+import re
+import unicodedata
+from collections import namedtuple
+
+# Offline list of French places: region, department code, department, city
+PLACES_PATH = os.environ.get('DOCTOLIB_PLACES',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), 'places_fr.csv'))
+
+Place = namedtuple('Place', 'region department_code department city')
+
+# Localisations covering every place of the list
+COUNTRY = ('france',)
+# Levels a broad localisation can be split at
+CITY = 'city'
+DEPARTMENT = 'department'
+
+
+def slugify(text):
+    """
+    Localisation as written in the Doctolib URLs: lower case, without accents, words joined by dashes.
+    """
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+
+def load_places(path=PLACES_PATH):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [Place(**row) for row in csv.DictReader(f)]
+
+
+def departments(places=None):
+    """
+    (department, region) of every department code of the place list.
+    """
+    return {place.department_code: (place.department, place.region)
+            for place in (load_places() if places is None else places)}
+
+
+class QueryPlanner:
+    """
+    Split a broad localisation into the sub-queries of the places it covers.
+
+    A Doctolib listing is one serial chain of pages, and the site stops serving pages
+    well before the end of a broad query, so `psychologue/france` is both slow and
+    incomplete. The planner expands the country or a region (by name) into its
+    departments, which cover it entirely; a department, by name or code, is its own
+    sub-query, and so is any other localisation, e.g. a city. A department whose listing
+    still reaches the page cap is saturated and refined into the cities of the place
+    list. The cities are crawled in addition to the department, as the list only has
+    its prefecture and largest cities. Sub-queries overlap at their borders, the crawl
+    merges their profiles by URL.
+
+    Parameters:
+        places (list): Places to plan with. Defaults to the bundled place list.
+    """
+
+    def __init__(self, places=None):
+        self.places = load_places() if places is None else places
+
+    def covered(self, localisation):
+        """
+        Places covered by `localisation`, or [] when it is not a country, region or department of the list.
+        """
+        slug = slugify(localisation)
+        if slug in COUNTRY:
+            return list(self.places)
+        for key in ('region', 'department', 'department_code'):
+            places = [place for place in self.places if slugify(getattr(place, key)) == slug]
+            if places:
+                return places
+        return []
+
+    def plan(self, localisation):
+        """
+        Localisations of the sub-queries of `localisation`: its departments, in the order of the place list.
+
+        Parameters:
+            localisation (str): Location of the query, e.g. france, bretagne, 59 or lille.
+        """
+        places = self.covered(localisation)
+        if not places:
+            return [slugify(localisation)]
+        return list(dict.fromkeys(slugify(place.department) for place in places))
+
+    def refine(self, shard, level=CITY):
+        """
+        Finer sub-queries of a saturated sub-query `shard`, [] when it cannot be split further.
+
+        Parameters:
+            shard (str): Sub-query returned by plan, e.g. nord.
+            level (str): Finest kind of place to split into: CITY, or DEPARTMENT to never refine.
+        """
+        if level != CITY:
+            return []
+        cities = (place.city for place in self.places if slugify(place.department) == shard)
+        return [city for city in dict.fromkeys(slugify(city) for city in cities) if city != shard]
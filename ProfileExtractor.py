@@ -0,0 +1,64 @@
+import PageParser
+from SelectorRegistry import DEFAULT_REGISTRY, PROFILE
+
+# Field name -> function reading the profile cards of a page and returning the values to record
+FIELD_EXTRACTORS = {}
+
+
+def field_extractor(name):
+    """
+    Register the decorated function as the extractor of the profile field `name`.
+
+    The function receives the profile cards of a page (lxml elements) and the
+    SelectorRegistry.Layout they matched, and returns the dict recorded for that field, or an empty dict when the page has no such data.
+    Every registered field is read from the same page load, so a new field costs no
+    extra request.
+    """
+    def register(function):
+        FIELD_EXTRACTORS[name] = function
+        return function
+    return register
+
+
+@field_extractor('fees')
+def extract_fees(cards, layout):
+    types, fees = PageParser.fees_of(cards, layout)
+    return {'types': types, 'fees': fees} if types or fees else {}
+
+
+@field_extractor('address')
+def extract_address(cards, layout):
+    address = PageParser.address_of(cards, layout)
+    return {'address': " ".join(address)} if address else {}
+
+
+# Fields read from a profile page when a scraper is not told otherwise
+PROFILE_FIELDS = tuple(FIELD_EXTRACTORS)
+
+
+def check_fields(fields):
+    """
+    Raise ValueError when `fields` names a field without an extractor, listing the valid ones.
+    """
+    unknown = [field for field in fields if field not in FIELD_EXTRACTORS]
+    if unknown:
+        raise ValueError(f"Unknown profile field(s): {', '.join(unknown)}. "
+                         f"Valid fields: {', '.join(FIELD_EXTRACTORS)}")
+    return tuple(fields)
+
+
+def extract_profile(html, fields=None, registry=DEFAULT_REGISTRY):
+    """
+    Run the extractors of `fields` against one profile page, read with the first layout of `registry` it matches.
+
+    Returns (data, found): `data` maps each field that had a value to its dict, and
+    `found` is the SelectorRegistry.Layout the profile cards matched, None when the page has none at all.
+    """
+    fields = check_fields(fields or PROFILE_FIELDS)
+    layout, cards = registry.match(PageParser.parse_html(html), PROFILE)
+    data = {}
+    for field in fields:
+        values = FIELD_EXTRACTORS[field](cards, layout)
+        if values:
+            data[field] = values
+    return data, layout
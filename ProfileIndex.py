@@ -0,0 +1,120 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Index of every profile scraped by any run, for any query and workbook; an empty value disables it
+DEFAULT_INDEX_PATH = os.environ.get('DOCTOLIB_PROFILE_INDEX', 'doctolib.profiles.db')
+# Keys looked up per query, below SQLite's limit on bound parameters
+LOOKUP_CHUNK = 500
+# Query parameters that track or decorate a visit without changing the profile shown
+# (the practice of a practitioner, pid=practice-..., does change it)
+TRACKING_PARAMETERS = ('utm_', 'gclid', 'fbclid', 'msclkid', 'xtor', 'highlight')
+
+
+def profile_key(url):
+    """
+    Canonical key of a profile link: host and path, lower-cased, without fragment,
+    trailing slash or tracking parameters, so the same practice of a practitioner found
+    through different listings maps to one entry. The other query parameters, e.g. the
+    practice (pid), are kept, sorted, since fees and address belong to one practice.
+    """
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith(TRACKING_PARAMETERS)
+    ))
+    key = parts.netloc.lower() + (parts.path.rstrip('/') or '/').lower()
+    return f'{key}?{query}' if query else key
+
+
+class ProfileIndex:
+    """
+    Profile fields shared across runs and workbooks, keyed by canonical profile link.
+
+    Every field recorded in a checkpoint is also recorded here, so enriching a new
+    workbook (another specialty or city) only fetches the profiles the index does not
+    know yet; the others are joined in from the index in bulk.
+
+    Parameters:
+        path (str): Location of the SQLite database.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS index_profiles (
+                key TEXT,
+                field TEXT,
+                link TEXT,
+                data TEXT,
+                updated_at REAL,
+                PRIMARY KEY (key, field)
+            );
+        ''')
+        self.conn.commit()
+
+    def record(self, items):
+        """
+        Record (link, field, data) triples, replacing what was known for the same profile and field.
+        """
+        now = time.time()
+        rows = [(profile_key(link), field, link, json.dumps(data, ensure_ascii=False), now)
+                for link, field, data in items]
+        with self._lock, self.conn:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO index_profiles (key, field, link, data, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+
+    def lookup(self, links, fields):
+        """
+        Known values of `fields` for `links`, as {link: {field: data}}. Unknown links are left out.
+        """
+        links_by_key = {}
+        for link in links:
+            links_by_key.setdefault(profile_key(link), []).append(link)
+        keys = list(links_by_key)
+        field_placeholders = ', '.join('?' for _ in fields)
+
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                rows = self.conn.execute(f'''
+                    SELECT key, field, data FROM index_profiles
+                    WHERE key IN ({', '.join('?' for _ in chunk)}) AND field IN ({field_placeholders})
+                ''', (*chunk, *fields))
+                for key, field, data in rows:
+                    for link in links_by_key[key]:
+                        found.setdefault(link, {})[field] = json.loads(data)
+        return found
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(DISTINCT key) FROM index_profiles').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def default_index():
+    """
+    The index shared by every checkpoint of the process, or None when DOCTOLIB_PROFILE_INDEX is empty.
+    """
+    global _default_index
+    if not DEFAULT_INDEX_PATH:
+        return None
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = ProfileIndex(DEFAULT_INDEX_PATH)
+    return _default_index
@@ -0,0 +1,96 @@
+import argparse
+import os
+import time
+
+from Backends import make_backend
+from CheckpointStore import changes_path, open_checkpoint
+from DriverFactory import make_driver
+from DriverPool import DriverPool, run_in_pool
+from Pacing import PacingMetrics
+from PageCache import report_default_cache
+from ProfileExtractor import PROFILE_FIELDS
+from ProfileIndex import default_index
+from RateLimiter import HostRateLimiter
+from RetryEngine import RetryEngine
+from RunReport import write_run_report
+
+# Profiles visited by a refresh when no budget is given, None for every due profile
+DEFAULT_BUDGET = int(os.environ['DOCTOLIB_REFRESH_BUDGET']) if os.environ.get('DOCTOLIB_REFRESH_BUDGET') else None
+
+
+def refresh_profiles(file_path, budget=DEFAULT_BUDGET, engine=None, driver_factory=make_driver, workers=1,
+                     min_interval=None, cache=None, index=None):
+    """
+    Incremental refresh of the profiles of an existing workbook.
+
+    Profiles are visited most likely changed first (see RefreshSchedule.due) until the
+    page budget is spent, always from the site rather than the page cache. Each visit
+    reads every profile field and is compared with the recorded values through its
+    fingerprint: unchanged profiles only get their check time updated, changed ones get
+    their new values appended to the checkpoint and logged. The workbook is exported
+    again only if something changed, along with the changes workbook of the run (see
+    CheckpointStore.export_changes).
+
+    Parameters:
+        file_path (str): Workbook to refresh, e.g. psychologue_france.xlsx.
+        budget (int): Maximum number of profiles visited. None visits every due profile.
+        engine (str): Extraction backend, 'selenium' or 'http'.
+        driver_factory (callable): Function returning a new WebDriver.
+        workers (int): Number of backends in the pool.
+        min_interval (float): Minimum number of seconds between two requests to Doctolib.
+        cache (PageCache): Page cache receiving the refreshed pages. Defaults to the process-wide cache.
+        index (ProfileIndex): Profile index of the run. Defaults to the process-wide index.
+
+    Returns the number of changed profiles.
+    """
+    metrics = PacingMetrics()
+    store = open_checkpoint(file_path, index if index is not None else default_index(), metrics)
+    fingerprinted = store.fingerprint_profiles()
+    if fingerprinted:
+        print(f"Fingerprinted {fingerprinted} profile(s) recorded before the first refresh.")
+    due = store.refresh.due(budget)
+    print(f"Refreshing {len(due)} profile(s)" + (f", likeliest change {due[0][1]:.0%}." if due else "."))
+
+    started_at = time.time()
+    changed = 0
+    rate_limiter = HostRateLimiter(min_interval)
+    with DriverPool(workers, lambda: make_backend(engine, driver_factory, rate_limiter, metrics, cache),
+                    retry=RetryEngine(rate_limiter)) as pool:
+        def scrape(backend, link):
+            # A refresh reads the page as it is now, never a cached copy
+            return backend.scrape_profile(link, PROFILE_FIELDS, max_age=0)
+
+        for link, data, error in run_in_pool(pool, ((link, link) for link, _ in due), scrape):
+            if error is not None:
+                # The profile keeps its values and its rank, the next refresh visits it again
+                print(f"Error refreshing {link}: {error}")
+                continue
+            changes = store.record_refresh(link, data)
+            if changes:
+                changed += 1
+                print(f"Changed {', '.join(field for field, _, _ in changes)} for {link}.")
+
+    print(f'Refresh completed: {changed} of {len(due)} profile(s) changed.')
+    metrics.report()
+    report_default_cache()
+    if changed:
+        store.export_changes(changes_path(file_path), started_at)
+        store.export_excel(file_path)
+    store.close()
+    write_run_report(metrics, file_path, refresh={'due': len(due), 'changed': changed}, **pool.stats())
+    return changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Refresh the profiles of a Doctolib workbook most likely to have changed.')
+    parser.add_argument('file_path', help='workbook to refresh, e.g. psychologue_france.xlsx')
+    parser.add_argument('--budget', type=int, default=DEFAULT_BUDGET, help='maximum number of profiles visited')
+    parser.add_argument('--engine', choices=('selenium', 'http'))
+    parser.add_argument('--workers', type=int, default=1, help='number of backends')
+    parser.add_argument('--min-interval', type=float, help='seconds between two requests')
+    args = parser.parse_args(argv)
+    refresh_profiles(args.file_path, args.budget, args.engine, workers=args.workers, min_interval=args.min_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import os
+
+from AsyncCrawler import PREFETCH_WINDOW, ListingScheduler, enrich_profiles
+from Backends import make_backend
+from CheckpointStore import open_checkpoint
+from DriverFactory import make_driver
+from DriverPool import DriverPool
+from Pacing import PacingMetrics
+from PageCache import report_default_cache
+from PlaceList import CITY, DEPARTMENT, QueryPlanner
+from ProfileExtractor import PROFILE_FIELDS
+from ProfileIndex import default_index
+from RateLimiter import HostRateLimiter
+from RetryEngine import RetryEngine
+from RunReport import write_run_report
+
+# Sub-queries whose listings are crawled at the same time
+PARALLEL_SHARDS = int(os.environ.get('DOCTOLIB_PARALLEL_SHARDS', 4))
+# Listing pages the site serves for one query: a sub-query whose listing reaches it is saturated
+PAGE_CAP = int(os.environ.get('DOCTOLIB_PAGE_CAP', 50))
+
+
+def saturated(ledger, docteur, shard, page_cap=PAGE_CAP):
+    """
+    Whether the listing of the sub-query `shard` reached the page cap, by its pagination or its recorded pages.
+    """
+    pages = max(ledger.last_page(docteur, shard) or 0, ledger.last_done_page(docteur, shard) or 0)
+    return pages >= page_cap
+
+
+async def crawl_plan(pool, store, docteur, shards, parallel=PARALLEL_SHARDS, window=PREFETCH_WINDOW, workers=2,
+                     max_empty_pages=2, base_url=None, fields=PROFILE_FIELDS, planner=None, level=CITY,
+                     page_cap=PAGE_CAP):
+    """
+    Crawl the listings of the sub-queries `shards`, `parallel` of them at a time, and enrich
+    every profile found, sharing `pool` and its rate limit.
+
+    A sub-query whose listing reaches `page_cap` is saturated: it is refined by `planner`
+    down to `level` and its finer sub-queries are crawled too. Every sub-query has its own
+    pages in the ledger, so an interrupted run resumes each of them where it stopped. A
+    profile listed by several sub-queries is enriched once.
+
+    Returns (crawled, incomplete): every sub-query crawled, and the saturated ones that
+    could not be split further, whose listing may miss profiles.
+
+    Parameters:
+        base_url (str): Listing URL without the page number, with {docteur} and {localisation}
+            placeholders. Defaults to the Doctolib search of each sub-query.
+        planner (QueryPlanner): Planner refining the saturated sub-queries. Defaults to one on the bundled place list.
+    """
+    planner = planner or QueryPlanner()
+    records = asyncio.Queue(maxsize=workers * 20)
+    enrichment = asyncio.ensure_future(enrich_profiles(records, pool, store, workers, fields))
+    slots = asyncio.Semaphore(max(1, parallel))
+    crawled = list(dict.fromkeys(shards))
+    incomplete = []
+
+    async def crawl_shard(shard):
+        async with slots:
+            print(f"Sub-query {crawled.index(shard) + 1}/{len(crawled)}: {docteur}/{shard}")
+            url = base_url.format(docteur=docteur, localisation=shard) if base_url else None
+            await ListingScheduler(pool, store, docteur, shard, window, max_empty_pages, url).run(records)
+        # Outside of its slot, so the finer sub-queries can take it
+        if not saturated(store.ledger, docteur, shard, page_cap):
+            return
+        finer = [place for place in planner.refine(shard, level) if place not in crawled]
+        if not finer:
+            incomplete.append(shard)
+            print(f"{docteur}/{shard} reached the page cap ({page_cap}) and cannot be split further: "
+                  f"its listing may be incomplete.")
+            return
+        print(f"{docteur}/{shard} reached the page cap ({page_cap}): crawling its {len(finer)} cities too.")
+        crawled.extend(finer)
+        await asyncio.gather(*(crawl_shard(place) for place in finer))
+
+    for link in store.pending_profiles(fields):
+        await records.put((None, link))
+
+    try:
+        await asyncio.gather(*(crawl_shard(shard) for shard in list(crawled)))
+    finally:
+        for _ in range(workers):
+            await records.put(None)
+        await enrichment
+    return crawled, incomplete
+
+
+def run_planned_query(docteur, localisation, level=CITY, parallel=PARALLEL_SHARDS, workers=4, engine=None,
+                      driver_factory=make_driver, min_interval=None, file_path=None, max_empty_pages=2,
+                      base_url=None, fields=PROFILE_FIELDS, planner=None, page_cap=PAGE_CAP):
+    """
+    Listing and profile fields of a broad query, crawled as the sub-queries of its departments
+    and merged into one workbook.
+
+    Parameters:
+        docteur (str): Type of doctor, e.g. psychologue.
+        localisation (str): Location, e.g. france.
+        level (str): CITY to refine the saturated departments into their cities, DEPARTMENT not to.
+        parallel (int): Sub-queries crawled at the same time.
+        workers (int): Number of backends in the shared pool, and of profiles enriched at the same time.
+        engine (str): Extraction backend, 'selenium' or 'http'.
+        driver_factory (callable): Function returning a new WebDriver.
+        min_interval (float): Minimum number of seconds between two requests to Doctolib, across all sub-queries.
+        file_path (str): Workbook to write. Defaults to {docteur}_{localisation}.xlsx.
+        max_empty_pages (int): Empty listing pages in a row after which a sub-query is considered finished.
+        base_url (str): Listing URL template, see crawl_plan.
+        fields (tuple): Profile fields to read, among ProfileExtractor.FIELD_EXTRACTORS.
+        planner (QueryPlanner): Planner of the sub-queries. Defaults to one on the bundled place list.
+        page_cap (int): Listing pages the site serves for one query, see crawl_plan.
+    """
+    file_path = file_path or f'{docteur}_{localisation}.xlsx'.replace(' ', '_')
+    planner = planner or QueryPlanner()
+    shards = planner.plan(localisation)
+    print(f"{docteur}/{localisation} split into {len(shards)} sub-queries, {parallel} at a time.")
+
+    metrics = PacingMetrics()
+    store = open_checkpoint(file_path, default_index(), metrics)
+    rate_limiter = HostRateLimiter(min_interval)
+    with DriverPool(workers, lambda: make_backend(engine, driver_factory, rate_limiter, metrics),
+                    retry=RetryEngine(rate_limiter)) as pool:
+        crawled, incomplete = asyncio.run(crawl_plan(
+            pool, store, docteur, shards, parallel, workers=workers, max_empty_pages=max_empty_pages,
+            base_url=base_url, fields=fields, planner=planner, level=level, page_cap=page_cap))
+
+    rows, profiles = store.listing_counts()
+    print(f"Scraping completed: {profiles} profiles from {rows} listing rows over {len(crawled)} sub-queries.")
+    if incomplete:
+        print(f"{len(incomplete)} sub-queries reached the page cap and may miss profiles: {', '.join(incomplete)}")
+    store.report_dead_letters()
+    metrics.report()
+    report_default_cache()
+
+    store.export_excel(file_path)
+    store.close()
+    write_run_report(metrics, file_path, plan={'shards': len(crawled), 'refined': len(crawled) - len(shards),
+                                               'incomplete': incomplete, 'rows': rows, 'profiles': profiles},
+                     **pool.stats())
+    return file_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Crawl a broad Doctolib query as sub-queries of its departments.')
+    parser.add_argument('docteur', help='type of doctor, e.g. psychologue')
+    parser.add_argument('localisation', help='country, region, department or city, e.g. france')
+    parser.add_argument('--level', choices=(CITY, DEPARTMENT), default=CITY,
+                        help='finest kind of place the saturated departments are split into')
+    parser.add_argument('--parallel', type=int, default=PARALLEL_SHARDS, help='sub-queries crawled at the same time')
+    parser.add_argument('--engine', choices=('selenium', 'http'))
+    parser.add_argument('--workers', type=int, default=4, help='number of backends')
+    parser.add_argument('--min-interval', type=float, help='seconds between two requests')
+    parser.add_argument('--plan', action='store_true', help='print the sub-queries and exit')
+    args = parser.parse_args(argv)
+
+    docteur, localisation = args.docteur.lower(), args.localisation.lower()
+    if args.plan:
+        for shard in QueryPlanner().plan(localisation):
+            print(shard)
+        return
+    file_path = run_planned_query(docteur, localisation, args.level, args.parallel, args.workers, args.engine,
+                                  min_interval=args.min_interval)
+    print(f"Updated Excel file saved to {file_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+# Seconds between two requests to the same host, unless the operator configures otherwise
+DEFAULT_MIN_INTERVAL = float(os.environ.get('DOCTOLIB_MIN_INTERVAL', 3.0))
+
+
+class HostRateLimiter:
+    """
+    Politeness budget shared by every worker of a run, as one token bucket per host.
+
+    Each host bucket refills at one token every `min_interval` seconds and holds at
+    most `burst` tokens. With the default burst of 1, requests to the same host are
+    spaced by at least `min_interval` seconds no matter how many workers are fetching
+    in parallel; time a request does not use (a page that was ready early) is not
+    lost, it is what lets the next request go out without sleeping.
+
+    Parameters:
+        min_interval (float): Minimum number of seconds between two requests to the same host.
+        burst (int): Number of requests allowed back to back after an idle period.
+        clock (callable): Monotonic time in seconds. Defaults to time.monotonic.
+        sleep (callable): Function sleeping for a number of seconds. Defaults to time.sleep.
+    """
+
+    def __init__(self, min_interval=None, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.min_interval = DEFAULT_MIN_INTERVAL if min_interval is None else min_interval
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def refill(self, bucket, now):
+        # Tokens at `now` of a (tokens, updated_at) bucket, a new bucket being full
+        if bucket is None or self.min_interval <= 0:
+            return self.burst
+        tokens, updated_at = bucket
+        return min(self.burst, tokens + (now - updated_at) / self.min_interval)
+
+    def take(self, bucket, now):
+        """
+        Reserve one token of `bucket` at `now`. Returns the tokens left and the time at which the token is available.
+        """
+        tokens = self.refill(bucket, now) - 1
+        if tokens >= 0:
+            return tokens, now
+        return tokens, now - tokens * self.min_interval
+
+    def hold(self, bucket, now, seconds):
+        """
+        Tokens left in `bucket` at `now` once the next token is pushed `seconds` away.
+        """
+        return min(self.refill(bucket, now), 1 - seconds / self.min_interval)
+
+    def _take(self, host):
+        # Reserve one token and return the time at which it becomes available
+        now = self.clock()
+        tokens, slot = self.take(self._buckets.get(host), now)
+        self._buckets[host] = (tokens, now)
+        return slot
+
+    def wait(self, url):
+        """
+        Block until a request to the host of `url` is allowed, then consume its token.
+
+        Returns the number of seconds spent waiting.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            slot = self._take(host)
+        delay = slot - self.clock()
+        if delay > 0:
+            self.sleep(delay)
+            return delay
+        return 0.0
+
+    def backoff(self, url, seconds):
+        """
+        Keep every worker away from the host of `url` for `seconds`, e.g. after an error.
+        """
+        host = urlparse(url).netloc
+        if self.min_interval <= 0:
+            return
+        with self._lock:
+            now = self.clock()
+            self._buckets[host] = (self.hold(self._buckets.get(host), now, seconds), now)
+
+
+class SharedRateLimiter(HostRateLimiter):
+    """
+    HostRateLimiter whose buckets are kept by a work queue, so that every process serving
+    the queue, on this machine or another, draws from the same budget per host.
+
+    Parameters:
+        queue (WorkQueue): Queue keeping the buckets, see WorkQueue.update_bucket.
+        min_interval (float): Minimum number of seconds between two requests to the same host, across all processes.
+        burst (int): Number of requests allowed back to back after an idle period.
+        sleep (callable): Function sleeping for a number of seconds. Defaults to time.sleep.
+    """
+
+    def __init__(self, queue, min_interval=None, burst=1, sleep=time.sleep):
+        # The time of the buckets is the one of the queue
+        super().__init__(min_interval, burst, sleep=sleep)
+        self.queue = queue
+
+    def wait(self, url):
+        slot, now = self.queue.update_bucket(urlparse(url).netloc, self.take)
+        delay = slot - now
+        if delay > 0:
+            self.sleep(delay)
+            return delay
+        return 0.0
+
+    def backoff(self, url, seconds):
+        if self.min_interval > 0:
+            self.queue.update_bucket(urlparse(url).netloc, lambda bucket, now: (self.hold(bucket, now, seconds), None))
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import math
+import os
+import time
+
+# Mean seconds between two changes of a profile, assumed until changes are observed
+PRIOR_CHANGE_INTERVAL = float(os.environ.get('DOCTOLIB_PRIOR_CHANGE_DAYS', 60)) * 24 * 3600
+# Profiles checked more recently than this are never due for a refresh
+MIN_REFRESH_AGE = float(os.environ.get('DOCTOLIB_MIN_REFRESH_HOURS', 24)) * 3600
+
+
+def profile_values(data):
+    """
+    Values of a profile as compared by a refresh: the fields merged into one dict, empty values left out.
+
+    `data` is either {field: values}, as returned by the backends' scrape_profile, or
+    already merged values, as returned by CheckpointStore.profile_results.
+    """
+    merged = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            merged.update(value)
+        else:
+            merged[key] = value
+    return {key: value for key, value in merged.items() if value not in (None, '', [])}
+
+
+def fingerprint(values):
+    """
+    Content fingerprint of the values extracted from a profile page (fees, address, ...).
+    """
+    canonical = json.dumps(profile_values(values), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def change_probability(checks, changes, first_seen, checked_at, now, prior_interval=PRIOR_CHANGE_INTERVAL):
+    """
+    Probability that a profile changed since it was last checked.
+
+    Changes are modelled as a Poisson process whose rate is the number of changes
+    observed over the time the profile has been watched, smoothed by one change every
+    `prior_interval` seconds so a profile seen twice without a change is not written off.
+    """
+    observed = max(0.0, checked_at - first_seen) if checks else 0.0
+    rate = (changes + 1) / (observed + prior_interval)
+    return 1 - math.exp(-rate * max(0.0, now - checked_at))
+
+
+class RefreshSchedule:
+    """
+    Content fingerprints of the profiles of a checkpoint and the log of their changes.
+
+    Every profile keeps the fingerprint of its recorded values, when it was first seen,
+    last checked and last changed, and how many of its checks found a change. `due`
+    ranks profiles by the probability that they changed since their last check, so a
+    refresh with a limited page budget visits the profiles most likely to be stale.
+
+    Parameters:
+        conn (sqlite3.Connection): Connection to the checkpoint database.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS profile_fingerprints (
+                link TEXT PRIMARY KEY,
+                fingerprint TEXT,
+                first_seen REAL,
+                checked_at REAL,
+                changed_at REAL,
+                checks INTEGER DEFAULT 0,
+                changes INTEGER DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS profile_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                link TEXT,
+                field TEXT,
+                before TEXT,
+                after TEXT,
+                changed_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS profile_changes_changed_at ON profile_changes (changed_at);
+        ''')
+        self.conn.commit()
+
+    def fingerprint_of(self, link):
+        row = self.conn.execute('SELECT fingerprint FROM profile_fingerprints WHERE link = ?', (link,)).fetchone()
+        return row[0] if row else None
+
+    def backfill(self, results, seen_at):
+        """
+        Fingerprint the profiles recorded before they had a fingerprint, as checked when they were recorded.
+
+        Parameters:
+            results (dict): Recorded values by link, see CheckpointStore.profile_results.
+            seen_at (dict): Time each link was last recorded.
+
+        Returns the number of profiles fingerprinted.
+        """
+        known = {link for (link,) in self.conn.execute('SELECT link FROM profile_fingerprints')}
+        rows = [(link, fingerprint(values), seen_at[link], seen_at[link])
+                for link, values in results.items() if link not in known and link in seen_at]
+        with self.conn:
+            self.conn.executemany('''
+                INSERT INTO profile_fingerprints (link, fingerprint, first_seen, checked_at) VALUES (?, ?, ?, ?)
+            ''', rows)
+        return len(rows)
+
+    def due(self, budget=None, now=None, min_age=MIN_REFRESH_AGE):
+        """
+        Profiles to visit, most likely changed first, as (link, probability) pairs.
+
+        Parameters:
+            budget (int): Maximum number of profiles returned. None returns every due profile.
+            now (float): Time of the refresh. Defaults to now.
+            min_age (float): Profiles checked less than `min_age` seconds ago are left out.
+        """
+        now = time.time() if now is None else now
+        ranked = [
+            (link, change_probability(checks, changes, first_seen, checked_at, now))
+            for link, first_seen, checked_at, checks, changes in self.conn.execute('''
+                SELECT link, first_seen, checked_at, checks, changes FROM profile_fingerprints WHERE checked_at <= ?
+            ''', (now - min_age,))
+        ]
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked if budget is None else ranked[:budget]
+
+    def _observe(self, link, new_fingerprint, changed, now):
+        # Part of the caller's transaction, see CheckpointStore.record_refresh
+        self.conn.execute('''
+            INSERT INTO profile_fingerprints (link, fingerprint, first_seen, checked_at, changed_at, checks, changes)
+            VALUES (?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT (link) DO UPDATE SET
+                fingerprint = excluded.fingerprint,
+                checked_at = excluded.checked_at,
+                changed_at = COALESCE(excluded.changed_at, changed_at),
+                checks = checks + 1,
+                changes = changes + excluded.changes
+        ''', (link, new_fingerprint, now, now, now if changed else None, int(changed)))
+
+    def _log_changes(self, link, changes, now):
+        self.conn.executemany(
+            'INSERT INTO profile_changes (link, field, before, after, changed_at) VALUES (?, ?, ?, ?, ?)',
+            [(link, field, json.dumps(before, ensure_ascii=False), json.dumps(after, ensure_ascii=False), now)
+             for field, before, after in changes]
+        )
+
+    def changes(self, since=0.0):
+        """
+        Changes logged since `since`, as (link, field, before, after, changed_at) tuples, oldest first.
+        """
+        return [
+            (link, field, json.loads(before), json.loads(after), changed_at)
+            for link, field, before, after, changed_at in self.conn.execute('''
+                SELECT link, field, before, after, changed_at FROM profile_changes
+                WHERE changed_at >= ? ORDER BY id
+            ''', (since,))
+        ]
@@ -0,0 +1,191 @@
+import random
+import threading
+import time
+
+import requests
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from DriverHealth import is_session_lost
+
+# Failure classes
+TIMEOUT = 'timeout'
+EMPTY = 'empty'
+MISSING_SELECTOR = 'missing_selector'
+LAYOUT_CHANGED = 'layout_changed'
+CRASH = 'crash'
+ERROR = 'error'
+
+# Failures of the transport or of the browser, the only unexpected errors retried: any
+# other exception is a bug of the scraper, and retrying it would only slow the host down
+TRANSIENT_ERRORS = (requests.RequestException, WebDriverException, OSError)
+
+
+class RetryPolicy:
+    """
+    How one class of failure is retried.
+
+    Parameters:
+        attempts (int): Total number of attempts, the first one included.
+        base_delay (float): Seconds before the first retry, doubled on every retry.
+        max_delay (float): Longest delay between two attempts.
+        host_backoff (bool): Keep every worker away from the host during the delay, for
+            failures that may come from the site being overloaded or throttling us.
+    """
+
+    def __init__(self, attempts, base_delay, max_delay=60.0, host_backoff=False):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.host_backoff = host_backoff
+
+    def delay(self, retry):
+        # Exponential backoff with jitter, so workers failing together do not retry together
+        delay = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+DEFAULT_POLICIES = {
+    TIMEOUT: RetryPolicy(3, 2.0, host_backoff=True),
+    EMPTY: RetryPolicy(2, 3.0),
+    # The page loaded without the container: an empty listing, typically past its last page,
+    # or a page still rendering. Nothing tells the host is overloaded, it is not backed off.
+    MISSING_SELECTOR: RetryPolicy(2, 5.0),
+    # Retrying cannot help until the selector registry knows the new markup
+    LAYOUT_CHANGED: RetryPolicy(1, 0.0),
+    CRASH: RetryPolicy(2, 1.0),
+    ERROR: RetryPolicy(2, 2.0, host_backoff=True),
+}
+
+
+class MissingSelector(Exception):
+    """
+    The page loaded but never showed the container the backend reads.
+    """
+
+    def __init__(self, url, selector):
+        super().__init__(f"{selector} not found on {url}")
+        self.url = url
+        self.selector = selector
+
+
+class PageTimeout(Exception):
+    """
+    The page did not finish loading within the ready timeout.
+    """
+
+    def __init__(self, url, timeout):
+        super().__init__(f"{url} did not load within {timeout:.0f}s")
+        self.url = url
+        self.timeout = timeout
+
+
+class LayoutChanged(MissingSelector):
+    """
+    The page matched none of the known layouts, like the pages before it: the markup changed.
+    """
+
+
+class GaveUp(Exception):
+    """
+    Every attempt allowed by the policy of `kind` failed; `error` is the last failure.
+    """
+
+    def __init__(self, kind, attempts, error):
+        super().__init__(f"{kind} after {attempts} attempt(s): {error}")
+        self.kind = kind
+        self.attempts = attempts
+        self.error = error
+
+
+def classify(error):
+    """
+    Failure class of an exception raised while scraping a page, None when it is not retried.
+    """
+    if isinstance(error, LayoutChanged):
+        return LAYOUT_CHANGED
+    if isinstance(error, MissingSelector):
+        return MISSING_SELECTOR
+    if isinstance(error, (TimeoutException, requests.Timeout, PageTimeout)):
+        return TIMEOUT
+    if is_session_lost(error):
+        return CRASH
+    if isinstance(error, TRANSIENT_ERRORS):
+        return ERROR
+    return None
+
+
+class RetryEngine:
+    """
+    Retry a page fetch according to the class of its failure.
+
+    Timeouts, missing containers, crashed browsers and transport errors are retried
+    with their own exponential backoff; pages of a changed layout are not retried, and
+    any other exception, a bug of the scraper, is raised at once. For the classes that
+    may come from the site being overloaded (timeouts and transport errors, not a loaded
+    page without results), the delay is applied to the host through the shared rate
+    limiter, so the whole run slows down instead of one worker hammering. A result
+    found empty is retried as well, and returned as is once its attempts are used up.
+
+    Parameters:
+        rate_limiter (HostRateLimiter): Limiter shared by the run, used for host backoffs.
+        policies (dict): RetryPolicy by failure class. Defaults to DEFAULT_POLICIES.
+    """
+
+    def __init__(self, rate_limiter=None, policies=None):
+        self.rate_limiter = rate_limiter
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+        self._lock = threading.Lock()
+        self.retries = {}
+        self.gave_up = {}
+
+    def call(self, fetch, url=None, is_empty=None):
+        """
+        Call fetch() until it succeeds or the policy of its failure class is exhausted.
+
+        Parameters:
+            fetch (callable): Function fetching the page, without arguments.
+            url (str): URL fetched, for the host backoff.
+            is_empty (callable): Optional predicate telling whether a result is empty.
+
+        Raises:
+            GaveUp: when every attempt allowed for the last failure class failed.
+        """
+        attempts = {}
+        while True:
+            try:
+                result = fetch()
+            except Exception as e:
+                kind, error, result = classify(e), e, None
+                if kind is None:
+                    raise
+            else:
+                if is_empty is None or not is_empty(result):
+                    return result
+                kind, error = EMPTY, None
+
+            attempts[kind] = attempts.get(kind, 0) + 1
+            policy = self.policies[kind]
+            if attempts[kind] >= policy.attempts:
+                self._count(self.gave_up, kind)
+                if error is None:
+                    return result
+                raise GaveUp(kind, attempts[kind], error) from error
+
+            self._count(self.retries, kind)
+            delay = policy.delay(attempts[kind])
+            print(f"Retrying {url or 'page'} in {delay:.1f}s ({kind}, attempt {attempts[kind] + 1}/{policy.attempts})")
+            if policy.host_backoff and url and self.rate_limiter is not None and self.rate_limiter.min_interval > 0:
+                # The next request to the host, this retry included, waits for the delay
+                self.rate_limiter.backoff(url, delay)
+            else:
+                time.sleep(delay)
+
+    def _count(self, counts, kind):
+        with self._lock:
+            counts[kind] = counts.get(kind, 0) + 1
+
+    def report(self):
+        if self.retries or self.gave_up:
+            retries = ', '.join(f"{count} {kind}" for kind, count in self.retries.items()) or 'none'
+            gave_up = ', '.join(f"{count} {kind}" for kind, count in self.gave_up.items()) or 'none'
+            print(f"Retries: {retries}. Given up: {gave_up}.")
@@ -0,0 +1,128 @@
+import json
+import math
+import os
+import time
+
+from Pacing import SLOWEST_URLS, STAGES, WAITING_STAGES
+from PageCache import default_cache_counts
+from SelectorRegistry import DEFAULT_REGISTRY
+
+# Optional Prometheus text file written at the end of a run, e.g. for the node_exporter textfile collector
+PROMETHEUS_PATH = os.environ.get('DOCTOLIB_PROMETHEUS_FILE', '')
+QUANTILES = (0.5, 0.95, 0.99)
+
+# What a run is bound by when most of its time goes to a stage
+BOUND_BY = {
+    'throttle': 'rate limit',
+    'navigation': 'network and browser navigation',
+    'wait': 'browser rendering',
+    'extraction': 'page reading and parsing',
+    'persistence': 'checkpoint and workbook writes',
+}
+
+
+def report_path(file_path):
+    """
+    JSON run report kept next to the Excel file of the run.
+    """
+    return os.path.splitext(file_path)[0] + '.report.json'
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile `q` (0 to 1) of sorted `values`, 0 when there are none.
+    """
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def run_report(metrics, **sections):
+    """
+    Machine-readable summary of a run.
+
+    For every stage: total seconds, number of URLs that went through it and the
+    percentiles of the time each URL spent in it, over the sample kept by `metrics`. Also the counters of the run
+    (WebDriver commands, bytes read and written), the slowest URLs, the share of time
+    spent waiting and the stage the run is bound by. `sections` are added as they are,
+    e.g. the retry or cache counts.
+
+    Parameters:
+        metrics (PacingMetrics): Metrics shared by the backends and the checkpoint of the run.
+    """
+    stages = {}
+    for stage in STAGES:
+        values = metrics.stage_times(stage)
+        stages[stage] = {
+            'seconds': round(metrics.seconds[stage], 3),
+            'urls': metrics.stage_urls(stage),
+            **{f'p{round(q * 100)}': round(percentile(values, q), 4) for q in QUANTILES},
+        }
+
+    total = sum(metrics.seconds.values())
+    waiting = sum(metrics.seconds[stage] for stage in WAITING_STAGES)
+    slowest = metrics.slowest(SLOWEST_URLS)
+    finished_at = time.time()
+    return {
+        'started_at': metrics.started_at,
+        'finished_at': finished_at,
+        'wall_seconds': round(finished_at - metrics.started_at, 3),
+        'pages': metrics.pages,
+        'urls': metrics.urls,
+        'stages': stages,
+        'waiting_share': round(waiting / total, 4) if total else 0.0,
+        'bound_by': BOUND_BY[max(STAGES, key=metrics.seconds.get)] if total else None,
+        'counters': dict(metrics.counters),
+        'slowest_urls': [
+            {'url': url, **{stage: round(seconds, 4) for stage, seconds in timings.items()}}
+            for url, timings in slowest
+        ],
+        **sections,
+    }
+
+
+def prometheus_text(report, prefix='doctolib'):
+    """
+    Prometheus text exposition of a run report: one summary per stage and one counter per run counter.
+    """
+    lines = [
+        f'# HELP {prefix}_stage_seconds Time spent per URL in each stage of the run.',
+        f'# TYPE {prefix}_stage_seconds summary',
+    ]
+    for stage, stats in report['stages'].items():
+        for q in QUANTILES:
+            lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} {stats[f"p{round(q * 100)}"]}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {stats["seconds"]}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {stats["urls"]}')
+
+    counters = {'pages': report['pages'], **report['counters']}
+    for name, value in counters.items():
+        lines.append(f'# TYPE {prefix}_{name}_total counter')
+        lines.append(f'{prefix}_{name}_total {value}')
+    lines.append(f'# TYPE {prefix}_run_wall_seconds gauge')
+    lines.append(f'{prefix}_run_wall_seconds {report["wall_seconds"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_run_report(metrics, file_path, prometheus_path=None, **sections):
+    """
+    Write the JSON report of a run next to `file_path` and, when `prometheus_path`
+    (DOCTOLIB_PROMETHEUS_FILE by default) is set, its Prometheus text. Returns the report.
+    """
+    cache = default_cache_counts()
+    if cache is not None:
+        sections.setdefault('cache', cache)
+    sections.setdefault('layouts', DEFAULT_REGISTRY.counts())
+    report = run_report(metrics, **sections)
+    path = report_path(file_path)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Run report saved to {path} (bound by {report['bound_by'] or 'nothing'}).")
+
+    prometheus_path = PROMETHEUS_PATH if prometheus_path is None else prometheus_path
+    if prometheus_path:
+        # Written aside and renamed, so a collector never reads a partial file
+        with open(prometheus_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(prometheus_text(report))
+        os.replace(prometheus_path + '.tmp', prometheus_path)
+    return report
@@ -0,0 +1,249 @@
+import os
+import re
+import threading
+import time
+
+from lxml.cssselect import CSSSelector
+
+from Pacing import READY_POLL
+from RetryEngine import LayoutChanged, MissingSelector, PageTimeout
+
+# Kinds of pages and the element telling that a layout matches them
+LISTING = 'listing'
+PROFILE = 'profile'
+READY_ELEMENT = {LISTING: 'listing_card', PROFILE: 'profile_card'}
+
+# Seconds a page may still take to render its content once the document is loaded
+LAYOUT_GRACE = float(os.environ.get('DOCTOLIB_LAYOUT_GRACE', 2))
+# Pages of a kind in a row matching no known layout after which the markup is considered changed.
+# Only pages that rendered something count: blank pages and listing pages past their last page do not.
+DRIFT_PAGES = int(os.environ.get('DOCTOLIB_LAYOUT_DRIFT_PAGES', 5))
+# Element telling that a page rendered content, the app root or anything else than scripts
+CONTENT_ELEMENT = 'body > :not(script):not(noscript):not(style)'
+# Page number of a listing URL, and of the links of its pagination
+PAGE_PARAMETER = re.compile(r'[?&]page=(\d+)')
+
+# Index of the first of arguments[0] present in the page (-1 if none) and the document state, in one call.
+# When none is present, also whether arguments[1] is (the page has content) and the last page linked.
+PROBE_SCRIPT = '''
+const selectors = arguments[0];
+for (let i = 0; i < selectors.length; i++) {
+    if (document.querySelector(selectors[i])) return [i, document.readyState, true, null];
+}
+let lastPage = null;
+for (const link of document.querySelectorAll('a[href]')) {
+    const match = /[?&]page=(\\d+)/.exec(link.getAttribute('href'));
+    if (match) lastPage = Math.max(lastPage || 0, parseInt(match[1], 10));
+}
+return [-1, document.readyState, document.querySelector(arguments[1]) !== null, lastPage];
+'''
+
+
+class Layout:
+    """
+    One version of the Doctolib markup: the CSS selector of every element the parsers read,
+    compiled once.
+
+    Parameters:
+        version (str): Name of the layout, reported when it is picked.
+        selectors (str): CSS selector of each element: listing_card, listing_link,
+            listing_name, profile_card, fee_name, fee_tag, address_title (the card titles
+            among which the address card is recognized by its text) and address_text.
+    """
+
+    def __init__(self, version, **selectors):
+        self.version = version
+        self.css = selectors
+        self._compiled = {name: CSSSelector(css) for name, css in selectors.items()}
+
+    def select(self, name, element):
+        """
+        Elements under `element` matching the selector `name`.
+        """
+        return self._compiled[name](element)
+
+    def __repr__(self):
+        return f'Layout({self.version!r})'
+
+
+# Known layouts, tried in this order. When Doctolib changes its markup, add the new one first.
+LAYOUTS = (
+    Layout(
+        'v1',
+        listing_card='.dl-flex-row.dl-justify-between.dl-align-items-start',
+        listing_link='a.dl-p-doctor-result-link.dl-full-width.dl-flex-center',
+        listing_name='div.dl-layout-item.dl-layout-size-xs-12 h2.dl-text.dl-text-body.dl-text-bold.dl-text-s.dl-text-primary-110',
+        profile_card='.dl-profile-card-content',
+        fee_name='.dl-profile-fee-name',
+        fee_tag='.dl-profile-fee-tag',
+        address_title='h2.dl-profile-card-title.dl-text-title',
+        address_text='.dl-profile-text',
+    ),
+    # The same components without their utility classes, which change far more often than the component names
+    Layout(
+        'v1-loose',
+        listing_card='.dl-flex-row.dl-justify-between',
+        listing_link='a.dl-p-doctor-result-link',
+        listing_name='h2',
+        profile_card='.dl-profile-card-content',
+        fee_name='.dl-profile-fee-name',
+        fee_tag='.dl-profile-fee-tag',
+        address_title='h2',
+        address_text='.dl-profile-text',
+    ),
+)
+
+
+class SelectorRegistry:
+    """
+    The known layouts of the Doctolib pages, and which of them the pages of a run match.
+
+    A browser page is probed for every layout in one WebDriver call; once the document is
+    loaded it gets `grace` more seconds to render, instead of the full ready timeout.
+    After `drift_pages` pages of a kind in a row matching none of the layouts, the markup
+    is considered changed: pages of that kind are probed once, without grace, and fail
+    with LayoutChanged, which is not retried. Only pages with content count towards it:
+    a blank page, or a listing page past the last page announced by its pagination (or by
+    an earlier page of the same listing), is an empty result rather than a new markup.
+
+    Parameters:
+        layouts (tuple): Layouts to try, in order.
+        grace (float): Seconds a loaded page may take to render its content.
+        drift_pages (int): Pages in a row without a known layout after which the markup is considered changed.
+    """
+
+    def __init__(self, layouts=LAYOUTS, grace=LAYOUT_GRACE, drift_pages=DRIFT_PAGES):
+        self.layouts = tuple(layouts)
+        self.grace = grace
+        self.drift_pages = drift_pages
+        self._lock = threading.Lock()
+        self._misses = {LISTING: 0, PROFILE: 0}
+        self._last_pages = {}
+        self.matched = {}
+        self.unmatched = {}
+        self._content = CSSSelector(CONTENT_ELEMENT)
+
+    def ready_selectors(self, kind):
+        return [layout.css[READY_ELEMENT[kind]] for layout in self.layouts]
+
+    def match(self, tree, kind):
+        """
+        First layout whose ready element is in the parsed page `tree`, with the elements found, or (None, []).
+        """
+        for layout in self.layouts:
+            elements = layout.select(READY_ELEMENT[kind], tree)
+            if elements:
+                return layout, elements
+        return None, []
+
+    def has_content(self, tree):
+        """
+        Whether the parsed page `tree` rendered anything else than scripts.
+        """
+        return bool(self._content(tree))
+
+    def note_last_page(self, url, last_page):
+        """
+        Remember the last page announced by the pagination of the listing page `url`.
+        """
+        if last_page is None:
+            return
+        key = PAGE_PARAMETER.sub('', url)
+        with self._lock:
+            self._last_pages[key] = max(last_page, self._last_pages.get(key, last_page))
+
+    def past_end(self, url, last_page=None):
+        """
+        Whether the listing page `url` is past the last page known for its listing, or `last_page`.
+        """
+        match = PAGE_PARAMETER.search(url or '')
+        if match is None:
+            return False
+        known = [page for page in (last_page, self._last_pages.get(PAGE_PARAMETER.sub('', url))) if page is not None]
+        return bool(known) and int(match.group(1)) > max(known)
+
+    def record(self, kind, layout, url=None, content=True, last_page=None):
+        """
+        Account a page of `kind` that matched `layout`, or none of the layouts when it is None.
+
+        A page matching none counts towards the drift only if it has `content`, and, for a
+        listing page, if `url` is not past the last page (`last_page` being the one its
+        own pagination shows, if any).
+        """
+        with self._lock:
+            if layout is not None:
+                self._misses[kind] = 0
+                self.matched[layout.version] = self.matched.get(layout.version, 0) + 1
+                return
+            self.unmatched[kind] = self.unmatched.get(kind, 0) + 1
+        if not content or (kind == LISTING and self.past_end(url, last_page)):
+            return
+        with self._lock:
+            self._misses[kind] += 1
+            if self._misses[kind] == self.drift_pages:
+                print(f"No known layout matched the last {self.drift_pages} {kind} pages: the markup has "
+                      f"probably changed, {kind} pages now fail after one probe. See SelectorRegistry.LAYOUTS.")
+
+    def drifted(self, kind):
+        return self._misses[kind] >= self.drift_pages
+
+    def probe(self, driver, kind):
+        """
+        Layout of the page open in `driver` (None if no layout matches yet) and the document state, in one call,
+        with whether the page has content and the last page its links point to.
+        """
+        index, state, content, last_page = driver.execute_script(
+            PROBE_SCRIPT, self.ready_selectors(kind), CONTENT_ELEMENT)
+        return (self.layouts[index] if index >= 0 else None), state, content, last_page
+
+    def wait_for_layout(self, driver, kind, timeout, poll=READY_POLL, url=None):
+        """
+        Probe the page open in `driver` until a layout matches.
+
+        Returns (layout, loaded): `layout` is None once the document has been loaded for
+        `grace` seconds (immediately when the markup is considered changed) or after
+        `timeout` seconds, and `loaded` tells whether the document finished loading.
+        A page that never loaded is not accounted as matching no layout.
+        """
+        deadline = time.monotonic() + timeout
+        loaded_at = None
+        while True:
+            layout, state, content, last_page = self.probe(driver, kind)
+            if layout is not None:
+                break
+            now = time.monotonic()
+            if state == 'complete':
+                loaded_at = loaded_at or now
+                if self.drifted(kind) or now - loaded_at >= self.grace:
+                    break
+            if now >= deadline:
+                break
+            time.sleep(poll)
+        loaded = layout is not None or loaded_at is not None
+        if loaded:
+            self.record(kind, layout, url, content, last_page)
+        return layout, loaded
+
+    def missing(self, url, kind, timeout=None):
+        """
+        Exception for a page of `kind` matching no layout: LayoutChanged once the markup is considered changed.
+
+        With a `timeout`, the page did not finish loading in that many seconds: PageTimeout.
+        """
+        if timeout is not None:
+            return PageTimeout(url, timeout)
+        selectors = ' or '.join(self.ready_selectors(kind))
+        if self.drifted(kind):
+            return LayoutChanged(url, selectors)
+        return MissingSelector(url, selectors)
+
+    def counts(self):
+        """
+        Pages matched by each layout version and pages of each kind that matched none.
+        """
+        with self._lock:
+            return {'matched': dict(self.matched), 'unmatched': dict(self.unmatched)}
+
+
+# Registry shared by every backend of the process
+DEFAULT_REGISTRY = SelectorRegistry()
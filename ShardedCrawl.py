@@ -0,0 +1,344 @@
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from Backends import make_backend
+from CheckpointStore import open_checkpoint
+from CrawlLedger import EMPTY, FAILED
+from DriverFactory import make_driver
+from DriverPool import DriverPool
+from Pacing import PacingMetrics
+from Pipeline import MAX_FAILED_PAGES, fetch_listing_page
+from ProfileExtractor import PROFILE_FIELDS
+from ProfileIndex import default_index
+from RateLimiter import SharedRateLimiter
+from RetryEngine import GaveUp, RetryEngine
+from RunReport import write_run_report
+from WorkQueue import DEAD, LEASE_SECONDS, open_queue
+
+# Kinds of work items
+LISTING = 'listing'
+PROFILE = 'profile'
+# Seconds between two looks at the queue when there is nothing to do
+POLL_INTERVAL = 1.0
+# Seconds between two progress lines of the coordinator
+PROGRESS_INTERVAL = 30
+# Seconds between two heartbeats of the coordinator in the queue
+HEARTBEAT_INTERVAL = 10
+# Seconds without a heartbeat after which an idle worker considers the coordinator gone and exits
+COORDINATOR_TIMEOUT = float(os.environ.get('DOCTOLIB_COORDINATOR_TIMEOUT', 120))
+
+
+def process_item(pool, item):
+    """
+    Fetch one work item with a backend of `pool` and return its result, as stored in the queue.
+    """
+    if item.kind == LISTING:
+        links, names, last_page = fetch_listing_page(pool, item.key)
+        return {'links': links, 'names': names, 'last_page': last_page}
+    fields = item.payload['fields']
+    return {'data': pool.run(lambda backend, link: backend.scrape_profile(link, fields), item.key)}
+
+
+def run_worker(file_path, queue_url=None, engine=None, workers=1, min_interval=None, worker_id=None,
+               lease_seconds=LEASE_SECONDS, coordinator_timeout=COORDINATOR_TIMEOUT):
+    """
+    Serve the work queue of the workbook `file_path` until the coordinator marks it complete,
+    or stops beating.
+
+    Each worker process owns a driver pool of `workers` backends, each of them leasing one
+    item at a time, fetching it and acking its result. A worker that crashes leaves its
+    leases behind; they expire after `lease_seconds` and go to another worker. A worker
+    without items exits once the coordinator has not beaten for `coordinator_timeout`
+    seconds, or never did within that time of the worker's start, e.g. because it died
+    before marking the queue complete.
+
+    Parameters:
+        file_path (str): Workbook of the crawl, naming its queue.
+        queue_url (str): Work queue, see WorkQueue.open_queue.
+        engine (str): Extraction backend, 'selenium' or 'http'.
+        workers (int): Backends of this process.
+        min_interval (float): Minimum number of seconds between two requests to Doctolib, across every
+            worker of the queue: the rate limit buckets are kept in the queue and shared.
+        worker_id (str): Name of the worker in the queue. Defaults to host name and process id.
+        lease_seconds (float): Seconds an item stays owned by this worker.
+        coordinator_timeout (float): Seconds without a heartbeat of the coordinator after which an idle worker exits.
+    """
+    queue = open_queue(queue_url, file_path)
+    started_at = time.monotonic()
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    rate_limiter = SharedRateLimiter(queue, min_interval)
+    metrics = PacingMetrics()
+    processed = []
+    gone = threading.Event()
+
+    def serve(pool):
+        while True:
+            items = queue.lease(worker_id, 1, lease_seconds)
+            if not items:
+                if queue.complete():
+                    return
+                age = queue.coordinator_age()
+                if (age if age is not None else time.monotonic() - started_at) > coordinator_timeout:
+                    gone.set()
+                    return
+                time.sleep(POLL_INTERVAL)
+                continue
+            item = items[0]
+            try:
+                result = process_item(pool, item)
+            except Exception as e:
+                queue.fail(item, e)
+                print(f"[{worker_id}] Error processing {item.key}: {e}")
+                continue
+            queue.ack(item, result)
+            processed.append(item.id)
+
+    print(f"[{worker_id}] Serving the queue with {workers} backend(s).")
+    with DriverPool(workers, lambda: make_backend(engine, make_driver, rate_limiter, metrics),
+                    retry=RetryEngine(rate_limiter)) as pool:
+        threads = [threading.Thread(target=serve, args=(pool,)) for _ in range(pool.size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    if gone.is_set():
+        print(f"[{worker_id}] No heartbeat from the coordinator for {coordinator_timeout:.0f}s, "
+              f"stopping after {len(processed)} item(s) processed.")
+    else:
+        print(f"[{worker_id}] Queue complete, {len(processed)} item(s) processed.")
+    metrics.report()
+    queue.close()
+
+
+class Coordinator:
+    """
+    Feed the work queue of a sharded crawl and merge what the workers return into the checkpoint.
+
+    The coordinator owns the checkpoint: it queues listing pages (all of them once the
+    pagination announced the last page, one after the other otherwise), queues the
+    profiles found on them with the fields still missing, and records every collected
+    result in the ledger and the checkpoint, exactly as a single-process run would.
+    Items given up by the workers become failed pages and dead profiles.
+
+    Parameters:
+        queue (WorkQueue): Queue shared with the workers.
+        store (CheckpointStore): Checkpoint of the workbook.
+        docteur (str): Type of doctor, e.g. psychologue.
+        localisation (str): Location, e.g. france.
+        fields (tuple): Profile fields to read, among ProfileExtractor.FIELD_EXTRACTORS.
+        base_url (str): Listing URL without the page number. Defaults to the Doctolib search of the query.
+        max_empty_pages (int): Empty listing pages in a row after which the listing is considered finished.
+    """
+
+    def __init__(self, queue, store, docteur, localisation, fields=PROFILE_FIELDS, base_url=None, max_empty_pages=2):
+        self.queue = queue
+        self.store = store
+        self.docteur = docteur
+        self.localisation = localisation
+        self.fields = fields
+        self.base_url = base_url or f'https://www.doctolib.fr/{docteur}/{localisation}?page='
+        self.max_empty_pages = max_empty_pages
+        self.last_page = None
+        self.queued_pages = set()
+        self.seen = set()
+        self.empty_page_count = 0
+        self.failed_page_count = 0
+        self.merged = 0
+
+    def queue_page(self, page):
+        ledger = self.store.ledger
+        while ledger.page_done(self.docteur, self.localisation, page):
+            page += 1
+        if page in self.queued_pages or (self.last_page is not None and page > self.last_page):
+            return
+        self.queued_pages.add(page)
+        ledger.start_page(self.docteur, self.localisation, page)
+        # Listing pages go first, they feed the rest of the queue
+        self.queue.put(LISTING, [(self.base_url + str(page), {'page': page})], priority=1)
+
+    def queue_profiles(self, links):
+        items = []
+        for link in links:
+            if link in self.seen:
+                continue
+            self.seen.add(link)
+            link_fields = self.store.pending_fields(link, self.fields)
+            if link_fields:
+                for field in link_fields:
+                    self.store.ledger.start_profile(link, field)
+                items.append((link, {'fields': list(link_fields)}))
+        self.queue.put(PROFILE, items)
+
+    def seed(self):
+        """
+        Queue the first listing page not recorded yet and the profiles of the checkpoint still missing fields.
+        """
+        ledger = self.store.ledger
+        self.queue.mark_complete(False)
+        self.queue.beat()
+        first_page = ledger.first_unfinished_page(self.docteur, self.localisation)
+        # The last page announced to an earlier run bounds the listing, its pages are queued at once
+        self.last_page = ledger.last_page(self.docteur, self.localisation)
+        for page in range(first_page, (self.last_page or first_page) + 1):
+            self.queue_page(page)
+        self.queue_profiles(self.store.pending_profiles(self.fields))
+
+    def merge_listing(self, result):
+        ledger = self.store.ledger
+        page = result.payload['page']
+        if result.status == DEAD:
+            ledger.finish_page(self.docteur, self.localisation, page, FAILED)
+            print(f"Error scraping page {page}: {result.error['message']}")
+            self.failed_page_count += 1
+            if self.last_page is None and self.failed_page_count < MAX_FAILED_PAGES:
+                self.queue_page(page + 1)
+            return
+        self.failed_page_count = 0
+
+        links, names, last_page = result.result['links'], result.result['names'], result.result['last_page']
+        if last_page is not None and (self.last_page is None or last_page > self.last_page):
+            self.last_page = last_page
+            ledger.record_last_page(self.docteur, self.localisation, last_page)
+            for following in range(page + 1, last_page + 1):
+                self.queue_page(following)
+
+        if not links and not names:
+            ledger.finish_page(self.docteur, self.localisation, page, EMPTY)
+            self.empty_page_count += 1
+            print(f"No data found on page {page}. Empty page count: {self.empty_page_count}")
+            if self.last_page is None and self.empty_page_count < self.max_empty_pages:
+                self.queue_page(page + 1)
+            return
+        self.empty_page_count = 0
+        print(f"Found {len(links)} links and {len(names)} names on page {page}.")
+        self.store.record_page(self.docteur, self.localisation, page, names, links)
+        self.queue_profiles(links)
+        if self.last_page is None:
+            self.queue_page(page + 1)
+
+    def merge_profile(self, result):
+        link, fields = result.key, result.payload['fields']
+        if result.status == DEAD:
+            error = result.error or {}
+            # Failures the retries gave up on are dead letters, the others (e.g. expired leases) are retried later
+            failure = (GaveUp(error['kind'], result.attempts, error['message']) if error.get('kind')
+                       else RuntimeError(error.get('message')))
+            self.store.fail_profile(link, fields, failure)
+            print(f"Error processing {link}: {failure}")
+            return
+        self.store.record_profile_fields(link, fields, result.result['data'])
+
+    def run(self):
+        """
+        Merge the results of the workers until every queued item is collected, then mark the queue complete.
+        Beats in the queue meanwhile, so idle workers know the coordinator is still alive.
+        """
+        last_progress = last_beat = time.monotonic()
+        while True:
+            if time.monotonic() - last_beat > HEARTBEAT_INTERVAL:
+                last_beat = time.monotonic()
+                self.queue.beat()
+            results = self.queue.collect()
+            for result in results:
+                if result.kind == LISTING:
+                    self.merge_listing(result)
+                else:
+                    self.merge_profile(result)
+            self.merged += len(results)
+            if not results:
+                if self.queue.outstanding() == 0:
+                    break
+                time.sleep(POLL_INTERVAL)
+            if time.monotonic() - last_progress > PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                print(f"Merged {self.merged} result(s), queue: {self.queue.counts()}")
+        self.queue.mark_complete()
+        print(f"Merged {self.merged} result(s) from the workers.")
+
+
+def crawl_sharded(docteur, localisation, processes=2, workers=1, engine=None, fields=PROFILE_FIELDS,
+                  min_interval=None, queue_url=None, file_path=None, base_url=None, max_empty_pages=2):
+    """
+    Listing and profile fields of a query, sharded over worker processes through a work queue,
+    merged into the workbook by this process.
+
+    `processes` local workers are started; workers on other machines can join with
+    `run_worker` on the same queue (a redis:// queue, see WorkQueue.open_queue). With
+    `processes=0` the coordinator only waits for such remote workers.
+
+    Parameters:
+        docteur (str): Type of doctor, e.g. psychologue.
+        localisation (str): Location, e.g. france.
+        processes (int): Local worker processes.
+        workers (int): Backends of each worker process.
+        engine (str): Extraction backend, 'selenium' or 'http'.
+        fields (tuple): Profile fields to read, among ProfileExtractor.FIELD_EXTRACTORS.
+        min_interval (float): Minimum number of seconds between two requests to Doctolib, across every worker.
+        queue_url (str): Work queue, see WorkQueue.open_queue.
+        file_path (str): Workbook to write. Defaults to {docteur}_{localisation}.xlsx.
+        base_url (str): Listing URL without the page number. Defaults to the Doctolib search of the query.
+        max_empty_pages (int): Empty listing pages in a row after which the listing is considered finished.
+    """
+    file_path = file_path or f'{docteur}_{localisation}.xlsx'.replace(' ', '_')
+    metrics = PacingMetrics()
+    queue = open_queue(queue_url, file_path)
+    store = open_checkpoint(file_path, default_index(), metrics)
+    coordinator = Coordinator(queue, store, docteur, localisation, fields, base_url, max_empty_pages)
+    coordinator.seed()
+
+    # The workers share the rate limit buckets of the queue, each of them gets the overall interval
+    context = multiprocessing.get_context('spawn')
+    workers_processes = [
+        context.Process(target=run_worker, args=(file_path, queue_url, engine, workers, min_interval))
+        for _ in range(processes)
+    ]
+    for process in workers_processes:
+        process.start()
+    try:
+        coordinator.run()
+    finally:
+        queue.mark_complete()
+        for process in workers_processes:
+            process.join()
+
+    rows, profiles = store.listing_counts()
+    print(f"Scraping completed: {profiles} profiles from {rows} listing rows.")
+    store.report_dead_letters()
+    store.export_excel(file_path)
+    store.close()
+    write_run_report(metrics, file_path, queue=queue.counts(),
+                     sharded={'processes': processes, 'merged': coordinator.merged, 'rows': rows, 'profiles': profiles})
+    queue.close()
+    return file_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Crawl a Doctolib query with several worker processes or machines.')
+    subparsers = parser.add_subparsers(dest='role', required=True)
+    for role in ('coordinate', 'worker'):
+        subparser = subparsers.add_parser(role)
+        subparser.add_argument('docteur', help='type of doctor, e.g. psychologue')
+        subparser.add_argument('localisation', help='location, e.g. france')
+        subparser.add_argument('--queue', help='redis://host:port/db or SQLite path (default: next to the workbook)')
+        subparser.add_argument('--engine', choices=('selenium', 'http'))
+        subparser.add_argument('--workers', type=int, default=1, help='backends per worker process')
+        subparser.add_argument('--min-interval', type=float, help='seconds between two requests, across every worker')
+    subparsers.choices['coordinate'].add_argument('--processes', type=int, default=2, help='local worker processes')
+    args = parser.parse_args(argv)
+
+    docteur, localisation = args.docteur.lower(), args.localisation.lower()
+    file_path = f'{docteur}_{localisation}.xlsx'.replace(' ', '_')
+    if args.role == 'coordinate':
+        crawl_sharded(docteur, localisation, args.processes, args.workers, args.engine,
+                      min_interval=args.min_interval, queue_url=args.queue, file_path=file_path)
+        print(f"Updated Excel file saved to {file_path}")
+    else:
+        run_worker(file_path, args.queue, args.engine, args.workers, args.min_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,523 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+# Queue shared by the coordinator and the workers of a sharded crawl: a redis:// URL, a SQLite path, or
+# empty for a SQLite database next to the workbook
+DEFAULT_QUEUE_URL = os.environ.get('DOCTOLIB_QUEUE', '')
+# Seconds a worker owns an item before it is handed to another worker
+LEASE_SECONDS = 600
+# Leases of an item (each worker trying it) before it is given up
+MAX_ATTEMPTS = 2
+
+# Item statuses: finished items (done or dead) wait for the coordinator to collect them
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+DEAD = 'dead'
+COLLECTED = 'collected'
+
+WorkItem = namedtuple('WorkItem', 'id kind key payload attempts')
+WorkResult = namedtuple('WorkResult', 'id kind key payload status result error attempts')
+
+
+class WorkQueue(ABC):
+    """
+    Items of work shared by the processes of a sharded crawl, with lease/ack semantics.
+
+    An item is identified by (kind, key): putting it again while it is still queued has
+    no effect. A worker leases items for `lease_seconds` and acks each of them with its
+    result, or fails it. Items whose lease expired, e.g. because their worker crashed,
+    go back to the queue; after `max_attempts` leases they are dead. Done and dead items
+    stay in the queue until the coordinator collects them, so a result is never lost
+    between a worker and the workbook. The queue also keeps the rate limit buckets of the
+    hosts, shared by every worker (see RateLimiter.SharedRateLimiter).
+
+    Subclasses implement the storage; see SQLiteWorkQueue and RedisWorkQueue.
+    """
+
+    @abstractmethod
+    def put(self, kind, items, priority=0):
+        """
+        Queue (key, payload) pairs of `kind`. Items with a higher priority are leased first.
+        Collected items are queued again.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def lease(self, worker, count=1, lease_seconds=LEASE_SECONDS):
+        """
+        Hand up to `count` items to `worker`, as WorkItem tuples, reclaiming expired leases first.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def ack(self, item, result):
+        """
+        Record the result of a leased item. Returns False if the item was finished meanwhile.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def fail(self, item, error):
+        """
+        Put a leased item back in the queue, or make it dead once its attempts are used up.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def collect(self, limit=500):
+        """
+        Take up to `limit` finished items, as WorkResult tuples, and mark them collected.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def counts(self):
+        """
+        Number of items by status.
+        """
+        raise NotImplementedError
+
+    def outstanding(self):
+        """
+        Number of items not collected yet.
+        """
+        counts = self.counts()
+        return sum(count for status, count in counts.items() if status != COLLECTED)
+
+    @abstractmethod
+    def update_bucket(self, host, update):
+        """
+        Apply `update` to the rate limit bucket of `host`, atomically for every process of the queue.
+
+        `update(bucket, now)` receives the (tokens, updated_at) bucket, None for a new host,
+        and the current time, and returns the tokens to keep and a value. Returns (value, now).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def mark_complete(self, complete=True):
+        """
+        Tell the workers whether the coordinator will queue more items.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete(self):
+        """
+        Whether the coordinator marked the queue complete.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def beat(self):
+        """
+        Record that the coordinator is alive, for the workers waiting for items.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def coordinator_age(self):
+        """
+        Seconds since the coordinator last called `beat`, None when it never did.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def error_text(error):
+    # Class of the failure when the retries gave up, for the dead-letter list
+    return json.dumps({'kind': getattr(error, 'kind', None), 'message': str(error)}, ensure_ascii=False)
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    WorkQueue in a SQLite database, for the worker processes of one machine (or machines
+    sharing a local-quality filesystem). Leases are taken in IMMEDIATE transactions, so
+    two processes never lease the same item.
+
+    Parameters:
+        path (str): Location of the SQLite database.
+        max_attempts (int): Leases of an item before it is dead.
+    """
+
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Transactions are opened explicitly, to take the write lock before reading the items to lease
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS queue_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT,
+                key TEXT,
+                payload TEXT,
+                priority INTEGER DEFAULT 0,
+                status TEXT,
+                attempts INTEGER DEFAULT 0,
+                worker TEXT,
+                lease_until REAL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL,
+                UNIQUE (kind, key)
+            );
+            CREATE INDEX IF NOT EXISTS queue_items_status ON queue_items (status, priority, id);
+            CREATE TABLE IF NOT EXISTS queue_state (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                host TEXT PRIMARY KEY,
+                tokens REAL,
+                updated_at REAL
+            );
+        ''')
+
+    def _transaction(self, sql_calls):
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = sql_calls()
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+            return result
+
+    def put(self, kind, items, priority=0):
+        now = time.time()
+        rows = [(kind, key, json.dumps(payload, ensure_ascii=False), priority, PENDING, now) for key, payload in items]
+        self._transaction(lambda: self.conn.executemany('''
+            INSERT INTO queue_items (kind, key, payload, priority, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET
+                payload = excluded.payload, priority = excluded.priority, status = excluded.status, attempts = 0,
+                worker = NULL, result = NULL, error = NULL, updated_at = excluded.updated_at
+            WHERE queue_items.status = 'collected'
+        ''', rows))
+
+    def lease(self, worker, count=1, lease_seconds=LEASE_SECONDS):
+        def take():
+            now = time.time()
+            self.conn.execute('''
+                UPDATE queue_items SET
+                    status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END,
+                    error = CASE WHEN attempts >= ? THEN ? ELSE error END,
+                    worker = NULL, updated_at = ?
+                WHERE status = 'leased' AND lease_until < ?
+            ''', (self.max_attempts, self.max_attempts, error_text('lease expired'), now, now))
+            rows = self.conn.execute('''
+                SELECT id, kind, key, payload, attempts FROM queue_items
+                WHERE status = 'pending' ORDER BY priority DESC, id LIMIT ?
+            ''', (count,)).fetchall()
+            self.conn.executemany('''
+                UPDATE queue_items SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1,
+                    updated_at = ?
+                WHERE id = ?
+            ''', [(worker, now + lease_seconds, now, row[0]) for row in rows])
+            return [WorkItem(id, kind, key, json.loads(payload), attempts + 1)
+                    for id, kind, key, payload, attempts in rows]
+
+        return self._transaction(take)
+
+    def ack(self, item, result):
+        def finish():
+            return self.conn.execute('''
+                UPDATE queue_items SET status = 'done', result = ?, error = NULL, worker = NULL, updated_at = ?
+                WHERE id = ? AND status IN ('pending', 'leased')
+            ''', (json.dumps(result, ensure_ascii=False), time.time(), item.id)).rowcount == 1
+
+        return self._transaction(finish)
+
+    def fail(self, item, error):
+        self._transaction(lambda: self.conn.execute('''
+            UPDATE queue_items SET
+                status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END,
+                error = ?, worker = NULL, updated_at = ?
+            WHERE id = ? AND status = 'leased'
+        ''', (self.max_attempts, error_text(error), time.time(), item.id)))
+
+    def collect(self, limit=500):
+        def take():
+            rows = self.conn.execute('''
+                SELECT id, kind, key, payload, status, result, error, attempts FROM queue_items
+                WHERE status IN ('done', 'dead') ORDER BY id LIMIT ?
+            ''', (limit,)).fetchall()
+            self.conn.executemany("UPDATE queue_items SET status = 'collected' WHERE id = ?",
+                                  [(row[0],) for row in rows])
+            return [
+                WorkResult(id, kind, key, json.loads(payload), status, json.loads(result) if result else None,
+                           json.loads(error) if error else None, attempts)
+                for id, kind, key, payload, status, result, error, attempts in rows
+            ]
+
+        return self._transaction(take)
+
+    def counts(self):
+        with self._lock:
+            return dict(self.conn.execute('SELECT status, COUNT(*) FROM queue_items GROUP BY status'))
+
+    def update_bucket(self, host, update):
+        def apply():
+            now = time.time()
+            bucket = self.conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE host = ?', (host,)).fetchone()
+            tokens, value = update(bucket, now)
+            self.conn.execute('INSERT OR REPLACE INTO rate_buckets (host, tokens, updated_at) VALUES (?, ?, ?)',
+                              (host, tokens, now))
+            return value, now
+
+        return self._transaction(apply)
+
+    def mark_complete(self, complete=True):
+        self._transaction(lambda: self.conn.execute(
+            "INSERT OR REPLACE INTO queue_state (name, value) VALUES ('complete', ?)", (str(int(complete)),)))
+
+    def complete(self):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM queue_state WHERE name = 'complete'").fetchone()
+        return row is not None and row[0] == '1'
+
+    def beat(self):
+        self._transaction(lambda: self.conn.execute(
+            "INSERT OR REPLACE INTO queue_state (name, value) VALUES ('heartbeat', ?)", (str(time.time()),)))
+
+    def coordinator_age(self):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM queue_state WHERE name = 'heartbeat'").fetchone()
+        return time.time() - float(row[0]) if row else None
+
+    def close(self):
+        self.conn.close()
+
+
+# Lease in one server-side step: reclaim the expired leases, then pop the best pending items
+REDIS_LEASE = '''
+local prefix, now, count, lease_seconds, worker, max_attempts = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3]),
+    tonumber(ARGV[4]), ARGV[5], tonumber(ARGV[6])
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', prefix .. ':leases', '-inf', now)) do
+    redis.call('ZREM', prefix .. ':leases', id)
+    local item = prefix .. ':item:' .. id
+    if tonumber(redis.call('HGET', item, 'attempts')) >= max_attempts then
+        redis.call('HSET', item, 'status', 'dead', 'error', ARGV[7])
+        redis.call('RPUSH', prefix .. ':finished', id)
+    else
+        redis.call('HSET', item, 'status', 'pending')
+        redis.call('ZADD', prefix .. ':pending', redis.call('HGET', item, 'rank'), id)
+    end
+end
+local leased = {}
+local popped = redis.call('ZPOPMIN', prefix .. ':pending', count)
+for i = 1, #popped, 2 do
+    local id = popped[i]
+    local item = prefix .. ':item:' .. id
+    redis.call('HSET', item, 'status', 'leased', 'worker', worker)
+    redis.call('HINCRBY', item, 'attempts', 1)
+    redis.call('ZADD', prefix .. ':leases', now + lease_seconds, id)
+    table.insert(leased, id)
+end
+return leased
+'''
+
+# Finish a leased item: ARGV[3] is 'done' with the result, or 'failed' with the error
+REDIS_FINISH = '''
+local prefix, id, outcome, value, max_attempts = ARGV[1], ARGV[2], ARGV[3], ARGV[4], tonumber(ARGV[5])
+local item = prefix .. ':item:' .. id
+local status = redis.call('HGET', item, 'status')
+if outcome == 'done' then
+    if status ~= 'pending' and status ~= 'leased' then
+        return 0
+    end
+    redis.call('ZREM', prefix .. ':pending', id)
+    redis.call('HSET', item, 'status', 'done', 'result', value)
+elseif status == 'leased' then
+    if tonumber(redis.call('HGET', item, 'attempts')) >= max_attempts then
+        redis.call('HSET', item, 'status', 'dead', 'error', value)
+    else
+        redis.call('HSET', item, 'status', 'pending', 'error', value)
+        redis.call('ZADD', prefix .. ':pending', redis.call('HGET', item, 'rank'), id)
+        redis.call('ZREM', prefix .. ':leases', id)
+        return 1
+    end
+else
+    return 0
+end
+redis.call('ZREM', prefix .. ':leases', id)
+redis.call('RPUSH', prefix .. ':finished', id)
+return 1
+'''
+
+# Queue a batch of items: ARGV[2] is the priority, then (key, payload) pairs
+REDIS_PUT = '''
+local prefix, kind, priority = ARGV[1], ARGV[2], tonumber(ARGV[3])
+for i = 4, #ARGV, 2 do
+    local id = redis.call('HGET', prefix .. ':keys', kind .. '\\0' .. ARGV[i])
+    local item = id and (prefix .. ':item:' .. id)
+    if not id or redis.call('HGET', item, 'status') == 'collected' then
+        if not id then
+            id = redis.call('INCR', prefix .. ':seq')
+            item = prefix .. ':item:' .. id
+            redis.call('HSET', prefix .. ':keys', kind .. '\\0' .. ARGV[i], id)
+        end
+        -- Higher priorities first, then queue order
+        local rank = -priority * 1e12 + id
+        redis.call('DEL', item)
+        redis.call('HSET', item, 'kind', kind, 'key', ARGV[i], 'payload', ARGV[i + 1], 'status', 'pending',
+            'attempts', 0, 'rank', rank)
+        redis.call('ZADD', prefix .. ':pending', rank, id)
+    end
+end
+return 1
+'''
+
+
+class RedisWorkQueue(WorkQueue):
+    """
+    WorkQueue on a Redis server, for workers spread over several machines. Every state
+    change runs as a server-side script, so leases are atomic. Requires the `redis` package
+    and Redis 5 or later.
+
+    Parameters:
+        url (str): Server URL, e.g. redis://localhost:6379/0.
+        prefix (str): Prefix of the keys used by the queue.
+        max_attempts (int): Leases of an item before it is dead.
+        client (redis.Redis): Client to use instead of connecting to `url`, decoding responses.
+    """
+
+    def __init__(self, url, prefix='doctolib:queue', max_attempts=MAX_ATTEMPTS, client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+        self._lease = self.client.register_script(REDIS_LEASE)
+        self._finish = self.client.register_script(REDIS_FINISH)
+        self._put = self.client.register_script(REDIS_PUT)
+
+    def put(self, kind, items, priority=0):
+        args = [self.prefix, kind, priority]
+        for key, payload in items:
+            args += [key, json.dumps(payload, ensure_ascii=False)]
+        if len(args) > 3:
+            self._put(args=args)
+
+    def _items(self, ids):
+        pipeline = self.client.pipeline()
+        for id in ids:
+            pipeline.hgetall(f'{self.prefix}:item:{id}')
+        return zip(ids, pipeline.execute())
+
+    def lease(self, worker, count=1, lease_seconds=LEASE_SECONDS):
+        ids = self._lease(args=[self.prefix, time.time(), count, lease_seconds, worker, self.max_attempts,
+                                error_text('lease expired')])
+        return [WorkItem(int(id), fields['kind'], fields['key'], json.loads(fields['payload']), int(fields['attempts']))
+                for id, fields in self._items(ids)]
+
+    def ack(self, item, result):
+        return bool(self._finish(args=[self.prefix, item.id, 'done', json.dumps(result, ensure_ascii=False),
+                                       self.max_attempts]))
+
+    def fail(self, item, error):
+        self._finish(args=[self.prefix, item.id, 'failed', error_text(error), self.max_attempts])
+
+    def collect(self, limit=500):
+        pipeline = self.client.pipeline()
+        pipeline.lrange(f'{self.prefix}:finished', 0, limit - 1)
+        pipeline.ltrim(f'{self.prefix}:finished', limit, -1)
+        ids = pipeline.execute()[0]
+        results = []
+        for id, fields in self._items(ids):
+            self.client.hset(f'{self.prefix}:item:{id}', 'status', COLLECTED)
+            results.append(WorkResult(
+                int(id), fields['kind'], fields['key'], json.loads(fields['payload']), fields['status'],
+                json.loads(fields['result']) if fields.get('result') else None,
+                json.loads(fields['error']) if fields.get('error') else None, int(fields['attempts']),
+            ))
+        return results
+
+    def counts(self):
+        pipeline = self.client.pipeline()
+        for id in self.client.hvals(f'{self.prefix}:keys'):
+            pipeline.hget(f'{self.prefix}:item:{id}', 'status')
+        counts = {}
+        for status in pipeline.execute():
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def outstanding(self):
+        return (self.client.zcard(f'{self.prefix}:pending') + self.client.zcard(f'{self.prefix}:leases')
+                + self.client.llen(f'{self.prefix}:finished'))
+
+    def update_bucket(self, host, update):
+        key = f'{self.prefix}:bucket:{host}'
+
+        def apply(pipeline):
+            # The clock of the server, shared by the workers of every machine
+            seconds, microseconds = pipeline.time()
+            now = seconds + microseconds / 1e6
+            fields = pipeline.hgetall(key)
+            bucket = (float(fields['tokens']), float(fields['updated_at'])) if fields else None
+            tokens, value = update(bucket, now)
+            pipeline.multi()
+            pipeline.hset(key, mapping={'tokens': tokens, 'updated_at': now})
+            return value, now
+
+        return self.client.transaction(apply, key, value_from_callable=True)
+
+    def mark_complete(self, complete=True):
+        self.client.set(f'{self.prefix}:complete', int(complete))
+
+    def complete(self):
+        return self.client.get(f'{self.prefix}:complete') == '1'
+
+    def _server_time(self):
+        # Time of the server, the same for the coordinator and every worker whatever their clocks
+        seconds, microseconds = self.client.time()
+        return seconds + microseconds / 1e6
+
+    def beat(self):
+        self.client.set(f'{self.prefix}:heartbeat', self._server_time())
+
+    def coordinator_age(self):
+        heartbeat = self.client.get(f'{self.prefix}:heartbeat')
+        return self._server_time() - float(heartbeat) if heartbeat is not None else None
+
+    def close(self):
+        self.client.close()
+
+
+# Queue implementations by URL scheme; a path without scheme is a SQLite database
+def queue_path(file_path):
+    """
+    Work queue database kept next to the Excel file it feeds.
+    """
+    return os.path.splitext(file_path)[0] + '.queue.db'
+
+
+def open_queue(url, file_path):
+    """
+    Open the work queue of the workbook `file_path` at `url` (DOCTOLIB_QUEUE by default):
+    redis://host:port/db, sqlite:///path, a path, or empty for the SQLite queue next to the workbook.
+    """
+    url = url or DEFAULT_QUEUE_URL
+    if not url:
+        return SQLiteWorkQueue(queue_path(file_path))
+    scheme = urlsplit(url).scheme
+    if scheme == 'sqlite':
+        return SQLiteWorkQueue(url[len('sqlite://'):])
+    if scheme == 'redis':
+        # One queue per workbook on a shared server
+        return RedisWorkQueue(url, prefix=f"doctolib:queue:{os.path.splitext(os.path.basename(file_path))[0]}")
+    return SQLiteWorkQueue(url)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The scrapers live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests never read or write the page cache and profile index of the working directory
+os.environ['DOCTOLIB_CACHE'] = ''
+os.environ['DOCTOLIB_PROFILE_INDEX'] = ''
@@ -0,0 +1,194 @@
+"""
+Minimal in-memory stand-in for the Redis client used by RedisWorkQueue, for the tests.
+
+It implements the commands the queue sends, with responses decoded as strings, and runs
+each server-side script of WorkQueue as its Python port below. fakeredis is used instead
+when it is installed with Lua support.
+"""
+import time
+
+import WorkQueue
+
+
+class InMemoryRedis:
+    def __init__(self):
+        self.hashes = {}
+        self.zsets = {}
+        self.lists = {}
+        self.strings = {}
+        self.scripts = {
+            WorkQueue.REDIS_LEASE: self._lease,
+            WorkQueue.REDIS_FINISH: self._finish,
+            WorkQueue.REDIS_PUT: self._put,
+        }
+
+    # Commands
+    def hset(self, name, key=None, value=None, mapping=None, items=()):
+        fields = dict(mapping or {})
+        if key is not None:
+            fields[key] = value
+        fields.update(zip(items[::2], items[1::2]))
+        self.hashes.setdefault(name, {}).update({key: str(value) for key, value in fields.items()})
+
+    def hget(self, name, key):
+        return self.hashes.get(name, {}).get(key)
+
+    def hgetall(self, name):
+        return dict(self.hashes.get(name, {}))
+
+    def hvals(self, name):
+        return list(self.hashes.get(name, {}).values())
+
+    def hincrby(self, name, key, amount=1):
+        value = int(self.hget(name, key) or 0) + amount
+        self.hset(name, key, value)
+        return value
+
+    def zadd(self, name, mapping):
+        self.zsets.setdefault(name, {}).update({member: float(score) for member, score in mapping.items()})
+
+    def zrem(self, name, member):
+        self.zsets.get(name, {}).pop(member, None)
+
+    def zcard(self, name):
+        return len(self.zsets.get(name, {}))
+
+    def zrangebyscore(self, name, low, high):
+        return [member for member, score in self._sorted(name) if low <= score <= high]
+
+    def zpopmin(self, name, count):
+        popped = self._sorted(name)[:count]
+        for member, _ in popped:
+            self.zrem(name, member)
+        return popped
+
+    def rpush(self, name, value):
+        self.lists.setdefault(name, []).append(str(value))
+
+    def lrange(self, name, start, end):
+        values = self.lists.get(name, [])
+        return values[start:None if end == -1 else end + 1]
+
+    def ltrim(self, name, start, end):
+        self.lists[name] = self.lrange(name, start, end)
+
+    def llen(self, name):
+        return len(self.lists.get(name, []))
+
+    def incr(self, name):
+        self.strings[name] = str(int(self.strings.get(name, 0)) + 1)
+        return int(self.strings[name])
+
+    def delete(self, name):
+        for values in (self.hashes, self.zsets, self.lists, self.strings):
+            values.pop(name, None)
+
+    def set(self, name, value):
+        self.strings[name] = str(value)
+
+    def get(self, name):
+        return self.strings.get(name)
+
+    def time(self):
+        return divmod(int(time.time() * 1e6), 1000000)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def transaction(self, func, *watches, value_from_callable=False):
+        # One process: nothing can change the watched keys between the reads and the writes
+        pipeline = Pipeline(self, immediate=True)
+        value = func(pipeline)
+        results = pipeline.execute()
+        return value if value_from_callable else results
+
+    def register_script(self, script):
+        port = self.scripts[script]
+        return lambda keys=(), args=(): port(*[str(arg) for arg in args])
+
+    def close(self):
+        pass
+
+    def _sorted(self, name):
+        return sorted(self.zsets.get(name, {}).items(), key=lambda entry: (entry[1], entry[0]))
+
+    # Python ports of the scripts of WorkQueue
+    def _lease(self, prefix, now, count, lease_seconds, worker, max_attempts, error):
+        now = float(now)
+        for id in self.zrangebyscore(prefix + ':leases', float('-inf'), now):
+            self.zrem(prefix + ':leases', id)
+            item = f'{prefix}:item:{id}'
+            if int(self.hget(item, 'attempts')) >= int(max_attempts):
+                self.hset(item, mapping={'status': 'dead', 'error': error})
+                self.rpush(prefix + ':finished', id)
+            else:
+                self.hset(item, 'status', 'pending')
+                self.zadd(prefix + ':pending', {id: self.hget(item, 'rank')})
+        leased = []
+        for id, _ in self.zpopmin(prefix + ':pending', int(count)):
+            item = f'{prefix}:item:{id}'
+            self.hset(item, mapping={'status': 'leased', 'worker': worker})
+            self.hincrby(item, 'attempts')
+            self.zadd(prefix + ':leases', {id: now + float(lease_seconds)})
+            leased.append(id)
+        return leased
+
+    def _finish(self, prefix, id, outcome, value, max_attempts):
+        item = f'{prefix}:item:{id}'
+        status = self.hget(item, 'status')
+        if outcome == 'done':
+            if status not in ('pending', 'leased'):
+                return 0
+            self.zrem(prefix + ':pending', id)
+            self.hset(item, mapping={'status': 'done', 'result': value})
+        elif status == 'leased':
+            if int(self.hget(item, 'attempts')) >= int(max_attempts):
+                self.hset(item, mapping={'status': 'dead', 'error': value})
+            else:
+                self.hset(item, mapping={'status': 'pending', 'error': value})
+                self.zadd(prefix + ':pending', {id: self.hget(item, 'rank')})
+                self.zrem(prefix + ':leases', id)
+                return 1
+        else:
+            return 0
+        self.zrem(prefix + ':leases', id)
+        self.rpush(prefix + ':finished', id)
+        return 1
+
+    def _put(self, prefix, kind, priority, *pairs):
+        for key, payload in zip(pairs[::2], pairs[1::2]):
+            id = self.hget(prefix + ':keys', kind + '\0' + key)
+            if id is None or self.hget(f'{prefix}:item:{id}', 'status') == 'collected':
+                if id is None:
+                    id = str(self.incr(prefix + ':seq'))
+                    self.hset(prefix + ':keys', kind + '\0' + key, id)
+                rank = -int(priority) * 1e12 + int(id)
+                item = f'{prefix}:item:{id}'
+                self.delete(item)
+                self.hset(item, mapping={'kind': kind, 'key': key, 'payload': payload, 'status': 'pending',
+                                         'attempts': 0, 'rank': rank})
+                self.zadd(prefix + ':pending', {id: rank})
+        return 1
+
+
+class Pipeline:
+    def __init__(self, client, immediate=False):
+        self.client = client
+        self.immediate = immediate
+        self.calls = []
+
+    def multi(self):
+        self.immediate = False
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            if self.immediate:
+                return getattr(self.client, name)(*args, **kwargs)
+            self.calls.append((getattr(self.client, name), args, kwargs))
+            return self
+        return call
+
+    def execute(self):
+        results = [command(*args, **kwargs) for command, args, kwargs in self.calls]
+        self.calls = []
+        return results
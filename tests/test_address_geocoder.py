@@ -0,0 +1,87 @@
+import pandas as pd
+import pytest
+
+from AddressGeocoder import COMMUNE, CITY, POSTCODE, Gazetteer, Geocoder, default_gazetteer, parse_addresses
+
+# Rows in the layout of La Poste's "base officielle des codes postaux"
+LA_POSTE = """#Code_commune_INSEE;Nom_de_la_commune;Code_postal;Libellé_d_acheminement;Ligne_5;_geopoint
+59599;TOURCOING;59200;TOURCOING;;50.7239,3.1612
+59350;LILLE;59000;LILLE;;50.6311,3.0468
+59298;HELLEMMES LILLE;59260;LILLE;HELLEMMES;50.6270,3.1100
+59343;LEZENNES;59260;LEZENNES;;50.6150,3.1160
+59527;ST ANDRE LEZ LILLE;59350;ST ANDRE LEZ LILLE;;50.6570,3.0470
+93066;ST DENIS;93200;ST DENIS;;48.9356,2.3539
+97411;ST DENIS;97400;ST DENIS;;-20.8823,55.4504
+"""
+
+
+@pytest.fixture(scope='module')
+def geocoder(tmp_path_factory):
+    path = tmp_path_factory.mktemp('postcodes') / 'postcodes_fr.csv'
+    path.write_text(LA_POSTE, encoding='utf-8')
+    return Geocoder(Gazetteer(str(path)))
+
+
+def test_parse_addresses():
+    parsed = parse_addresses(pd.Series([
+        '12 rue de la Gare 59200 Tourcoing',
+        'Centre médical, 3 place du Général de Gaulle, 59000 Lille Cedex 2',
+        '8 boulevard Voltaire 75011 Paris 11e',
+        'Cabinet 59000 Lille 2 rue Nationale 59000 Lille',
+        'Rue sans code postal',
+        None,
+    ]))
+    assert parsed.iloc[0].tolist() == ['12 rue de la Gare', '59200', 'Tourcoing']
+    assert parsed.iloc[1].tolist() == ['Centre médical, 3 place du Général de Gaulle', '59000', 'Lille']
+    assert parsed.iloc[2].tolist() == ['8 boulevard Voltaire', '75011', 'Paris']
+    # Only the first of several addresses is read
+    assert parsed.iloc[3].tolist() == ['Cabinet', '59000', 'Lille']
+    assert parsed.iloc[4:].isna().all().all()
+
+
+def test_addresses_match_commune_then_postcode_then_name(geocoder):
+    geocoded = geocoder.geocode(pd.Series([
+        '1 rue de la Gare 59200 Tourcoing',
+        # The locality line and the Saint abbreviation of La Poste are matched too
+        '2 rue Roger Salengro 59260 Hellemmes',
+        '3 rue de Lille 59350 Saint-André-lez-Lille',
+        # A name the dataset does not know: the commune of the postcode
+        '4 rue Nationale 59000 Lile',
+        # A postcode of two communes: their centroid, without a commune
+        '5 rue du Fort 59260 Lezenes',
+        # A postcode the dataset does not know: the commune whose name is unique
+        '6 place de la Gare 59201 Tourcoing',
+        # Saint-Denis is not unique in France, it is only found with its postcode
+        '7 rue de la République 93201 Saint-Denis',
+    ]))
+    assert geocoded['Geocoded'].tolist()[:6] == [COMMUNE, COMMUNE, COMMUNE, POSTCODE, POSTCODE, CITY]
+    assert geocoded.loc[6, ['Geocoded', 'Latitude']].isna().all()
+    assert geocoded['INSEE'].tolist()[:6] == ['59599', '59298', '59527', '59350', None, '59599']
+    assert geocoded.loc[4, ['Latitude', 'Longitude']].tolist() == pytest.approx([50.621, 3.113])
+    assert geocoded.loc[0, ['Department_Code', 'Department', 'Region']].tolist() == ['59', 'Nord', 'Hauts-de-France']
+    assert geocoded.loc[6, 'Department_Code'] == '93'
+
+
+def test_same_name_resolved_by_postcode(geocoder):
+    geocoded = geocoder.geocode(pd.Series(['1 rue de Paris 93200 Saint-Denis', '1 rue de Paris 97400 Saint-Denis']))
+    assert geocoded['INSEE'].tolist() == ['93066', '97411']
+    assert geocoded['Department_Code'].tolist() == ['93', '974']
+
+
+def test_etalab_layout_is_read(tmp_path):
+    path = tmp_path / 'communes.csv'
+    path.write_text(
+        'code_commune_INSEE,nom_commune_postal,code_postal,libelle_acheminement,ligne_5,latitude,longitude,'
+        'code_commune,nom_commune\n'
+        '59599,TOURCOING,59200,TOURCOING,,50.7239,3.1612,599,Tourcoing\n'
+        '59350,LILLE,59000,LILLE,,,,350,Lille\n', encoding='utf-8')
+    entries = Gazetteer.read(str(path))
+    assert entries[['insee', 'postcode', 'commune']].values.tolist() == [['59599', '59200', 'Tourcoing']]
+
+
+def test_missing_dataset_warns(tmp_path, capsys):
+    assert default_gazetteer(str(tmp_path / 'postcodes_fr.csv')) is None
+    assert '--download' in capsys.readouterr().out
+    geocoded = Geocoder(None).geocode(pd.Series(['1 rue de la Gare 59200 Tourcoing']))
+    assert geocoded.loc[0, ['Postcode', 'Department']].tolist() == ['59200', 'Nord']
+    assert pd.isna(geocoded.loc[0, 'Latitude'])
@@ -0,0 +1,50 @@
+import asyncio
+
+from AsyncCrawler import ListingScheduler
+from CheckpointStore import open_checkpoint
+from ProfileIndex import ProfileIndex
+
+LAST_PAGE = 3
+
+
+class ListingBackend:
+    def __init__(self):
+        self.fetched = []
+
+    def scrape_listing_page(self, url):
+        page = int(url.rsplit('=', 1)[1])
+        self.fetched.append(page)
+        if page > LAST_PAGE:
+            return [], [], None
+        return [f'https://www.doctolib.fr/psychologue/lille/p{page}'], [f'Praticien {page}'], LAST_PAGE
+
+
+class Pool:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def run(self, task, item, is_empty=None):
+        return task(self.backend, item)
+
+
+def crawl(store, backend):
+    records = asyncio.Queue()
+    scheduler = ListingScheduler(Pool(backend), store, 'psychologue', 'lille', window=5, base_url='http://test/?page=')
+    asyncio.run(scheduler.run(records))
+    return records.qsize()
+
+
+def test_resumed_listing_stops_at_the_announced_last_page(tmp_path):
+    store = open_checkpoint(str(tmp_path / 'psychologue_lille.xlsx'), ProfileIndex(str(tmp_path / 'index.db')))
+    assert crawl(store, ListingBackend()) == LAST_PAGE
+
+    ledger = store.ledger
+    assert ledger.last_page('psychologue', 'lille') == LAST_PAGE
+    # The speculative fetches past the last page leave no failed page behind
+    statuses = dict(store.conn.execute('SELECT page, status FROM ledger_pages').fetchall())
+    assert statuses == {1: 'done', 2: 'done', 3: 'done'}
+
+    backend = ListingBackend()
+    assert crawl(store, backend) == 0
+    assert backend.fetched == []
+    store.close()
@@ -0,0 +1,87 @@
+import shutil
+
+from CheckpointStore import open_checkpoint
+from CrawlLedger import DEAD, FAILED
+from ProfileIndex import ProfileIndex
+from RetryEngine import GaveUp
+
+QUERY = ('psychologue', 'lille')
+LINKS = [f'https://www.doctolib.fr/psychologue/lille/praticien-{number}' for number in range(1, 5)]
+
+
+def checkpoint(tmp_path, name='psychologue_lille.xlsx'):
+    return open_checkpoint(str(tmp_path / name), ProfileIndex(str(tmp_path / 'index.db')))
+
+
+def test_listing_resumes_at_the_first_page_not_recorded(tmp_path):
+    with checkpoint(tmp_path) as store:
+        ledger = store.ledger
+        assert ledger.first_unfinished_page(*QUERY) == 1
+        store.record_page(*QUERY, 1, ['A'], LINKS[:1])
+        store.record_page(*QUERY, 2, ['B'], LINKS[1:2])
+        store.record_page(*QUERY, 4, ['D'], LINKS[3:4])
+        ledger.start_page(*QUERY, 3)
+        assert ledger.first_unfinished_page(*QUERY) == 3
+        ledger.finish_page(*QUERY, 3, FAILED)
+        assert ledger.first_unfinished_page(*QUERY) == 3
+        assert not ledger.page_done(*QUERY, 3) and ledger.page_done(*QUERY, 4)
+        store.record_page(*QUERY, 3, ['C'], LINKS[2:3])
+        assert ledger.first_unfinished_page(*QUERY) == 5
+        # Another query of the same checkpoint starts from its own first page
+        assert ledger.first_unfinished_page('psychologue', 'roubaix') == 1
+        assert ledger.last_done_page(*QUERY) == 4
+        # A profile listed by both queries is one profile of two rows
+        store.record_page('psychologue', 'roubaix', 1, ['A'], LINKS[:1])
+        assert store.listing_counts() == (5, 4)
+
+
+def test_pending_profiles_and_dead_letters(tmp_path):
+    with checkpoint(tmp_path) as store:
+        store.record_page(*QUERY, 1, ['A', 'B', 'C', 'D'], LINKS)
+        store.record_profile_fields(LINKS[0], ('fees', 'address'), {
+            'fees': {'types': ['Consultation'], 'fees': ['50 €']}, 'address': {'address': '1 rue de la Gare'}})
+        store.record_profile_fields(LINKS[1], ('fees',), {'fees': {'types': ['Consultation'], 'fees': ['60 €']}})
+        store.fail_profile(LINKS[2], ('fees', 'address'), GaveUp('timeout', 3, 'page did not load'))
+        store.fail_profile(LINKS[3], ('fees', 'address'), RuntimeError('session lost'))
+
+        ledger = store.ledger
+        # Dead letters are left out, other failures are retried
+        assert ledger.pending_profiles('fees', 'address') == [LINKS[1], LINKS[3]]
+        assert ledger.pending_profiles('fees') == [LINKS[3]]
+        assert ledger.pending_stages(LINKS[1], ['fees', 'address']) == ['address']
+        assert [(link, stage, kind) for link, stage, kind, _ in ledger.dead_letters()] == [
+            (LINKS[2], 'fees', 'timeout'), (LINKS[2], 'address', 'timeout')]
+
+        assert ledger.revive_dead_letters() == 2
+        assert ledger.dead_letters() == []
+        assert ledger.pending_profiles('fees') == [LINKS[2], LINKS[3]]
+        status, attempts = store.conn.execute(
+            "SELECT status, attempts FROM ledger_profiles WHERE link = ? AND stage = 'fees'", (LINKS[2],)).fetchone()
+        assert (status, attempts) == (FAILED, 1)
+        assert DEAD not in {row[0] for row in store.conn.execute('SELECT status FROM ledger_profiles')}
+
+
+def test_workbook_round_trip_keeps_types_and_fees_paired(tmp_path):
+    results = {
+        LINKS[0]: {'types': ['Première consultation', 'Suivi'], 'fees': ['60 €', '50 €'], 'address': '1 rue de la Gare'},
+        # A blank type before a known one, and a type without fee
+        LINKS[1]: {'types': ['', 'Suivi', 'Bilan'], 'fees': ['40 €', '45 €', '']},
+        LINKS[2]: {'address': '3 rue de la Gare'},
+    }
+    with checkpoint(tmp_path) as store:
+        store.record_page(*QUERY, 1, ['A', 'B', 'C', 'D'], LINKS)
+        for link, data in results.items():
+            if 'types' in data:
+                store.record_profile(link, 'fees', {'types': data['types'], 'fees': data['fees']})
+            if 'address' in data:
+                store.record_profile(link, 'address', {'address': data['address']})
+        store.export_excel(str(tmp_path / 'psychologue_lille.xlsx'))
+
+    # A workbook without its checkpoint is imported into a new one
+    (tmp_path / 'copy').mkdir()
+    shutil.copy(tmp_path / 'psychologue_lille.xlsx', tmp_path / 'copy' / 'psychologue_lille.xlsx')
+    with checkpoint(tmp_path / 'copy') as store:
+        assert [record['Link'] for record in store.iter_listing()] == LINKS
+        assert store.profile_results() == results
+        assert store.ledger.pending_profiles('fees', 'address') == [LINKS[1], LINKS[2], LINKS[3]]
+        assert store.ledger.pending_profiles('fees') == [LINKS[2], LINKS[3]]
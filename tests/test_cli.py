@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from DoctolibCli import DEFAULT_FIELDS, build_parser
+from ProfileExtractor import PROFILE_FIELDS, extract_profile
+
+
+def test_default_fields_are_the_profile_fields():
+    assert set(DEFAULT_FIELDS) == set(PROFILE_FIELDS)
+
+
+def test_fields_are_parsed():
+    args = build_parser().parse_args(['enrich', 'psychologue_lille.xlsx', '--fields', 'fees, address'])
+    assert args.fields == ('fees', 'address')
+    assert build_parser().parse_args(['list', 'psychologue', 'lille', '--fields', '']).fields == ()
+
+
+@pytest.mark.parametrize('command', [['list', 'psychologue', 'lille'], ['enrich', 'psychologue_lille.xlsx']])
+def test_unknown_fields_are_rejected_with_the_valid_ones(command, capsys):
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(command + ['--fields', 'fees,languages'])
+    error = capsys.readouterr().err
+    assert 'languages' in error and 'fees, address' in error
+
+
+def test_extract_profile_rejects_unknown_fields_before_parsing():
+    with pytest.raises(ValueError, match='languages'):
+        extract_profile(None, ('languages',))
+
+
+def test_dry_run_with_fields_imports_no_scraper():
+    code = ("import sys; from DoctolibCli import main; "
+            "main(['enrich', 'psychologue_lille.xlsx', '--fields', 'fees', '--dry-run']); "
+            "print(sorted({'selenium', 'requests', 'lxml', 'pandas'} & set(sys.modules)))")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    described, imported = output.splitlines()
+    assert described.endswith('fields=fees')
+    assert imported == '[]'
@@ -0,0 +1,51 @@
+import requests
+from selenium.common.exceptions import InvalidSessionIdException
+
+from DriverHealth import HealthSupervisor
+from test_driver_pool import URL, Factory, FakeDriver, pool
+
+
+def test_session_crossing_the_page_limit_is_recycled():
+    factory = Factory()
+    drivers = pool(1, factory, HealthSupervisor(max_pages=3))
+    numbers = [drivers.run(lambda driver, url: driver.number, URL.format(n)) for n in range(7)]
+    assert numbers == [1, 1, 1, 2, 2, 2, 3]
+    assert [driver.quit_count for driver in factory.drivers] == [1, 1, 0]
+    assert drivers.supervisor.recycled == {'pages': 2}
+
+
+def test_session_over_the_memory_limit_is_recycled():
+    factory = Factory(rss=2 * 1024 ** 3)
+    drivers = pool(1, factory, HealthSupervisor(max_rss=1024 ** 3, rss_interval=2))
+    numbers = [drivers.run(lambda driver, url: driver.number, URL.format(n)) for n in range(4)]
+    assert numbers == [1, 1, 2, 2]
+    assert drivers.supervisor.recycled == {'memory': 2}
+
+
+def test_lost_session_is_recycled_before_the_retry():
+    factory = Factory()
+    drivers = pool(1, factory)
+
+    def task(driver, url):
+        if driver.number == 1:
+            raise InvalidSessionIdException('invalid session id')
+        return driver.number
+
+    assert drivers.run(task, URL) == 2
+    assert factory.drivers[0].quit_count == 1
+    assert drivers.supervisor.recycled == {'session lost': 1}
+    assert drivers.retry.retries == {'crash': 1}
+
+
+def test_session_failing_in_a_row_is_recycled():
+    supervisor = HealthSupervisor(max_errors=2)
+    driver = FakeDriver(1)
+    supervisor.record(driver, requests.ConnectionError('reset'))
+    supervisor.record(driver)
+    supervisor.record(driver, requests.ConnectionError('reset'))
+    assert supervisor.recycle_reason(driver) is None
+    supervisor.record(driver, requests.ConnectionError('reset'))
+    assert supervisor.recycle_reason(driver) == ('errors', '2 errors in a row')
+    supervisor.forget(driver, 'errors')
+    assert supervisor.recycle_reason(driver) is None
+    assert supervisor.recycled == {'errors': 1}
@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+import requests
+
+from DriverPool import DriverPool, run_in_pool
+from RetryEngine import GaveUp, RetryEngine, RetryPolicy
+
+URL = 'https://www.doctolib.fr/psychologue/lille/praticien-{}'
+
+
+class FakeDriver:
+    def __init__(self, number, rss=0):
+        self.number = number
+        self.memory = rss
+        self.quit_count = 0
+
+    def rss(self):
+        return self.memory
+
+    def quit(self):
+        self.quit_count += 1
+
+
+class Factory:
+    def __init__(self, rss=0):
+        self.drivers = []
+        self.rss = rss
+
+    def __call__(self):
+        driver = FakeDriver(len(self.drivers) + 1, self.rss)
+        self.drivers.append(driver)
+        return driver
+
+
+def fast_retry():
+    return RetryEngine(policies={kind: RetryPolicy(policy.attempts, 0.0)
+                                 for kind, policy in RetryEngine().policies.items()})
+
+
+def pool(size=2, factory=None, supervisor=None):
+    return DriverPool(size, factory or Factory(), supervisor, fast_retry())
+
+
+def test_drivers_are_created_lazily_and_reused():
+    factory = Factory()
+    with pool(2, factory) as drivers:
+        assert [drivers.run(lambda driver, url: driver.number, URL.format(n)) for n in range(3)] == [1, 1, 1]
+        with drivers.acquire() as first, drivers.acquire() as second:
+            assert {first.number, second.number} == {1, 2}
+        assert len(factory.drivers) == 2
+    assert [driver.quit_count for driver in factory.drivers] == [1, 1]
+
+
+def test_checkout_waits_for_a_returned_driver():
+    factory = Factory()
+    drivers = pool(1, factory)
+    borrowed = []
+    with drivers.acquire() as first:
+        thread = threading.Thread(target=lambda: borrowed.append(drivers.run(lambda driver, url: driver, URL)))
+        thread.start()
+        thread.join(0.2)
+        # The pool is full: the second checkout waits instead of creating a driver
+        assert thread.is_alive() and borrowed == []
+    thread.join(5)
+    assert borrowed == [first]
+    assert len(factory.drivers) == 1
+
+
+def test_failed_creation_leaves_the_slot_free():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise requests.ConnectionError('chromedriver did not start')
+        return FakeDriver(len(attempts))
+
+    drivers = DriverPool(1, factory, retry=fast_retry())
+    assert drivers.run(lambda driver, url: driver.number, URL) == 2
+
+
+def test_run_in_pool_yields_results_and_errors_by_key():
+    pulled = []
+
+    def items():
+        for number in range(6):
+            pulled.append(number)
+            yield number, None if number == 2 else URL.format(number)
+
+    def task(driver, url):
+        number = int(url.rsplit('-', 1)[1])
+        if number == 3:
+            raise requests.ConnectionError('connection reset')
+        if number == 4:
+            raise KeyError('fees')
+        return number * 10
+
+    results = {key: (result, error) for key, result, error in run_in_pool(pool(2), items(), task, max_in_flight=2)}
+    assert results[0] == (0, None) and results[1] == (10, None) and results[5] == (50, None)
+    # An item without URL is passed through, in its turn
+    assert results[2] == (None, None)
+    # A transport error is retried, then given up; a bug is raised at once
+    assert results[3][0] is None and isinstance(results[3][1], GaveUp)
+    assert results[4][0] is None and isinstance(results[4][1], KeyError)
+    assert pulled == list(range(6))
+
+
+def test_run_in_pool_pulls_items_lazily():
+    pulled = []
+    release = threading.Event()
+
+    def items():
+        for number in range(10):
+            pulled.append(number)
+            yield number, URL.format(number)
+
+    def task(driver, url):
+        release.wait(5)
+        return url
+
+    results = run_in_pool(pool(2), items(), task, max_in_flight=3)
+    threading.Timer(0.2, release.set).start()
+    next(results)
+    # Three items in flight, and one more pulled when the first was yielded
+    assert len(pulled) <= 4
+    assert len(list(results)) == 9
+
+
+@pytest.mark.parametrize('size', [0, -1])
+def test_pool_has_at_least_one_driver(size):
+    assert pool(size).size == 1
@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+from FeeTable import parse_amounts
+
+
+@pytest.mark.parametrize('text, low, high', [
+    ('50 €', 5000, 5000),
+    ('60,50 €', 6050, 6050),
+    ('1 200 €', 120000, 120000),
+    ('De 40 € à 70 €', 4000, 7000),
+    ('de 40 à 70 €', 4000, 7000),
+    ('Entre 40 et 60 €', 4000, 6000),
+    ('Entre 40 € et 60 €', 4000, 6000),
+    ('40-60 €', 4000, 6000),
+    ('40 € – 60 €', 4000, 6000),
+    ('40 - 60', 4000, 6000),
+    ('50 € (secteur 2)', 5000, 5000),
+    ('45 € - remboursé sur la base de 30 €', 4500, 4500),
+    ('40 € - 2 séances', 4000, 4000),
+    ('30 € et 2 € de frais', 3000, 3000),
+])
+def test_amounts_and_ranges(text, low, high):
+    parsed = parse_amounts(pd.Series([text])).iloc[0]
+    assert (parsed['Min_Cents'], parsed['Max_Cents']) == (low, high)
+    assert parsed['Amount_Cents'] == low if low == high else pd.isna(parsed['Amount_Cents'])
+
+
+def test_currency_and_missing_amounts():
+    parsed = parse_amounts(pd.Series(['80 CHF', 'Non renseigné', None], index=[3, 5, 7]))
+    assert list(parsed.index) == [3, 5, 7]
+    assert parsed['Currency'].tolist()[0] == 'CHF'
+    assert parsed['Min_Cents'].isna().tolist() == [False, True, True]
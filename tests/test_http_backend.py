@@ -0,0 +1,108 @@
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import PageParser
+from Backends import HttpBackend, SeleniumBackend
+from FixtureServer import FixtureServer
+from RateLimiter import HostRateLimiter
+from RetryEngine import MissingSelector
+from SelectorRegistry import SelectorRegistry
+
+# What a JavaScript application serves before rendering
+APP_SHELL = '<!DOCTYPE html><html><head></head><body><div id="root"></div><script src="/app.js"></script></body></html>'
+
+
+class RenderedFixtureServer(FixtureServer):
+    # Serves the application shell, the pages only exist once rendered by a browser
+    def page(self, path, query):
+        html = super().page(path, query)
+        return APP_SHELL if html is not None else None
+
+    def rendered(self, url):
+        parts = urlsplit(url)
+        return FixtureServer.page(self, parts.path, parse_qs(parts.query))
+
+
+class RenderingDriver:
+    """
+    WebDriver stand-in showing the rendered fixture pages.
+    """
+
+    def __init__(self, server, registry):
+        self.server = server
+        self.registry = registry
+        self.page_source = None
+        self.visited = []
+
+    def execute(self, *args, **kwargs):
+        pass
+
+    def get(self, url):
+        self.visited.append(url)
+        self.page_source = self.server.rendered(url)
+
+    def execute_script(self, script, selectors, content):
+        tree = PageParser.parse_html(self.page_source)
+        for index, layout in enumerate(self.registry.layouts):
+            if layout.select('listing_card', tree) or layout.select('profile_card', tree):
+                return [index, 'complete', True, None]
+        return [-1, 'complete', True, None]
+
+
+def backend(**options):
+    return HttpBackend(rate_limiter=HostRateLimiter(0), registry=SelectorRegistry(), **options)
+
+
+@pytest.fixture
+def server():
+    with FixtureServer(pages=2, cards=3, fees=2) as server:
+        yield server
+
+
+def test_listing_names_links_and_last_page(server):
+    http = backend()
+    links, names, last_page = http.scrape_listing_page(server.listing_url() + '2')
+    assert names == ['Dr Praticien 2-1', 'Dr Praticien 2-2', 'Dr Praticien 2-3']
+    assert links == [f'{server.url}/psychologue/tourcoing/praticien-2-{card}' for card in (1, 2, 3)]
+    assert last_page == 2
+    assert http.registry.counts()['matched'] == {'v1': 1}
+    http.quit()
+
+
+def test_profile_fees_and_address(server):
+    http = backend()
+    data = http.scrape_profile(f'{server.url}/psychologue/tourcoing/praticien-2-3')
+    assert data['fees'] == {'types': ['Consultation 1', 'Consultation 2'], 'fees': ['50 €', '60 €']}
+    assert data['address'] == {'address': '6 rue de la Gare 59200 Tourcoing'}
+    assert http.scrape_profile(f'{server.url}/psychologue/tourcoing/praticien-2-3', ('address',)) == {
+        'address': {'address': '6 rue de la Gare 59200 Tourcoing'}}
+    http.quit()
+
+
+def test_pages_rendered_by_javascript_go_to_the_browser():
+    with RenderedFixtureServer(pages=2, cards=3, fees=2) as server:
+        registry = SelectorRegistry()
+        driver = RenderingDriver(server, registry)
+        fallbacks = []
+
+        def fallback_factory():
+            fallbacks.append(SeleniumBackend(driver, rate_limiter=HostRateLimiter(0), registry=registry))
+            return fallbacks[-1]
+
+        http = HttpBackend(fallback_factory=fallback_factory, rate_limiter=HostRateLimiter(0), registry=registry)
+        links, names, last_page = http.scrape_listing_page(server.listing_url() + '1')
+        assert names == ['Dr Praticien 1-1', 'Dr Praticien 1-2', 'Dr Praticien 1-3']
+        assert last_page == 2
+        profile = links[0]
+        assert http.scrape_profile(profile)['address'] == {'address': '1 rue de la Gare 59200 Tourcoing'}
+
+        # One browser, started on the first page that needed it, loaded both pages
+        assert len(fallbacks) == 1
+        assert driver.visited == [server.listing_url() + '1', profile]
+
+
+def test_pages_rendered_by_javascript_fail_without_a_browser():
+    with RenderedFixtureServer(pages=2, cards=3) as server:
+        with pytest.raises(MissingSelector):
+            backend().scrape_listing_page(server.listing_url() + '1')
@@ -0,0 +1,84 @@
+import random
+import zlib
+
+import pytest
+
+import PageCache
+from PageCache import LISTING_TTL, normalize_url
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(PageCache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = PageCache.PageCache(str(tmp_path / 'doctolib.cache.db'))
+    yield cache
+    cache.close()
+
+
+def page(seed):
+    # Random text, so every page compresses to about the same size
+    rng = random.Random(seed)
+    return '<html>' + ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(2000)) + '</html>'
+
+
+def test_equivalent_urls_share_one_entry(cache, clock):
+    cache.put('HTTPS://www.Doctolib.fr/psychologue/lille/?page=2&sort=asc#results', page(1))
+    assert normalize_url('https://www.doctolib.fr/psychologue/lille?sort=asc&page=2') == \
+        'https://www.doctolib.fr/psychologue/lille?page=2&sort=asc'
+    assert cache.get('https://www.doctolib.fr/psychologue/lille?sort=asc&page=2') == page(1)
+    assert cache.conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0] == 1
+    # Another page of the listing is another entry
+    assert cache.get('https://www.doctolib.fr/psychologue/lille?page=3&sort=asc') is None
+    assert (cache.counts['hits'], cache.counts['misses']) == (1, 1)
+
+
+def test_expired_page_is_a_miss(cache, clock):
+    url = 'https://www.doctolib.fr/psychologue/lille?page=1'
+    cache.put(url, page(1))
+    clock.now += LISTING_TTL
+    assert cache.get(url, ttl=LISTING_TTL) == page(1)
+    clock.now += 1
+    assert cache.get(url, ttl=LISTING_TTL) is None
+    # Still fresh for a longer time to live
+    assert cache.get(url, ttl=2 * LISTING_TTL) == page(1)
+    assert (cache.counts['hits'], cache.counts['stale'], cache.counts['misses']) == (2, 1, 0)
+
+
+def test_least_recently_used_pages_are_evicted_first(tmp_path, clock):
+    urls = [f'https://www.doctolib.fr/p{number}' for number in range(4)]
+    sizes = [len(zlib.compress(page(number).encode('utf-8'), 6)) for number in range(4)]
+    cache = PageCache.PageCache(str(tmp_path / 'doctolib.cache.db'), max_bytes=sum(sizes) - 1)
+    for number, url in enumerate(urls[:3]):
+        clock.now += 1
+        cache.put(url, page(number))
+    # p0 is read again: p1 is now the least recently used page
+    clock.now += 1
+    assert cache.get(urls[0]) == page(0)
+    assert cache.counts['evicted'] == 0
+
+    clock.now += 1
+    cache.put(urls[3], page(3))
+    assert cache.counts['evicted'] == 1
+    assert cache.get(urls[1]) is None
+    assert [cache.get(url) for url in (urls[0], urls[2], urls[3])] == [page(0), page(2), page(3)]
+    assert cache._size == sizes[0] + sizes[2] + sizes[3] <= 0.9 * cache.max_bytes
+    cache.close()
+
+    # The size on disk is read again by the next run
+    reopened = PageCache.PageCache(cache.path)
+    assert reopened._size == sizes[0] + sizes[2] + sizes[3]
+    reopened.close()
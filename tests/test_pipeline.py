@@ -0,0 +1,75 @@
+import threading
+import time
+
+from CheckpointStore import open_checkpoint
+from DriverPool import DriverPool
+from Pipeline import listing_stage, profile_stage
+from ProfileIndex import ProfileIndex
+from RetryEngine import RetryEngine, RetryPolicy
+
+PAGES = 5
+PER_PAGE = 20
+
+
+class Backend:
+    def __init__(self, counters):
+        self.counters = counters
+
+    def scrape_listing_page(self, url):
+        page = int(url.rsplit('=', 1)[1])
+        if page > PAGES:
+            return [], [], PAGES
+        links = [f'https://www.doctolib.fr/psychologue/lille/p{page}-{n}' for n in range(PER_PAGE)]
+        return links, [f'Praticien {page}-{n}' for n in range(PER_PAGE)], PAGES
+
+    def scrape_profile(self, link, fields):
+        with self.counters['lock']:
+            self.counters['active'] += 1
+            self.counters['most_active'] = max(self.counters['most_active'], self.counters['active'])
+        time.sleep(0.001)
+        with self.counters['lock']:
+            self.counters['active'] -= 1
+        return {'fees': {'types': ['Consultation'], 'fees': [link.rsplit('/', 1)[1]]}}
+
+
+def pipeline(tmp_path, workers, max_in_flight):
+    counters = {'lock': threading.Lock(), 'active': 0, 'most_active': 0, 'pulled': 0}
+    retry = RetryEngine(policies={kind: RetryPolicy(policy.attempts, 0.0)
+                                  for kind, policy in RetryEngine().policies.items()})
+    pool = DriverPool(workers, lambda: Backend(counters), retry=retry)
+    store = open_checkpoint(str(tmp_path / 'psychologue_lille.xlsx'), ProfileIndex(str(tmp_path / 'index.db')))
+
+    def listed():
+        for record in listing_stage(pool, store, 'psychologue', 'lille', base_url='http://test/?page='):
+            counters['pulled'] += 1
+            yield record
+
+    return profile_stage(listed(), pool, store, ('fees',), max_in_flight), store, counters
+
+
+def test_more_records_than_the_bound_are_streamed_in_order(tmp_path):
+    records, store, counters = pipeline(tmp_path, workers=1, max_in_flight=1)
+    links = [record['Link'] for record in records]
+    expected = [f'https://www.doctolib.fr/psychologue/lille/p{page}-{n}'
+                for page in range(1, PAGES + 1) for n in range(PER_PAGE)]
+    assert links == expected
+    store.close()
+
+
+def test_stages_stay_within_their_bound(tmp_path):
+    records, store, counters = pipeline(tmp_path, workers=2, max_in_flight=4)
+    out = []
+    for record in records:
+        # The listing is pulled only as far as the profile stage has room for
+        assert counters['pulled'] - len(out) <= 4
+        out.append(record)
+
+    assert len(out) == len({record['Link'] for record in out}) == PAGES * PER_PAGE
+    assert all(record['fees'] == [record['Link'].rsplit('/', 1)[1]] for record in out)
+    assert 1 <= counters['most_active'] <= 2
+    # Every profile is recorded, and the checkpoint keeps the listing order whatever the completion order
+    assert store.ledger.pending_profiles('fees') == []
+    listing = [record['Link'] for record in store.iter_listing(chunk_size=7)]
+    assert listing == sorted(listing, key=lambda link: tuple(map(int, link.rsplit('/p', 1)[1].split('-'))))
+    assert len(listing) == PAGES * PER_PAGE
+    store.close()
@@ -0,0 +1,27 @@
+from ProfileIndex import ProfileIndex, profile_key
+
+PROFILE = 'https://www.doctolib.fr/psychologue/lille/jean-dupont'
+
+
+def test_profile_key_drops_tracking_parameters_fragment_and_case():
+    assert profile_key(PROFILE + '/?utm_source=mail&utm_medium=x#rdv') == 'www.doctolib.fr/psychologue/lille/jean-dupont'
+    assert profile_key(PROFILE.replace('www', 'WWW') + '?highlight%5Bspeciality_ids%5D%5B%5D=1') == profile_key(PROFILE)
+
+
+def test_profile_key_keeps_the_practice():
+    first = profile_key(PROFILE + '?pid=practice-12&utm_campaign=x')
+    assert first == 'www.doctolib.fr/psychologue/lille/jean-dupont?pid=practice-12'
+    assert first != profile_key(PROFILE + '?pid=practice-13')
+    assert first != profile_key(PROFILE)
+
+
+def test_each_practice_keeps_its_own_fields(tmp_path):
+    index = ProfileIndex(str(tmp_path / 'index.db'))
+    index.record([
+        (PROFILE + '?pid=practice-12', 'address', {'address': '1 rue A 59000 Lille'}),
+        (PROFILE + '?pid=practice-13', 'address', {'address': '2 rue B 59200 Tourcoing'}),
+    ])
+    other_listing = 'https://www.doctolib.fr/psychologue/lille/jean-dupont?utm_source=x&pid=practice-13'
+    assert index.lookup([other_listing], ['address']) == {other_listing: {'address': {'address': '2 rue B 59200 Tourcoing'}}}
+    assert len(index) == 2
+    index.close()
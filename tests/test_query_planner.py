@@ -0,0 +1,89 @@
+import asyncio
+
+from CheckpointStore import open_checkpoint
+from PlaceList import DEPARTMENT, Place, QueryPlanner, load_places, slugify
+from ProfileIndex import ProfileIndex
+from QueryPlanner import crawl_plan
+
+PLACES = [
+    Place('Hauts-de-France', '59', 'Nord', 'Lille'),
+    Place('Hauts-de-France', '59', 'Nord', 'Tourcoing'),
+    Place('Hauts-de-France', '62', 'Pas-de-Calais', 'Arras'),
+    Place('Bretagne', '29', 'Finistère', 'Brest'),
+    Place('Île-de-France', '75', 'Paris', 'Paris'),
+]
+
+
+def test_country_and_regions_are_split_into_departments():
+    planner = QueryPlanner(PLACES)
+    assert planner.plan('France') == ['nord', 'pas-de-calais', 'finistere', 'paris']
+    assert planner.plan('hauts-de-france') == ['nord', 'pas-de-calais']
+    # A department, by name or code, and any other localisation are their own sub-query
+    assert planner.plan('59') == ['nord']
+    assert planner.plan('Nord') == ['nord']
+    assert planner.plan('Lille') == ['lille']
+
+
+def test_bundled_place_list_covers_every_department():
+    places = load_places()
+    assert len({place.department_code for place in places}) == 101
+    assert len(QueryPlanner(places).plan('france')) == 101
+
+
+def test_saturated_departments_are_refined_into_cities():
+    planner = QueryPlanner(PLACES)
+    assert planner.refine('nord') == ['lille', 'tourcoing']
+    # Cities cannot be split further, nor a department whose only city is itself
+    assert planner.refine('lille') == []
+    assert planner.refine('paris') == []
+    assert planner.refine('nord', DEPARTMENT) == []
+
+
+class ListingBackend:
+    """
+    Listing of every sub-query, `pages` pages long, with one profile per page.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.fetched = []
+
+    def scrape_listing_page(self, url):
+        localisation, page = url.rsplit('/', 1)[1].split('?page=')
+        self.fetched.append(localisation)
+        last_page = self.pages.get(localisation, 1)
+        if int(page) > last_page:
+            return [], [], None
+        return [f'https://www.doctolib.fr/psychologue/{localisation}/p{page}'], [f'Praticien {page}'], last_page
+
+    def scrape_profile(self, link, fields):
+        return {}
+
+
+class Pool:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def run(self, task, item, is_empty=None):
+        return task(self.backend, item)
+
+
+def test_only_saturated_sub_queries_are_refined(tmp_path):
+    store = open_checkpoint(str(tmp_path / 'psychologue_france.xlsx'), ProfileIndex(str(tmp_path / 'index.db')))
+    backend = ListingBackend({'nord': 3, 'lille': 3, 'paris': 3})
+    planner = QueryPlanner(PLACES)
+    crawled, incomplete = asyncio.run(crawl_plan(
+        Pool(backend), store, 'psychologue', planner.plan('france'), parallel=1,
+        base_url='http://test/{localisation}?page=', fields=('fees',), planner=planner, page_cap=3))
+
+    # Nord and Paris reached the cap: Nord is refined, Lille and Paris cannot be
+    assert crawled == ['nord', 'pas-de-calais', 'finistere', 'paris', 'lille', 'tourcoing']
+    assert sorted(incomplete) == ['lille', 'paris']
+    assert set(backend.fetched) == set(crawled)
+    assert store.listing_counts() == (12, 12)
+    store.close()
+
+
+def test_slugify():
+    assert slugify('Saint-Étienne') == 'saint-etienne'
+    assert slugify("Côtes-d'Armor") == 'cotes-d-armor'
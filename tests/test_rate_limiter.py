@@ -0,0 +1,109 @@
+from RateLimiter import HostRateLimiter, SharedRateLimiter
+
+URL = 'https://www.doctolib.fr/psychologue/lille?page=1'
+
+
+class Clock:
+    """
+    Time that only moves when the limiter sleeps, or when the test says so.
+    """
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def limiter(min_interval=2.0, burst=1):
+    clock = Clock()
+    return HostRateLimiter(min_interval, burst, clock=clock, sleep=clock.sleep), clock
+
+
+def test_bucket_arithmetic():
+    rate = HostRateLimiter(2.0, burst=3)
+    # A new host starts with a full bucket, refilled by one token per interval up to the burst
+    assert rate.refill(None, 10.0) == 3
+    assert rate.refill((0.0, 10.0), 13.0) == 1.5
+    assert rate.refill((0.0, 10.0), 100.0) == 3
+    # Taking the last token is immediate, taking one more waits for its refill
+    assert rate.take((1.0, 10.0), 10.0) == (0.0, 10.0)
+    assert rate.take((0.0, 10.0), 10.0) == (-1.0, 12.0)
+    assert rate.take((-1.0, 10.0), 11.0) == (-1.5, 14.0)
+    # Holding for 5s leaves the next token 5s away, but never brings one closer
+    assert rate.hold((3.0, 10.0), 10.0, 5.0) == -1.5
+    assert rate.hold((-4.0, 10.0), 10.0, 5.0) == -4.0
+
+
+def test_requests_to_a_host_are_spaced_by_the_interval():
+    rate, clock = limiter()
+    assert rate.wait(URL) == 0.0
+    assert rate.wait(URL) == 2.0
+    assert rate.wait(URL) == 2.0
+    # A page that took longer than the interval leaves the next request free to go
+    clock.now += 3.0
+    assert rate.wait(URL) == 0.0
+    # Idle time does not build up past the burst of 1
+    clock.now += 60.0
+    assert [rate.wait(URL), rate.wait(URL)] == [0.0, 2.0]
+    assert clock.slept == [2.0, 2.0, 2.0]
+
+
+def test_burst_after_idle_period():
+    rate, clock = limiter(burst=3)
+    assert [rate.wait(URL) for _ in range(4)] == [0.0, 0.0, 0.0, 2.0]
+    clock.now += 3.0
+    assert [rate.wait(URL), rate.wait(URL)] == [0.0, 1.0]
+
+
+def test_hosts_have_their_own_bucket():
+    rate, clock = limiter()
+    assert rate.wait(URL) == 0.0
+    assert rate.wait('https://other.example/') == 0.0
+    assert rate.wait(URL) == 2.0
+
+
+def test_backoff_delays_the_next_request():
+    rate, clock = limiter()
+    rate.wait(URL)
+    rate.backoff(URL, 10.0)
+    assert rate.wait(URL) == 10.0
+    # A backoff shorter than the interval does not let the next request go earlier
+    rate.backoff(URL, 0.5)
+    assert rate.wait(URL) == 2.0
+
+
+def test_no_interval_never_waits():
+    rate, clock = limiter(min_interval=0)
+    rate.backoff(URL, 10.0)
+    assert [rate.wait(URL) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert clock.slept == []
+
+
+class BucketQueue:
+    # The update_bucket of a WorkQueue, on the test clock
+    def __init__(self, clock):
+        self.clock = clock
+        self.buckets = {}
+
+    def update_bucket(self, host, update):
+        now = self.clock()
+        tokens, value = update(self.buckets.get(host), now)
+        self.buckets[host] = (tokens, now)
+        return value, now
+
+
+def test_shared_limiter_draws_from_the_buckets_of_the_queue():
+    clock = Clock()
+    queue = BucketQueue(clock)
+    first, second = (SharedRateLimiter(queue, 2.0, sleep=clock.sleep) for _ in range(2))
+    assert first.wait(URL) == 0.0
+    assert second.wait(URL) == 2.0
+    second.backoff(URL, 6.0)
+    assert first.wait(URL) == 6.0
+    assert list(queue.buckets) == ['www.doctolib.fr']
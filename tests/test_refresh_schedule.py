@@ -0,0 +1,89 @@
+import math
+import time
+
+import pytest
+
+from CheckpointStore import open_checkpoint
+from ProfileIndex import ProfileIndex
+from RefreshSchedule import change_probability, fingerprint
+
+DAY = 24 * 3600
+LINKS = [f'https://www.doctolib.fr/psychologue/lille/praticien-{number}' for number in range(1, 4)]
+FEES = {'types': ['Consultation'], 'fees': ['50 €']}
+ADDRESS = {'address': '12 rue de la Gare 59000 Lille'}
+
+
+def test_change_probability_is_poisson():
+    # Never checked: one change per prior interval
+    assert change_probability(0, 0, 0, 0, 10 * DAY, prior_interval=10 * DAY) == pytest.approx(1 - math.exp(-1))
+    # 3 changes over 90 days watched, smoothed by one change per 10 days: 4 changes per 100 days
+    assert change_probability(5, 3, 0, 90 * DAY, 115 * DAY, prior_interval=10 * DAY) == \
+        pytest.approx(1 - math.exp(-1))
+    # Just checked: no time to change
+    assert change_probability(5, 3, 0, 90 * DAY, 90 * DAY) == 0.0
+
+
+def test_fingerprint_compares_values_not_layout():
+    assert fingerprint({'fees': FEES, 'address': ADDRESS}) == fingerprint({**ADDRESS, **FEES})
+    # Empty values and key order do not count
+    assert fingerprint({'fees': FEES, 'address': {}}) == fingerprint({'fees': dict(reversed(FEES.items()))})
+    assert fingerprint({'fees': FEES}) != fingerprint({'fees': {'types': ['Consultation'], 'fees': ['60 €']}})
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = open_checkpoint(str(tmp_path / 'psychologue_lille.xlsx'), ProfileIndex(str(tmp_path / 'index.db')))
+    store.record_page('psychologue', 'lille', 1, ['A', 'B', 'C'], LINKS)
+    for link in LINKS:
+        store.record_profile_fields(link, ('fees', 'address'), {'fees': FEES, 'address': ADDRESS})
+    yield store
+    store.close()
+
+
+def profile_rows(store):
+    return store.conn.execute('SELECT COUNT(*) FROM profiles').fetchone()[0]
+
+
+def test_unchanged_then_changed_profile(store):
+    assert store.fingerprint_profiles() == 3
+    assert store.fingerprint_profiles() == 0
+    rows = profile_rows(store)
+
+    # Unchanged: only the check is recorded
+    assert store.record_refresh(LINKS[0], {'fees': FEES, 'address': ADDRESS}) == []
+    assert profile_rows(store) == rows
+    assert store.refresh.changes() == []
+
+    # A new fee: only the changed values are appended and logged
+    started_at = time.time()
+    new_fees = {'types': ['Consultation'], 'fees': ['60 €']}
+    assert store.record_refresh(LINKS[0], {'fees': new_fees, 'address': ADDRESS}) == [('fees', ['50 €'], ['60 €'])]
+    assert profile_rows(store) == rows + 1
+    assert store.profile_result(LINKS[0]) == {**new_fees, **ADDRESS}
+    (link, field, before, after, changed_at), = store.refresh.changes(started_at)
+    assert (link, field, before, after) == (LINKS[0], 'fees', ['50 €'], ['60 €'])
+
+    # The address gone from the page is recorded empty
+    assert store.record_refresh(LINKS[0], {'fees': new_fees, 'address': {}}) == [
+        ('address', ADDRESS['address'], None)]
+    assert store.profile_result(LINKS[0])['address'] is None
+    assert len(store.refresh.changes()) == 2
+
+    checks, changes = store.conn.execute(
+        'SELECT checks, changes FROM profile_fingerprints WHERE link = ?', (LINKS[0],)).fetchone()
+    assert (checks, changes) == (3, 2)
+
+
+def test_due_ranks_profiles_by_change_probability(store):
+    store.fingerprint_profiles()
+    store.record_refresh(LINKS[1], {'fees': {'types': ['Consultation'], 'fees': ['70 €']}, 'address': ADDRESS})
+    store.record_refresh(LINKS[2], {'fees': FEES, 'address': ADDRESS})
+    now = time.time() + 2 * DAY
+
+    due = store.refresh.due(now=now)
+    # The profile seen changing is the likeliest to change again, the one just found unchanged the least
+    assert [link for link, _ in due] == [LINKS[1], LINKS[0], LINKS[2]]
+    assert due[0][1] > due[1][1] > due[2][1] > 0
+    assert store.refresh.due(budget=1, now=now) == due[:1]
+    # Profiles checked less than min_age ago are not due
+    assert store.refresh.due(now=time.time()) == []
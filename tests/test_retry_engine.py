@@ -0,0 +1,89 @@
+import pytest
+import requests
+
+from RateLimiter import HostRateLimiter
+from RetryEngine import (ERROR, MISSING_SELECTOR, TIMEOUT, GaveUp, MissingSelector, PageTimeout, RetryEngine, RetryPolicy,
+                         classify)
+from SelectorRegistry import LISTING, SelectorRegistry
+
+URL = 'https://www.doctolib.fr/psychologue/lille?page=9'
+
+
+class Limiter(HostRateLimiter):
+    def __init__(self):
+        super().__init__(1.0)
+        self.backoffs = []
+
+    def backoff(self, url, delay):
+        self.backoffs.append(url)
+
+
+class LoadedDriver:
+    # A loaded page showing none of the layouts, as a listing past its last page
+    def __init__(self, state='complete'):
+        self.state = state
+
+    def execute_script(self, script, *arguments):
+        return [-1, self.state, True, None]
+
+
+def engine(limiter):
+    fast = {kind: RetryPolicy(policy.attempts, 0.0, host_backoff=policy.host_backoff)
+            for kind, policy in RetryEngine().policies.items()}
+    return RetryEngine(limiter, fast)
+
+
+def fail_with(error):
+    def fetch():
+        raise error
+    return fetch
+
+
+def test_loaded_page_without_results_does_not_back_off_the_host():
+    limiter = Limiter()
+    with pytest.raises(GaveUp) as raised:
+        engine(limiter).call(fail_with(MissingSelector(URL, '.dl-search-result')), URL)
+    assert raised.value.kind == MISSING_SELECTOR
+    assert limiter.backoffs == []
+
+
+def test_page_that_never_loaded_is_a_timeout():
+    limiter = Limiter()
+    with pytest.raises(GaveUp) as raised:
+        engine(limiter).call(fail_with(PageTimeout(URL, 10)), URL)
+    assert raised.value.kind == TIMEOUT
+    assert limiter.backoffs == [URL, URL]
+
+
+def test_registry_tells_a_loaded_page_from_a_timeout():
+    registry = SelectorRegistry(grace=0)
+    layout, loaded = registry.wait_for_layout(LoadedDriver(), LISTING, timeout=1, poll=0)
+    assert (layout, loaded) == (None, True)
+    assert classify(registry.missing(URL, LISTING)) == MISSING_SELECTOR
+
+    layout, loaded = registry.wait_for_layout(LoadedDriver('loading'), LISTING, timeout=0, poll=0)
+    assert (layout, loaded) == (None, False)
+    assert classify(registry.missing(URL, LISTING, timeout=0)) == TIMEOUT
+
+
+@pytest.mark.parametrize('error', [KeyError('fees'), TypeError('bad operand'), AttributeError('text')])
+def test_programming_error_is_raised_without_retry(error):
+    limiter, calls = Limiter(), []
+
+    def fetch():
+        calls.append(1)
+        raise error
+
+    retry = engine(limiter)
+    with pytest.raises(type(error)):
+        retry.call(fetch, URL)
+    assert classify(error) is None
+    assert (len(calls), retry.retries, limiter.backoffs) == (1, {}, [])
+
+
+def test_transport_error_is_retried_with_host_backoff():
+    limiter = Limiter()
+    with pytest.raises(GaveUp) as raised:
+        engine(limiter).call(fail_with(requests.ConnectionError('connection reset')), URL)
+    assert raised.value.kind == ERROR
+    assert limiter.backoffs == [URL]
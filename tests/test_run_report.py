@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from Pacing import STAGES, PacingMetrics, Reservoir
+from RunReport import percentile, prometheus_text, run_report
+
+
+@pytest.mark.parametrize('values, q, expected', [
+    ([], 0.5, 0.0),
+    ([3.0], 0.99, 3.0),
+    ([1.0, 2.0, 3.0, 4.0], 0.5, 2.0),
+    (list(range(1, 101)), 0.5, 50),
+    (list(range(1, 101)), 0.95, 95),
+    (list(range(1, 101)), 0.99, 99),
+    (list(range(1, 11)), 0.95, 10),
+    (list(range(1, 11)), 0.0, 1),
+])
+def test_percentile_is_nearest_rank(values, q, expected):
+    assert percentile(values, q) == expected
+
+
+def test_reservoir_keeps_a_bounded_uniform_sample():
+    reservoir = Reservoir(100, random.Random(1))
+    for value in range(10000):
+        reservoir.add(value)
+    assert (reservoir.count, len(reservoir.values)) == (10000, 100)
+    # Drawn from the whole stream, not only from its start
+    assert 3000 < sum(reservoir.values) / 100 < 7000
+
+
+def test_metrics_memory_does_not_grow_with_the_run():
+    metrics = PacingMetrics(open_urls=8, sample_size=50, rng=random.Random(1))
+    for number in range(1000):
+        url = f'https://www.doctolib.fr/psychologue/lille/p{number}'
+        metrics.add('navigation', 1.0 + (number == 10) * 5, url)
+        metrics.add('extraction', 0.5, url)
+        metrics.add('extraction', 0.25, url)
+    metrics.add('throttle', 2.0)
+
+    assert len(metrics._open) == 8
+    assert len(metrics.samples['navigation'].values) == 50
+    assert metrics.urls == 1000
+    assert metrics.stage_urls('extraction') == 1000
+    # Every stage of a URL is added up before the URL is closed
+    assert set(metrics.stage_times('extraction')) == {0.75}
+    (url, timings), = metrics.slowest(1)
+    assert (url, timings) == ('https://www.doctolib.fr/psychologue/lille/p10', {'navigation': 6.0, 'extraction': 0.75})
+    assert metrics.seconds['throttle'] == 2.0
+
+
+def report():
+    metrics = PacingMetrics()
+    for number, seconds in enumerate([0.1, 0.2, 0.3, 0.4]):
+        metrics.add('navigation', seconds, f'https://www.doctolib.fr/p{number}')
+    metrics.add('wait', 1.5, 'https://www.doctolib.fr/p0')
+    metrics.count('bytes_read', 2048)
+    metrics.page_done()
+    return run_report(metrics, cache={'hits': 1})
+
+
+def test_run_report():
+    summary = report()
+    assert summary['stages']['navigation'] == {'seconds': 1.0, 'urls': 4, 'p50': 0.2, 'p95': 0.4, 'p99': 0.4}
+    assert summary['stages']['wait']['urls'] == 1
+    assert (summary['pages'], summary['urls'], summary['counters']) == (1, 4, {'bytes_read': 2048})
+    assert summary['slowest_urls'][0] == {'url': 'https://www.doctolib.fr/p0', 'navigation': 0.1, 'wait': 1.5}
+    assert summary['bound_by'] == 'browser rendering'
+    assert summary['waiting_share'] == 0.6
+    assert summary['cache'] == {'hits': 1}
+
+
+def test_prometheus_exposition_format():
+    summary = report()
+    summary['wall_seconds'] = 12.5
+    lines = prometheus_text(summary, prefix='test').splitlines()
+    assert lines[:7] == [
+        '# HELP test_stage_seconds Time spent per URL in each stage of the run.',
+        '# TYPE test_stage_seconds summary',
+        'test_stage_seconds{stage="throttle",quantile="0.5"} 0.0',
+        'test_stage_seconds{stage="throttle",quantile="0.95"} 0.0',
+        'test_stage_seconds{stage="throttle",quantile="0.99"} 0.0',
+        'test_stage_seconds_sum{stage="throttle"} 0.0',
+        'test_stage_seconds_count{stage="throttle"} 0',
+    ]
+    assert 'test_stage_seconds{stage="navigation",quantile="0.95"} 0.4' in lines
+    assert 'test_stage_seconds_count{stage="navigation"} 4' in lines
+    assert lines[2 + 5 * len(STAGES):] == [
+        '# TYPE test_pages_total counter', 'test_pages_total 1',
+        '# TYPE test_bytes_read_total counter', 'test_bytes_read_total 2048',
+        '# TYPE test_run_wall_seconds gauge', 'test_run_wall_seconds 12.5',
+    ]
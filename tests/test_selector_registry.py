@@ -0,0 +1,45 @@
+import PageParser
+from FixtureServer import listing_html
+from SelectorRegistry import LISTING, PROFILE, SelectorRegistry
+
+LISTING_URL = 'https://www.doctolib.fr/psychologue/lille?page='
+
+
+def miss(registry, kind, html, url=None):
+    tree = PageParser.parse_html(html)
+    registry.record(kind, None, url, registry.has_content(tree), PageParser.last_page_of(tree))
+
+
+def test_pages_with_content_matching_no_layout_drift():
+    registry = SelectorRegistry(drift_pages=2)
+    miss(registry, PROFILE, '<html><body><div id="root"><main>Nouvelle page</main></div></body></html>')
+    assert not registry.drifted(PROFILE)
+    miss(registry, PROFILE, '<html><body><div id="root"><main>Nouvelle page</main></div></body></html>')
+    assert registry.drifted(PROFILE)
+    assert not registry.drifted(LISTING)
+
+
+def test_blank_pages_do_not_drift():
+    registry = SelectorRegistry(drift_pages=2)
+    for _ in range(3):
+        miss(registry, PROFILE, '<html><head></head><body><script>render()</script></body></html>')
+    assert not registry.drifted(PROFILE)
+    assert registry.counts()['unmatched'] == {PROFILE: 3}
+
+
+def test_listing_pages_past_the_last_page_do_not_drift():
+    registry = SelectorRegistry(drift_pages=2)
+    # The empty page past the end still shows the pagination of the listing
+    for page in (11, 12, 12):
+        miss(registry, LISTING, listing_html(0, page, last_page=10), LISTING_URL + str(page))
+    assert not registry.drifted(LISTING)
+
+    # Without a pagination, the last page announced by an earlier page of the listing applies
+    registry.note_last_page(LISTING_URL + '1', 10)
+    for page in (11, 12):
+        miss(registry, LISTING, '<html><body><main>Aucun résultat</main></body></html>', LISTING_URL + str(page))
+    assert not registry.drifted(LISTING)
+
+    for page in (4, 5):
+        miss(registry, LISTING, listing_html(0, page, last_page=10), LISTING_URL + str(page))
+    assert registry.drifted(LISTING)
@@ -0,0 +1,40 @@
+import time
+
+import ShardedCrawl
+from ShardedCrawl import LISTING, run_worker
+from WorkQueue import SQLiteWorkQueue
+
+
+class IdleBackend:
+    def quit(self):
+        pass
+
+
+def serve(tmp_path, monkeypatch, **kwargs):
+    monkeypatch.setattr(ShardedCrawl, 'make_backend', lambda *args: IdleBackend())
+    monkeypatch.setattr(ShardedCrawl, 'POLL_INTERVAL', 0.05)
+    started = time.monotonic()
+    run_worker(str(tmp_path / 'crawl.xlsx'), queue_url=str(tmp_path / 'crawl.queue.db'), worker_id='w', **kwargs)
+    return time.monotonic() - started
+
+
+def test_worker_stops_when_the_queue_is_complete(tmp_path, monkeypatch):
+    queue = SQLiteWorkQueue(str(tmp_path / 'crawl.queue.db'))
+    queue.beat()
+    queue.mark_complete()
+    assert serve(tmp_path, monkeypatch) < 5
+
+
+def test_worker_stops_without_a_coordinator(tmp_path, monkeypatch, capsys):
+    # Never beaten: the coordinator died before seeding the queue
+    assert serve(tmp_path, monkeypatch, coordinator_timeout=0.2) < 5
+    assert 'No heartbeat from the coordinator' in capsys.readouterr().out
+
+
+def test_worker_stops_when_the_coordinator_stops_beating(tmp_path, monkeypatch, capsys):
+    queue = SQLiteWorkQueue(str(tmp_path / 'crawl.queue.db'))
+    queue.put(LISTING, [('https://www.doctolib.fr/psychologue/lille?page=1', {})])
+    queue.lease('other', 1, 60)
+    queue.beat()
+    assert 0.2 <= serve(tmp_path, monkeypatch, coordinator_timeout=0.2) < 5
+    assert 'No heartbeat from the coordinator' in capsys.readouterr().out
@@ -0,0 +1,128 @@
+import pytest
+
+from RateLimiter import SharedRateLimiter
+from RetryEngine import GaveUp
+from WorkQueue import COLLECTED, DEAD, DONE, LEASED, PENDING, RedisWorkQueue, SQLiteWorkQueue, WorkQueue
+
+
+def redis_client():
+    try:
+        import fakeredis
+        client = fakeredis.FakeRedis(decode_responses=True)
+        client.eval('return 1', 0)
+        return client
+    except Exception:
+        # Without fakeredis, or without its Lua support
+        from redis_standin import InMemoryRedis
+        return InMemoryRedis()
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def queue(request, tmp_path):
+    if request.param == 'sqlite':
+        queue = SQLiteWorkQueue(str(tmp_path / 'crawl.queue.db'))
+    else:
+        queue = RedisWorkQueue(None, prefix='doctolib:queue:test', client=redis_client())
+    yield queue
+    queue.close()
+
+
+def test_work_queue_is_abstract():
+    with pytest.raises(TypeError):
+        WorkQueue()
+
+
+def test_put_lease_ack_and_collect(queue):
+    queue.put('profile', [('https://a', {'fields': ['fees']}), ('https://b', {'fields': ['address']})])
+    queue.put('listing', [('https://list?page=1', {'page': 1})], priority=1)
+    # Items still queued are not queued twice
+    queue.put('profile', [('https://a', {'fields': ['fees']})])
+    assert queue.counts() == {PENDING: 3}
+
+    first, second = queue.lease('worker-1', count=2)
+    assert (first.kind, first.key, first.payload, first.attempts) == ('listing', 'https://list?page=1', {'page': 1}, 1)
+    assert (second.key, second.payload) == ('https://a', {'fields': ['fees']})
+    assert queue.counts() == {PENDING: 1, LEASED: 2}
+
+    assert queue.ack(first, {'links': ['https://a'], 'names': ['A'], 'last_page': 1})
+    assert queue.outstanding() == 3
+    result, = queue.collect()
+    assert (result.kind, result.status, result.result['last_page']) == ('listing', DONE, 1)
+    assert queue.outstanding() == 2
+
+
+def test_collect_takes_finished_items_once(queue):
+    queue.put('profile', [('https://a', {'fields': ['fees']}), ('https://b', {'fields': ['fees']})])
+    first, second = queue.lease('worker-1', count=2)
+    queue.ack(second, {'data': {}})
+    queue.ack(first, {'data': {'fees': {'types': ['Consultation'], 'fees': ['50 €']}}})
+
+    results = sorted(queue.collect(), key=lambda result: result.key)
+    assert [(result.key, result.status, result.attempts) for result in results] == [
+        ('https://a', DONE, 1), ('https://b', DONE, 1)]
+    assert results[0].result == {'data': {'fees': {'types': ['Consultation'], 'fees': ['50 €']}}}
+    assert results[0].payload == {'fields': ['fees']}
+    assert queue.collect() == []
+    assert queue.counts() == {COLLECTED: 2}
+    assert queue.outstanding() == 0
+    # A finished item cannot be acked again, a collected one can be queued again
+    assert not queue.ack(first, {'data': {}})
+    queue.put('profile', [('https://a', {'fields': ['address']})])
+    item, = queue.lease('worker-2')
+    assert (item.key, item.payload, item.attempts) == ('https://a', {'fields': ['address']}, 1)
+
+
+def test_expired_lease_goes_to_another_worker_then_dies(queue):
+    queue.put('profile', [('https://a', {'fields': ['fees']})])
+    item, = queue.lease('worker-1', lease_seconds=-1)
+    # The lease of worker-1 expired: worker-2 gets the item, as its second attempt
+    again, = queue.lease('worker-2', lease_seconds=-1)
+    assert (again.id, again.attempts) == (item.id, 2)
+    assert queue.lease('worker-3') == []
+
+    dead, = queue.collect()
+    assert (dead.key, dead.status, dead.attempts) == ('https://a', DEAD, 2)
+    assert dead.error['message'] == 'lease expired'
+    # Its first worker finishing late does not bring it back
+    assert not queue.ack(item, {'data': {}})
+
+
+def test_failed_item_is_retried_then_dead(queue):
+    queue.put('profile', [('https://a', {'fields': ['fees']})])
+    item, = queue.lease('worker-1')
+    queue.fail(item, RuntimeError('session lost'))
+    assert queue.counts() == {PENDING: 1}
+    assert queue.collect() == []
+
+    item, = queue.lease('worker-2')
+    queue.fail(item, GaveUp('timeout', 3, 'page did not load'))
+    assert queue.counts() == {DEAD: 1}
+    dead, = queue.collect()
+    assert (dead.status, dead.attempts, dead.result) == (DEAD, 2, None)
+    assert dead.error == {'kind': 'timeout', 'message': 'timeout after 3 attempt(s): page did not load'}
+
+
+def test_complete(queue):
+    assert not queue.complete()
+    queue.mark_complete()
+    assert queue.complete()
+    queue.mark_complete(False)
+    assert not queue.complete()
+
+
+def test_coordinator_heartbeat(queue):
+    assert queue.coordinator_age() is None
+    queue.beat()
+    assert 0 <= queue.coordinator_age() < 5
+
+
+def test_workers_share_the_rate_limit_of_the_queue(queue):
+    url = 'https://www.doctolib.fr/psychologue/lille?page=1'
+    first, second = SharedRateLimiter(queue, 0.2), SharedRateLimiter(queue, 0.2)
+    assert first.wait(url) == 0.0
+    # Another worker waits for the token the first one took
+    assert 0.1 < second.wait(url) <= 0.2
+    assert first.wait('https://other.example/') == 0.0
+
+    second.backoff(url, 0.5)
+    assert 0.4 < first.wait(url) <= 0.5